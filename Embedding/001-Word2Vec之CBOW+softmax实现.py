@@ -13,6 +13,8 @@ from collections import Counter
 from sklearn.model_selection import train_test_split
 import sklearn
 import numpy as np
+from word2vec_pairs import word_counts, subsample_keep_prob, cbow_batches
+from embedding_store import save_embeddings, EmbeddingStore
 
 # 加载数据
 trainset = sklearn.datasets.load_files(container_path='data', encoding='UTF-8')
@@ -28,7 +30,7 @@ _words = set(words)  # 将词进行去重  构建词表
 word2idx = {c: i for i, c in enumerate(_words)}
 idx2word = {i: c for i, c in enumerate(_words)}
 vocab_size = len(idx2word)   # 词表的大小
-indexed = [word2idx[w] for w in words]  # 将语料中所有词转为对应的id
+indexed = np.array([word2idx[w] for w in words], dtype=np.int32)  # 将语料中所有词转为对应的id
 print("词表的大小(也就是语料去重后单词数):", vocab_size)
 
 
@@ -80,6 +82,7 @@ batch_size = 128
 embedded_size = 128
 window_size = 3
 epoch = 10
+subsample = 1e-4   # 高频词下采样的阈值  None表示不下采样
 valid_size = 10   # 随机选取十个词，等会找这十个词最相似的词
 nearest_neighbors = 8    # 找上面词最相似的八个词
 
@@ -90,33 +93,17 @@ model = CBOW(batch_size, vocab_size, embedded_size)
 sess.run(tf.global_variables_initializer())
 
 
-def get_x(words, idx):
-    left = idx - window_size
-    right = idx + window_size
-    return words[left: idx] + words[idx+1: right+1]
-
-
-def make_xy(int_words):
-    # int_words:是将语料转化为对应数字的列表
-    x, y = [], []
-    for i in range(window_size, len(int_words)-window_size):
-        inputs = get_x(int_words, i)    # 给定一个窗口，然后构造两组数据[[上文词, 目标词], [下文词, 目标词]]
-        x.append(inputs)   # 构造的输入
-        y.append(int_words[i])   # 对应的输出
-    return np.array(x), np.array(y)
-
-
-X, Y = make_xy(indexed)
+# 高频词(如the, of)每个epoch按概率丢掉一部分  样本按块生成, 不再一次性构造整份语料的X, Y
+keep_prob = subsample_keep_prob(word_counts(indexed, vocab_size), subsample) if subsample else None
 
 
 for i in range(epoch):
-    total_cost = 0
-    for k in range(0, (X.shape[0] // batch_size) * batch_size, batch_size):
-        batch_x = X[k: k+batch_size]
-        batch_y = Y[k: k+batch_size, np.newaxis]
+    total_cost, num_batches = 0, 0
+    for batch_x, batch_y in cbow_batches(indexed, batch_size, window_size=window_size, keep_prob=keep_prob):
         cost, _ = sess.run([model.cost, model.optimizer], feed_dict={model.X: batch_x, model.Y: batch_y})
         total_cost += cost   # 累加损失
-    total_cost /= (X.shape[0] // batch_size)   # 平均每批的损失
+        num_batches += 1
+    total_cost /= max(num_batches, 1)   # 平均每批的损失
     print('epoch %d, avg loss %f' % (i+1, total_cost))
 
 
@@ -134,3 +121,11 @@ for i in range(epoch):
             log_str = '%s %s,' % (log_str, close_word)
         print(log_str)
 
+
+# 保存词向量并建近似最近邻索引  之后查相似词/类比不用再和整个词表做矩阵乘法
+save_path = save_embeddings('cbow_embeddings', sess.run(model.embedding), [idx2word[i] for i in range(vocab_size)])
+store = EmbeddingStore.load(save_path)
+store.build_index(save_path, n_subvectors=16)
+valid_words = [idx2word[i] for i in np.random.choice(indexed, valid_size)]
+for valid_word, nearest in zip(valid_words, store.most_similar(valid_words, topn=nearest_neighbors)):
+    print('Nearest to %s: %s' % (valid_word, ', '.join(word for word, _ in nearest)))
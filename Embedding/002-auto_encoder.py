@@ -13,6 +13,10 @@ import re
 import tensorflow as tf
 import numpy as np
 import collections
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.encoding import str_idx
 
 # 思路: 自编码器这是一种无监督的方式训练句向量
 # 1. 将句子塞进多层的LSTM网络中，最后加一个全连接层 权重的格式[输出的维度, 要把它压缩成多长(就是咱们要得到的句向量)]
@@ -63,17 +67,6 @@ def build_dataset(words, n_words):
     return data, count, dictionary, reversed_dictionary
 
 
-def str_idx(corpus, dic, maxlen, UNK=3):
-    # 来一批数据 我们将其转成等长用id表示的文本
-    X = np.zeros((len(corpus), maxlen))
-    for i in range(len(corpus)):
-        for no, k in enumerate(corpus[i].split()[:maxlen][::-1]):
-            try:
-                X[i, -1 - no] = dic[k]
-            except Exception as e:
-                X[i, -1 - no] = UNK
-    return X
-
 # 加载数据
 dataset = sklearn.datasets.load_files(container_path = 'data', encoding = 'UTF-8')
 # 进行数据的切分  分的是特征和标签
@@ -186,5 +179,3 @@ logits_test = sess.run(tf.nn.sigmoid(model.logits), feed_dict={model.X: X})
 print(logits_test.shape)   # 将测试集塞进去 编码最后的输出 (数据, dimension_size)
 
 print(logits_test)   # 输出对应的句子向量
-
-
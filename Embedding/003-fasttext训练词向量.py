@@ -9,13 +9,21 @@
 """
 import numpy as np
 np.random.seed(1335)  # for reproducibility
-from keras.preprocessing import sequence
 from keras.models import Sequential
 from keras.layers import Dense
 from keras.layers import Embedding
 from keras.layers import GlobalAveragePooling1D
 from keras.utils import np_utils
 import random
+import os
+import sys
+from ngram_hashing import to_csr, add_hashed_ngrams, ngram_buckets
+from embedding_store import save_embeddings
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.encoding import pad
+
+ngram_range = 2   # 最大的n  可以到3或4, 嵌入表大小不变
+n_buckets = 100000   # n-gram哈希桶的个数
 
 
 def load_data(path, sent):
@@ -31,60 +39,19 @@ def load_data(path, sent):
     return text, label
 
 
-def create_ngram_set(input_list, ngram_value=2):
-    # create_ngram_set([1, 4, 9, 4, 1, 4], ngram_value=3)
-    # 输出:[(1, 4, 9), (4, 9, 4), (9, 4, 1), (4, 1, 4)]
-    result = []
-    for i in range(len(input_list) - ngram_value + 1):
-        temp = tuple(input_list[i: i + ngram_value])
-        result.append(temp)
-    # print(set(result))
-    return set(result)
-
-
-def add_ngram(sequences, token_indice, ngram_range=2):
-    # 若: sequences = [[1, 3, 4, 5], [1, 3, 7, 9, 2]]
-    # 若: token_indice = {(1, 3): 1337, (9, 2): 42, (4, 5): 2017}
-    # 调用此函数: add_ngram(sequences, token_indice, ngram_range=2)
-    # 最后的输出: [[1, 3, 4, 5, 1337, 2017], [1, 3, 7, 9, 2, 1337, 42]]
-    new_sequences = []
-    for input_list in sequences:
-        new_list = input_list[:]
-        for ngram_value in range(2, ngram_range+1):
-            for i in range(len(new_list) - ngram_value + 1):
-                ngram = tuple(new_list[i: i + ngram_value])
-                if ngram in token_indice:
-                    new_list.append(token_indice[ngram])
-        new_sequences.append(new_list)
-    return new_sequences
-
-
 def extend_data(char_dic, data, labels):
     max_features = len(char_dic)
     # 将每句话转为id序列
     sentence2id = [[char_dic.get(word) for word in sen] for sen in data]
-    ngram_range = 2
-
-    if ngram_range > 1:
-        ngram_set = set()
-        for input_list in sentence2id:
-            for i in range(2, ngram_range+1):
-                set_of_ngram = create_ngram_set(input_list, ngram_value=i)
-                ngram_set.update(set_of_ngram)
-        # 这里是将咱们上面做的那n-gram对应一个数字。  这里直接从max_features  因为前面的数字词已经用了
-        start_index = max_features + 1
-        token_indice = {v: k + start_index for k, v in enumerate(ngram_set)}  # N-gram => 数字
-        # indice_token = {token_indice[k]: k for k in token_indice}  # 数字 => N-gram
 
-    fea_dict = {**token_indice, **char_dic}  # 将两个字典合并
+    # 每句话后面接上它的n-gram  n-gram哈希到n_buckets个桶, 特征id从max_features开始
+    offsets, ids = add_hashed_ngrams(*to_csr(sentence2id), max_features, ngram_range, n_buckets)
 
-    sentence2id = add_ngram(sentence2id, fea_dict, ngram_range)
-
-    # 将数据进行pad  同意将其pad成300
-    X = sequence.pad_sequences(sentence2id, maxlen=300)
+    # 将数据进行pad  同意将其pad成300 (和keras的pad_sequences一样, 超长时保留后面的)
+    X = pad(offsets, ids, maxlen=300, truncating='pre')
     labels = np_utils.to_categorical(labels)
 
-    return X, labels, fea_dict
+    return X, labels, max_features + n_buckets
 
 
 def build_model(fea_len, data, labels, char_dic):
@@ -113,10 +80,14 @@ def build_model(fea_len, data, labels, char_dic):
         return wordtuple
 
     mather = word2fea("妈妈", char_dic)
-    index = fea_dict.get(mather)
+    index = ngram_buckets(mather, len(char_dic), n_buckets)
     mama = emb_wight[index]   # 获得那一层的词向量
     print(mama)
 
+    # 保存每个字的向量 (前len(char_dic)行, 后面是n-gram的哈希桶)  之后用 EmbeddingStore.load 加载查询
+    id2char = {i: c for c, i in char_dic.items()}
+    save_embeddings('fasttext_char_embeddings', emb_wight[:len(char_dic)], [id2char[i] for i in range(len(char_dic))])
+
 
 if __name__ == '__main__':
     neg = './data/neg.csv'
@@ -150,9 +121,7 @@ if __name__ == '__main__':
     char_dic['unk'] = 0   # 0表示不知
 
     # 数据增广
-    data, labels, fea_dict = extend_data(char_dic, data, labels)
-
-    fea_len = len(fea_dict)
+    data, labels, fea_len = extend_data(char_dic, data, labels)
 
     # 定义模型
     build_model(fea_len, data, labels, char_dic)
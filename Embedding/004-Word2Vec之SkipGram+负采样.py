@@ -10,6 +10,8 @@
 import tensorflow as tf
 import matplotlib.pyplot as plt
 import numpy as np
+from word2vec_pairs import word_counts, skipgram_batches
+from embedding_store import save_embeddings
 
 tf.reset_default_graph()
 
@@ -30,28 +32,19 @@ word_dict = {w: i for i, w in enumerate(word_list)}
 batch_size = 20
 embedding_size = 2   # 嵌入到二维  为了可视化
 num_sampled = 10   # for negative sampling, less than batch_size
+window_size = 2    # 最大窗口  每个中心词实际的窗口在1..window_size之间随机
 voc_size = len(word_list)
 
+# 整份语料转为id数组  (目标词, 上下文)对在训练时按块生成, 不再提前放进list
+corpus = np.array([word_dict[w] for w in word_sequence], dtype=np.int32)
+counts = word_counts(corpus, voc_size)
 
-def random_batch(data, size):
-    random_inputs = []
-    random_labels = []
-    random_index = np.random.choice(range(len(data)), size, replace=False)
 
-    for i in random_index:
-        random_inputs.append(data[i][0])  # target
-        random_labels.append([data[i][1]])  # context word
-
-    return random_inputs, random_labels
-
-# skip gram 构造 目标词 到 标签的映射关系  这里的窗口设置为1  只取上下文各一个词
-skip_grams = []
-for i in range(1, len(word_sequence) - 1):
-    target = word_dict[word_sequence[i]]
-    context = [word_dict[word_sequence[i - 1]], word_dict[word_sequence[i + 1]]]
-
-    for w in context:
-        skip_grams.append([target, w])
+def random_batch():
+    # 一个epoch结束后接着生成下一个epoch
+    while True:
+        for batch in skipgram_batches(corpus, batch_size, window_size=window_size):
+            yield batch
 
 
 # 定义输入
@@ -66,7 +59,12 @@ nce_biases = tf.Variable(tf.zeros([voc_size]))
 
 
 # 定义损失  以及优化器
-cost = tf.reduce_mean(tf.nn.nce_loss(nce_weights, nce_biases, labels, selected_embed, num_sampled, voc_size))
+# 负样本按 词频^0.75 采样
+sampled_values = tf.nn.fixed_unigram_candidate_sampler(tf.cast(labels, tf.int64), num_true=1, num_sampled=num_sampled,
+                                                       unique=True, range_max=voc_size, distortion=0.75,
+                                                       unigrams=counts.tolist())
+cost = tf.reduce_mean(tf.nn.nce_loss(nce_weights, nce_biases, labels, selected_embed, num_sampled, voc_size,
+                                     sampled_values=sampled_values))
 optimizer = tf.train.AdamOptimizer(0.001).minimize(cost)
 
 
@@ -75,8 +73,9 @@ with tf.Session() as sess:
     init = tf.global_variables_initializer()
     sess.run(init)
 
+    batches = random_batch()
     for epoch in range(5000):
-        batch_inputs, batch_labels = random_batch(skip_grams, batch_size)   # 获取批量数据
+        batch_inputs, batch_labels = next(batches)   # 获取批量数据
         _, loss = sess.run([optimizer, cost], feed_dict={inputs: batch_inputs, labels: batch_labels})
 
         if (epoch + 1) % 1000 == 0:
@@ -84,6 +83,9 @@ with tf.Session() as sess:
 
     trained_embeddings = embeddings.eval()
 
+# 保存词向量  之后用 EmbeddingStore.load 加载查询
+save_embeddings('skipgram_embeddings', trained_embeddings, word_list)
+
 
 for i, label in enumerate(word_list):
     x, y = trained_embeddings[i]
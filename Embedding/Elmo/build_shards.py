@@ -0,0 +1,37 @@
+"""
+
+@file   : build_shards.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+把语料一次性转换成二进制分片, 之后用 LMDataGenerator(..., shards=前缀) 直接从分片中取batch
+    python build_shards.py wikitext-2/wiki.train.tokens wikitext-2/wiki.valid.tokens --vocab wikitext-2/wiki.vocab
+
+"""
+import os
+import argparse
+
+from data import DATA_SET_DIR
+from elmo.lm_shards import write_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert ELMo corpora into word-id / char-id shards')
+    parser.add_argument('corpus', nargs='+', help='corpus files, relative to data/datasets')
+    parser.add_argument('--vocab', default='wikitext-2/wiki.vocab', help='vocabulary file, relative to data/datasets')
+    parser.add_argument('--token_maxlen', type=int, default=50, help='max size of token in characters')
+    parser.add_argument('--no_chars', action='store_true', help='only write word-id shards')
+    args = parser.parse_args()
+
+    vocab = os.path.join(DATA_SET_DIR, args.vocab)
+    for corpus in args.corpus:
+        meta = write_shards(os.path.join(DATA_SET_DIR, corpus), vocab,
+                            token_maxlen=args.token_maxlen, chars=not args.no_chars)
+        print('{}: {} sentences, {} tokens, words as {}'.format(corpus, meta['n_sentences'], meta['n_tokens'],
+                                                                meta['word_dtype']))
+
+
+if __name__ == '__main__':
+    main()
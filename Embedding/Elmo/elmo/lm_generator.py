@@ -7,16 +7,50 @@
 @time1  : 2019-05-27
 
 """
+import os
+import mmap
+
 import numpy as np
 import keras
 
+from .lm_shards import load_vocab, load_shards, load_shards_meta, convert_token_to_char_ids
+
+
+def build_line_index(corpus):
+    """
+    建立语料的行偏移索引  offsets[i]~offsets[i+1]就是第i行在文件中的字节区间
+    索引只建一次, 存在语料旁边(corpus + '.idx.npy'), 语料没有改动时直接复用
+    :param corpus: filename of corpus 语料的路径
+    :return: int64 array of line boundaries, len = line number + 1
+    """
+    index_file = corpus + '.idx.npy'
+    if os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(corpus):
+        return np.load(index_file, mmap_mode='r')
+
+    size = os.path.getsize(corpus)
+    if size == 0:
+        offsets = np.zeros((1,), dtype=np.int64)
+    else:
+        # 直接在内存映射上找换行符  不需要把整个文件解码成字符串
+        buffer = np.memmap(corpus, dtype=np.uint8, mode='r')
+        newlines = np.flatnonzero(buffer == ord('\n')).astype(np.int64)
+        offsets = np.concatenate([[0], newlines + 1])
+        if buffer[-1] != ord('\n'):
+            # 最后一行没有换行符
+            offsets = np.append(offsets, size)
+        del buffer
+    np.save(index_file, offsets)
+    return offsets
+
+
 class LMDataGenerator(keras.utils.Sequence):
     # 对数据的处理
     def __len__(self):
         # 看一下能做多少批次  所有数据量除以一批次的数据量
         return int(np.ceil(len(self.indices) / self.batch_size))
 
-    def __init__(self, corpus, vocab, sentence_maxlen=100, token_maxlen=50, batch_size=32, shuffle=True, token_encoding='word'):
+    def __init__(self, corpus, vocab, sentence_maxlen=100, token_maxlen=50, batch_size=32, shuffle=True, token_encoding='word',
+                 shards=None, bucketing=False):
         """Compiles a Language Model RNN based on the given parameters
         :param corpus: filename of corpus 语料的路径
         :param vocab: filename of vocabulary   语料对应的词表路径
@@ -25,130 +59,171 @@ class LMDataGenerator(keras.utils.Sequence):
         :param batch_size: number of steps at each batch   # 搞多少批次
         :param shuffle: True if shuffle at the end of each epoch   # 打乱
         :param token_encoding: Encoding of token, either 'word' index or 'char' indices  # 字符级别还是词级别
+        :param shards: prefix of binary shards written by build_shards.py  # 给了就直接从分片中取数据, 不再分词
+        :param bucketing: True to batch sentences of similar length  # 长度相近的句子放一个批次, 每批只补齐到本批最长
         :return: Nothing
         """
 
         self.corpus = corpus
-        # # 打开词表读取单词  .[0]是词    .[1]指的是词的标号
-        self.vocab = {line.split()[0]: int(line.split()[1]) for line in open(vocab, encoding='utf8').readlines()}
+        self.vocab = load_vocab(vocab)
         self.sent_ids = corpus
         self.batch_size = batch_size
         self.shuffle = shuffle
         self.sentence_maxlen = sentence_maxlen
         self.token_maxlen = token_maxlen
         self.token_encoding = token_encoding
-        # 打开语料
-        with open(self.corpus, encoding='utf8') as fp:
-            self.indices = np.arange(len(fp.readlines()))
-            newlines = [index for index in range(0, len(self.indices), 2)]
-            self.indices = np.delete(self.indices, newlines)  # 只取了部分数据
+        self.shards = shards
+        self.bucketing = bucketing
+        self._corpus_buffer = None
+        self._shards = None
+        if self.shards:
+            # 分片里每一句对应语料中的一行
+            meta = load_shards_meta(self.shards)
+            if meta['vocab_size'] != max(self.vocab.values()) + 1:
+                raise ValueError('Shards {} were built with a different vocabulary'.format(self.shards))
+            if token_encoding == 'char' and (not meta['chars'] or meta['token_maxlen'] != token_maxlen):
+                raise ValueError('Shards {} have no char ids for token_maxlen={}'.format(self.shards, token_maxlen))
+            n_sentences = meta['n_sentences']
+            # 只在需要分片里没有的字符id时才建 (见gather_tokens)
+            self.line_offsets = None
+        else:
+            # 语料的行偏移索引  之后按行号随机读取 不再每次从头扫描文件
+            self.line_offsets = build_line_index(self.corpus)
+            n_sentences = len(self.line_offsets) - 1
+        self.indices = np.arange(n_sentences)
+        newlines = [index for index in range(0, len(self.indices), 2)]
+        self.indices = np.delete(self.indices, newlines)  # 只取了部分数据
+
+        self.batches = None
+        if self.bucketing:
+            # 每句话的单词数(截断后)  用来分桶
+            if self.shards:
+                lengths = np.diff(load_shards(self.shards)[1])
+            else:
+                with open(self.corpus, encoding='utf8') as fp:
+                    lengths = np.fromiter((len(line.split()) for line in fp), dtype=np.int64)
+            self.lengths = np.minimum(lengths, self.sentence_maxlen - 2)
+        self.on_epoch_end()
+
+    def __getstate__(self):
+        # mmap对象不能被pickle  多进程的worker里各自重新映射(同一个文件 共享系统的页缓存)
+        state = self.__dict__.copy()
+        state['_corpus_buffer'] = None
+        state['_shards'] = None
+        return state
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.indices)
+        if self.bucketing:
+            # 先打乱再稳定排序 长度相同的句子顺序是随机的; 切成批次后再打乱批次的顺序
+            order = self.indices[np.argsort(self.lengths[self.indices], kind='stable')]
+            self.batches = [order[i: i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+            if self.shuffle:
+                np.random.shuffle(self.batches)
+
+    def read_line(self, sent_id: int):
+        # 通过偏移索引 从内存映射的语料中直接取出第sent_id行
+        if self.line_offsets is None:
+            self.line_offsets = build_line_index(self.corpus)
+        if self._corpus_buffer is None:
+            with open(self.corpus, 'rb') as fp:
+                self._corpus_buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        start, end = int(self.line_offsets[sent_id]), int(self.line_offsets[sent_id + 1])
+        return self._corpus_buffer[start:end].decode('utf8')
+
+    def gather_tokens(self, batch_ids, with_chars=None):
+        """
+        取出一批句子的单词id和字符id (不含<bos>/<eos>, 已按sentence_maxlen截断), 所有句子首尾相接
+        :param with_chars: 是否取字符id  None表示 token_encoding == 'char'
+        :return: lengths [batch], word_ids [sum(lengths)], char_ids [sum(lengths), token_maxlen] or None
+        """
+        if with_chars is None:
+            with_chars = self.token_encoding == 'char'
+        if self.shards and self._shards is None:
+            self._shards = load_shards(self.shards)
+        # 分片里没有需要的字符id时 (只写了单词id, 或token_maxlen不同) 从语料原文取
+        if self.shards and not (with_chars and (self._shards[3] is None or
+                                                self._shards[0]['token_maxlen'] != self.token_maxlen)):
+            _, offsets, words, chars = self._shards
+            starts = offsets[batch_ids]
+            lengths = np.minimum(offsets[batch_ids + 1] - starts, self.sentence_maxlen - 2)
+            # 每个单词在分片中的位置  直接在内存映射上做花式索引
+            positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            return lengths, words[positions].astype(np.int32), chars[positions] if with_chars else None
+
+        lengths, word_ids, char_ids = [], [], []
+        unk_id = self.vocab['<unk>']
+        for sent_id in batch_ids:
+            tokens = self.read_line(sent_id).split()[:self.sentence_maxlen - 2]
+            lengths.append(len(tokens))
+            # 将单词转为小写 看其是否在我们的词表中  否则就是<unk>
+            word_ids.extend(self.vocab.get(token.lower(), unk_id) for token in tokens)
+            if with_chars:
+                char_ids.extend(convert_token_to_char_ids(token, self.token_maxlen) for token in tokens)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        word_ids = np.asarray(word_ids, dtype=np.int32)
+        if with_chars:
+            char_ids = np.asarray(char_ids, dtype=np.int32).reshape((-1, self.token_maxlen))
+        return lengths, word_ids, char_ids if with_chars else None
+
+    @staticmethod
+    def scatter_positions(lengths):
+        # 每个单词在批次中的 (行, 列)  第0列是<bos>; 以及每句<eos>的 (行, 列)  有单词的句子才在其后加结束标志
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        cols = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + 1
+        eos_rows = np.flatnonzero(lengths)
+        return rows, cols, eos_rows, lengths[eos_rows] + 1
+
+    def assemble_words(self, lengths, word_ids, maxlen):
+        """
+        单词id的输入, 以及前向LSTM要预测的下一个词、后向LSTM要预测的上一个词
+        :return: word_indices [batch, maxlen], next_ids [batch, maxlen, 1], previous_ids [batch, maxlen, 1]
+        """
+        rows, cols, eos_rows, eos_cols = self.scatter_positions(lengths)
+        # 左右各多留一列0  这样next/previous就是同一块内存上错开一位的视图, 整个批次只分配一次
+        buffer = np.zeros((len(lengths), maxlen + 2), dtype=np.int32)
+        buffer[:, 1] = self.vocab['<bos>']
+        buffer[rows, cols + 1] = word_ids
+        buffer[eos_rows, eos_cols + 1] = self.vocab['<eos>']
+        return buffer[:, 1:maxlen + 1], buffer[:, 2:maxlen + 2, np.newaxis], buffer[:, :maxlen, np.newaxis]
+
+    def assemble_chars(self, lengths, char_ids, maxlen):
+        # 字符id的输入 [batch, maxlen, token_maxlen]  补齐的单词全是0
+        rows, cols, eos_rows, eos_cols = self.scatter_positions(lengths)
+        word_char_indices_batch = np.zeros((len(lengths), maxlen, self.token_maxlen), dtype=np.int32)
+        word_char_indices_batch[:, 0] = convert_token_to_char_ids('<bos>', self.token_maxlen)
+        word_char_indices_batch[rows, cols] = char_ids
+        word_char_indices_batch[eos_rows, eos_cols] = convert_token_to_char_ids('<eos>', self.token_maxlen)
+        return word_char_indices_batch
+
+    def assemble_batch(self, batch_ids, maxlen):
+        lengths, word_ids, char_ids = self.gather_tokens(batch_ids)
+        word_indices_batch, next_ids, previous_ids = self.assemble_words(lengths, word_ids, maxlen)
+        if self.token_encoding == 'char':
+            return self.assemble_chars(lengths, char_ids, maxlen), next_ids, previous_ids
+        return word_indices_batch, next_ids, previous_ids
 
     def __getitem__(self, index):
         """Generate one batch of data"""
-        # Generate indexes of the batch
-        batch_indices = self.indices[index*self.batch_size: (index + 1) * self.batch_size]
-
-        # 读样本序列   也就是一条是一个句子  读取len(batch_indices)条
-        word_indices_batch = np.zeros((len(batch_indices), self.sentence_maxlen), dtype=np.int32)
-        if self.token_encoding == 'char':
-
-            word_char_indices_batch = np.full((len(batch_indices), self.sentence_maxlen, self.token_maxlen), 260, dtype=np.int32)
-
-        for i, batch_id in enumerate(batch_indices):
-            # Read sentence (sample)
-            word_indices_batch[i] = self.get_token_indices(sent_id=batch_id)
-
+        if self.bucketing:
+            # 分桶后每一批只补齐到本批中最长的句子
+            batch_indices = self.batches[index]
+            maxlen = int(self.lengths[batch_indices].max()) + 2
+        else:
+            # Generate indexes of the batch
+            batch_indices = self.indices[index*self.batch_size: (index + 1) * self.batch_size]
+            maxlen = self.sentence_maxlen
+
+        inputs, next_ids, previous_ids = self.assemble_batch(batch_indices, maxlen)
+        return [inputs, next_ids, previous_ids], []
 
     def get_token_indices(self, sent_id: int):
         # 将一句话中所有的单词转为对应的id
-        with open(self.corpus, encoding='utf8') as fp:
-            for i, line in enumerate(fp):
-                if i == sent_id:
-                    token_ids = np.zeros((self.sentence_maxlen,), dtype=np.int32)
-                    # Add begin of sentence index
-                    token_ids[0] = self.vocab['<bos>']
-                    # 遍历当前句子的每个单词
-                    for j, token in enumerate(line.split()[:self.sentence_maxlen - 2]):
-                        # 将单词转为小写 看其是否在我们的词表中
-                        if token.lower() in self.vocab:
-                            # 单词如果在词表中 将其id加入到token_ids中
-                            token_ids[j + 1] = self.vocab[token.lower()]
-                        else:
-                            # 否则  添加一个不知的字符串
-                            token_ids[j + 1] = self.vocab['<unk>']
-
-                        # Add end of sentence index
-                    if token_ids[1]:   # 这个判断是代表你当前是有单词加入的  那我们就在其后加结束标志
-                        token_ids[j + 2] = self.vocab['<eos>']
-                    return token_ids
-
+        lengths, word_ids, _ = self.gather_tokens(np.asarray([sent_id]), with_chars=False)
+        return self.assemble_words(lengths, word_ids, self.sentence_maxlen)[0][0]
 
     def get_token_char_indices(self, sent_id: int):
         # 将每个单词中的每个字符转为id序列
-        def convert_token_to_char_ids(token, token_maxlen):
-            bos_char = 256  # <begin sentence>   句子的开始
-            eos_char = 257  # <end sentence>    句子的结束
-            bow_char = 258  # <begin word>   单词的开始
-            eow_char = 259  # <end word>    单词的结束
-            pad_char = 260  # <pad char>  填充的标志
-
-            # 先初始化  每个单词的长度都是token_maxlen
-            char_indices = np.full([token_maxlen], pad_char, dtype=np.int32)
-
-            # Encode word to UTF-8 encoding  编码每个单词
-            word_encoded = token.encode('utf-8', 'ignore')[:(token_maxlen - 2)]
-            # Set characters encodings
-            # Add begin of word char index
-            char_indices[0] = bow_char    # 每个单词的开始 是开始的标志 bow_char
-            if token == '<bos>':   # 如果这个单词是句子的开始  则将其字符列表写成bos_char
-                char_indices[1] = bos_char
-                k = 1
-            elif token == '<eos>':  # 如果这个单词是句子的结束  则将其字符列表写成eos_char
-                char_indices[1] = eos_char
-                k = 1
-            else:
-                # Add word char indices
-                for k, chr_id in enumerate(word_encoded, start=1):
-                    char_indices[k] = chr_id + 1
-            # Add end of word char index
-            char_indices[k + 1] = eow_char
-
-            # 简单讨论一下这一步的输出
-            # 如果当前单词是<bos>说明是句子的开始 编码变为[bow_char对应的id, bos_char对应的id, eow_char对应的id, 其余都是填充的id]
-            # 如果当前单词不是开始和结束的标志  编码变为[bow_char对应的id, 单词中每个字符对应的id....., eow_char对应的id, 如果还有剩余的空则是填充的id]
-            # 如果当前单词是<eow>说明是句子的结束 编码变为[bow_char对应的id, eos_char对应的id, eow_char对应的id, 其余都是填充的id]
-
-            return char_indices
-
-        with open(self.corpus, encoding='utf8') as fp:   # 打开语料
-            for i, line in enumerate(fp):
-                if i == sent_id:
-                    # 当前的一句话
-                    token_ids = np.zeros((self.sentence_maxlen, self.token_maxlen), dtype=np.int32)
-                    # Add begin of sentence char indices  在这句话的开始加bos
-                    token_ids[0] = convert_token_to_char_ids('<bos>', self.token_maxlen)
-                    # Add tokens' char indices   将里面每个单词中的字母变为对应的id
-                    for j, token in enumerate(line.split()[:self.sentence_maxlen - 2]):
-                        token_ids[j + 1] = convert_token_to_char_ids(token, self.token_maxlen)
-                    # Add end of sentence char indices
-                    if token_ids[1]:   # 给这句话加结尾的标志
-                        token_ids[j + 2] = convert_token_to_char_ids('<eos>', self.token_maxlen)
-
-        return token_ids
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        lengths, _, char_ids = self.gather_tokens(np.asarray([sent_id]), with_chars=True)
+        return self.assemble_chars(lengths, char_ids, self.sentence_maxlen)[0]
@@ -0,0 +1,152 @@
+"""
+
+@file   : lm_shards.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+"""
+import os
+import json
+
+import numpy as np
+
+# 字符级别的特殊标志
+BOS_CHAR = 256  # <begin sentence>   句子的开始
+EOS_CHAR = 257  # <end sentence>    句子的结束
+BOW_CHAR = 258  # <begin word>   单词的开始
+EOW_CHAR = 259  # <end word>    单词的结束
+PAD_CHAR = 260  # <pad char>  填充的标志
+
+
+def load_vocab(vocab):
+    # 打开词表读取单词  .[0]是词    .[1]指的是词的标号
+    with open(vocab, encoding='utf8') as fp:
+        return {line.split()[0]: int(line.split()[1]) for line in fp}
+
+
+def word_dtype(vocab_size):
+    # 词表不超过65536就用uint16存  否则用uint32
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+def convert_token_to_char_ids(token, token_maxlen):
+    # 先初始化  每个单词的长度都是token_maxlen
+    char_indices = np.full([token_maxlen], PAD_CHAR, dtype=np.int32)
+
+    # Encode word to UTF-8 encoding  编码每个单词
+    word_encoded = token.encode('utf-8', 'ignore')[:(token_maxlen - 2)]
+    # Set characters encodings
+    # Add begin of word char index
+    char_indices[0] = BOW_CHAR    # 每个单词的开始 是开始的标志 bow_char
+    if token == '<bos>':   # 如果这个单词是句子的开始  则将其字符列表写成bos_char
+        char_indices[1] = BOS_CHAR
+        k = 1
+    elif token == '<eos>':  # 如果这个单词是句子的结束  则将其字符列表写成eos_char
+        char_indices[1] = EOS_CHAR
+        k = 1
+    else:
+        # Add word char indices
+        for k, chr_id in enumerate(word_encoded, start=1):
+            char_indices[k] = chr_id + 1
+    # Add end of word char index
+    char_indices[k + 1] = EOW_CHAR
+
+    # 简单讨论一下这一步的输出
+    # 如果当前单词是<bos>说明是句子的开始 编码变为[bow_char对应的id, bos_char对应的id, eow_char对应的id, 其余都是填充的id]
+    # 如果当前单词不是开始和结束的标志  编码变为[bow_char对应的id, 单词中每个字符对应的id....., eow_char对应的id, 如果还有剩余的空则是填充的id]
+    # 如果当前单词是<eow>说明是句子的结束 编码变为[bow_char对应的id, eos_char对应的id, eow_char对应的id, 其余都是填充的id]
+
+    return char_indices
+
+
+def write_shards(corpus, vocab, prefix=None, token_maxlen=50, chars=True):
+    """
+    把语料一次性转成二进制分片, 训练时不再做分词/小写/查词表
+        prefix.words.bin    每个单词的id  按句子首尾相接 (uint16/uint32)
+        prefix.chars.bin    每个单词定长的字符id [n_tokens, token_maxlen] (uint16)
+        prefix.offsets.npy  第i句在words/chars中的区间是 offsets[i]~offsets[i+1]
+        prefix.meta.json    词表大小, dtype, token_maxlen 等信息
+    句子的<bos>/<eos>不存  取batch的时候再按sentence_maxlen加上
+    :param corpus: filename of corpus 语料的路径
+    :param vocab: filename of vocabulary   语料对应的词表路径
+    :param prefix: 分片文件的前缀  默认就放在语料旁边
+    :param token_maxlen: max size of token in characters  # 每个单词的最大长度
+    :param chars: 是否同时写字符级别的分片
+    :return: meta
+    """
+    prefix = prefix or corpus
+    vocab_dict = load_vocab(vocab)
+    vocab_size = max(vocab_dict.values()) + 1
+    dtype = word_dtype(vocab_size)
+    unk_id = vocab_dict['<unk>']
+
+    offsets = [0]
+    char_cache = {}  # 同一个单词的字符id只算一次
+    char_fp = open(prefix + '.chars.bin', 'wb') if chars else None
+    try:
+        with open(corpus, encoding='utf8') as fp, open(prefix + '.words.bin', 'wb') as word_fp:
+            for line in fp:
+                tokens = line.split()
+                word_ids = np.fromiter((vocab_dict.get(token.lower(), unk_id) for token in tokens),
+                                       dtype=dtype, count=len(tokens))
+                word_fp.write(word_ids.tobytes())
+
+                if char_fp is not None:
+                    char_ids = np.empty((len(tokens), token_maxlen), dtype=np.uint16)
+                    for k, token in enumerate(tokens):
+                        if token not in char_cache:
+                            char_cache[token] = convert_token_to_char_ids(token, token_maxlen)
+                        char_ids[k] = char_cache[token]
+                    char_fp.write(char_ids.tobytes())
+
+                offsets.append(offsets[-1] + len(tokens))
+    finally:
+        if char_fp is not None:
+            char_fp.close()
+
+    np.save(prefix + '.offsets.npy', np.asarray(offsets, dtype=np.int64))
+    meta = {
+        'corpus': os.path.basename(corpus),
+        'vocab': os.path.basename(vocab),
+        'vocab_size': vocab_size,
+        'word_dtype': np.dtype(dtype).name,
+        'chars': bool(chars),
+        'token_maxlen': token_maxlen,
+        'n_sentences': len(offsets) - 1,
+        'n_tokens': offsets[-1],
+    }
+    with open(prefix + '.meta.json', 'w', encoding='utf8') as fp:
+        json.dump(meta, fp, indent=2)
+    return meta
+
+
+def load_shards_meta(prefix):
+    with open(prefix + '.meta.json', encoding='utf8') as fp:
+        return json.load(fp)
+
+
+def load_shards(prefix):
+    """
+    以内存映射的方式打开分片  切片不会拷贝数据, 多个worker共享同一份页缓存
+    :return: meta, offsets, words, chars(没有字符分片时为None)
+    """
+    meta = load_shards_meta(prefix)
+    n_tokens = meta['n_tokens']
+    offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+
+    if n_tokens:
+        words = np.memmap(prefix + '.words.bin', dtype=meta['word_dtype'], mode='r', shape=(n_tokens,))
+    else:
+        # 空文件不能做内存映射
+        words = np.zeros((0,), dtype=meta['word_dtype'])
+
+    chars = None
+    if meta['chars']:
+        if n_tokens:
+            chars = np.memmap(prefix + '.chars.bin', dtype=np.uint16, mode='r',
+                              shape=(n_tokens, meta['token_maxlen']))
+        else:
+            chars = np.zeros((0, meta['token_maxlen']), dtype=np.uint16)
+    return meta, offsets, words, chars
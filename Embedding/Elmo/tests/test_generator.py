@@ -40,3 +40,63 @@ for i in range(0, 100):
         if previous_token[0] == next_token[0] == 0:
             break
         print('{:>40} {:>40} {:>40}'.format(np.array2string(token[:5], separator=','), next_token[0], previous_token[0]))
+
+
+# 单词级别的生成器也能取字符id
+np.testing.assert_array_equal(val_generator.get_token_char_indices(1),
+                              LMDataGenerator(os.path.join(DATA_SET_DIR, parameters['valid_dataset']),
+                                              os.path.join(DATA_SET_DIR, parameters['vocab']),
+                                              sentence_maxlen=50,
+                                              token_maxlen=50,
+                                              batch_size=1,
+                                              token_encoding='word').get_token_char_indices(1))
+
+
+# 分片模式: 和直接读语料得到的batch完全一样 (只写单词id的分片在要字符id时回到语料原文)
+import tempfile
+from elmo.lm_shards import write_shards
+
+with tempfile.TemporaryDirectory() as shard_dir:
+    corpus = os.path.join(DATA_SET_DIR, parameters['valid_dataset'])
+    vocab = os.path.join(DATA_SET_DIR, parameters['vocab'])
+    for chars in (True, False):
+        prefix = os.path.join(shard_dir, 'valid_chars' if chars else 'valid_words')
+        write_shards(corpus, vocab, prefix=prefix, token_maxlen=50, chars=chars)
+        for token_encoding in (('word', 'char') if chars else ('word',)):
+            reference = LMDataGenerator(corpus, vocab, sentence_maxlen=50, token_maxlen=50, batch_size=8,
+                                        shuffle=False, token_encoding=token_encoding)
+            sharded = LMDataGenerator(corpus, vocab, sentence_maxlen=50, token_maxlen=50, batch_size=8,
+                                      shuffle=False, token_encoding=token_encoding, shards=prefix)
+            assert len(reference) == len(sharded)
+            for i in range(0, len(reference), 50):
+                for expected, actual in zip(reference[i][0], sharded[i][0]):
+                    np.testing.assert_array_equal(expected, actual)
+            np.testing.assert_array_equal(reference.get_token_char_indices(1), sharded.get_token_char_indices(1))
+    print('shards: OK')
+
+
+# 分桶: 每句话恰好出现一次, 每批补齐到本批最长的句子+2, 内容和不分桶时同一句话的结果一致
+for token_encoding in ('word', 'char'):
+    bucketed = LMDataGenerator(os.path.join(DATA_SET_DIR, parameters['valid_dataset']),
+                               os.path.join(DATA_SET_DIR, parameters['vocab']),
+                               sentence_maxlen=50,
+                               token_maxlen=50,
+                               batch_size=16,
+                               token_encoding=token_encoding,
+                               bucketing=True)
+    seen = np.concatenate(bucketed.batches)
+    assert len(seen) == len(bucketed.indices) and len(np.unique(seen)) == len(seen)
+    for i in range(len(bucketed)):
+        (inputs, next_ids, previous_ids), _ = bucketed[i]
+        batch_ids = bucketed.batches[i]
+        assert inputs.shape[1] == bucketed.lengths[batch_ids].max() + 2
+        if i % 20:
+            continue
+        for row, sent_id in enumerate(batch_ids):
+            if token_encoding == 'word':
+                expected = bucketed.get_token_indices(sent_id)
+            else:
+                expected = bucketed.get_token_char_indices(sent_id)
+            np.testing.assert_array_equal(inputs[row], expected[:inputs.shape[1]])
+            assert not expected[inputs.shape[1]:].any()
+    print('bucketing ({}): OK'.format(token_encoding))
@@ -13,6 +13,7 @@ parameters = {
     'valid_dataset': 'wikitext-2/wiki.valid.tokens',
     'test_dataset': 'wikitext-2/wiki.test.tokens',
     'vocab': 'wikitext-2/wiki.vocab',
+    'use_shards': False,   # 先运行 build_shards.py 生成分片
     'vocab_size': 28914,
     'num_sampled': 1000,
     'charset_size': 262,
@@ -52,7 +53,9 @@ train_generator = LMDataGenerator(os.path.join(DATA_SET_DIR, parameters['train_d
                                   token_maxlen=parameters['token_maxlen'],
                                   batch_size=parameters['batch_size'],
                                   shuffle=parameters['shuffle'],
-                                  token_encoding=parameters['token_encoding'])
+                                  token_encoding=parameters['token_encoding'],
+                                  shards=os.path.join(DATA_SET_DIR, parameters['train_dataset'])
+                                         if parameters['use_shards'] else None)
 
 val_generator = LMDataGenerator(os.path.join(DATA_SET_DIR, parameters['valid_dataset']),
                                 os.path.join(DATA_SET_DIR, parameters['vocab']),
@@ -60,7 +63,9 @@ val_generator = LMDataGenerator(os.path.join(DATA_SET_DIR, parameters['valid_dat
                                 token_maxlen=parameters['token_maxlen'],
                                 batch_size=parameters['batch_size'],
                                 shuffle=parameters['shuffle'],
-                                token_encoding=parameters['token_encoding'])
+                                token_encoding=parameters['token_encoding'],
+                                shards=os.path.join(DATA_SET_DIR, parameters['valid_dataset'])
+                                       if parameters['use_shards'] else None)
 
 test_generator = LMDataGenerator(os.path.join(DATA_SET_DIR, parameters['test_dataset']),
                                 os.path.join(DATA_SET_DIR, parameters['vocab']),
@@ -68,7 +73,9 @@ test_generator = LMDataGenerator(os.path.join(DATA_SET_DIR, parameters['test_dat
                                 token_maxlen=parameters['token_maxlen'],
                                 batch_size=parameters['batch_size'],
                                 shuffle=parameters['shuffle'],
-                                token_encoding=parameters['token_encoding'])
+                                token_encoding=parameters['token_encoding'],
+                                shards=os.path.join(DATA_SET_DIR, parameters['test_dataset'])
+                                       if parameters['use_shards'] else None)
 
 # Compile ELMo
 elmo_model = ELMo(parameters)
@@ -0,0 +1,164 @@
+"""
+
+@file   : cooccurrence.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+流式统计GloVe的共现矩阵  不再分配 vocab_size x vocab_size 的稠密矩阵
+    语料按块送进来, 窗口可以跨块; 每块内按窗口距离j整体取出词对, 权重1/j
+    (行, 列)编码成一个int64 key = 行 * vocab_size + 列, 排序后相同key的权重相加
+    词对太多时先合并, 仍然太多就写到磁盘分片, 最后统一合并成CSR
+
+"""
+import os
+
+import numpy as np
+
+
+def window_pairs(ids, vocab_size, context_size, start=0):
+    """
+    取出ids内相距1..context_size的所有词对, 两个方向各记一次, 权重为1/距离
+    :param ids: 词id数组
+    :param vocab_size:
+    :param context_size: 窗口大小
+    :param start: 只统计右边的词位置>=start的词对 (前start个词是上一块留下的, 和它们之间的词对已经统计过)
+    :return: keys int64, values float64
+    """
+    keys, values = [], []
+    for j in range(1, context_size + 1):
+        # left按right的长度取  块比窗口短时两者都是空的
+        lo = max(start, j)
+        right = ids[lo:]
+        left = ids[lo - j: lo - j + len(right)]
+        weight = np.full(len(right), 1.0 / j)
+        keys.extend([left * vocab_size + right, right * vocab_size + left])
+        values.extend([weight, weight])
+    return np.concatenate(keys), np.concatenate(values)
+
+
+def reduce_pairs(keys, values):
+    # 相同key的权重相加  返回按key排好序的结果
+    if len(keys) == 0:
+        return keys, values
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.add.reduceat(values, starts)
+
+
+def merge_pairs(parts):
+    # 多组(keys, values)合并
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    return reduce_pairs(np.concatenate([keys for keys, _ in parts]),
+                        np.concatenate([values for _, values in parts]))
+
+
+def write_shard(shard_dir, index, keys, values):
+    os.makedirs(shard_dir, exist_ok=True)
+    prefix = os.path.join(shard_dir, 'cooc.{:05d}'.format(index))
+    np.save(prefix + '.keys.npy', keys)
+    np.save(prefix + '.values.npy', values)
+    return prefix
+
+
+def read_shard(prefix):
+    return np.load(prefix + '.keys.npy', mmap_mode='r'), np.load(prefix + '.values.npy', mmap_mode='r')
+
+
+def to_csr(keys, values, vocab_size):
+    """
+    :return: indptr [vocab_size + 1] int64, indices int32, data float32  第i行是 indices/data[indptr[i]: indptr[i + 1]]
+    """
+    rows = keys // vocab_size
+    indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=vocab_size), out=indptr[1:])
+    return indptr, (keys % vocab_size).astype(np.int32), values.astype(np.float32)
+
+
+def count_cooccurrence(chunks, vocab_size, context_size=3, max_pairs=20000000, shard_dir=None):
+    """
+    流式统计共现矩阵
+    :param chunks: 可迭代的词id数组, 各块首尾相连 (如按行或按固定大小切开的语料)
+    :param vocab_size: 词表大小
+    :param context_size: 窗口大小
+    :param max_pairs: 内存中最多保留多少个未合并的词对
+    :param shard_dir: 合并后仍超过max_pairs时写到这个目录下的分片, None表示一直放在内存里
+    :return: indptr, indices, data  CSR格式的共现矩阵
+    """
+    tail = np.zeros(0, dtype=np.int64)
+    parts, n_pairs, shards = [], 0, []
+    for chunk in chunks:
+        ids = np.concatenate([tail, np.asarray(chunk, dtype=np.int64)])
+        parts.append(reduce_pairs(*window_pairs(ids, vocab_size, context_size, start=len(tail))))
+        n_pairs += len(parts[-1][0])
+        tail = ids[-context_size:]
+        if n_pairs > max_pairs:
+            keys, values = merge_pairs(parts)
+            if shard_dir is not None and len(keys) > max_pairs // 2:
+                shards.append(write_shard(shard_dir, len(shards), keys, values))
+                parts, n_pairs = [], 0
+            else:
+                parts, n_pairs = [(keys, values)], len(keys)
+
+    parts = [read_shard(prefix) for prefix in shards] + parts
+    return to_csr(*merge_pairs(parts), vocab_size)
+
+
+def csr_to_coo(indptr, indices, data):
+    # 训练时按非零元素采样: 返回 rows, cols, values
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    return rows, indices, data
+
+
+def save_cooccurrence(path, indptr, indices, data):
+    np.savez(path, indptr=indptr, indices=indices, data=data)
+
+
+def load_cooccurrence(path):
+    arrays = np.load(path)
+    return arrays['indptr'], arrays['indices'], arrays['data']
+
+
+def chunked(ids, chunk_size):
+    # 把整份语料的词id切成块, 给count_cooccurrence用
+    for start in range(0, len(ids), chunk_size):
+        yield ids[start: start + chunk_size]
+
+
+def dense_cooccurrence(ids, vocab_size, context_size=3):
+    # 逐个位置统计的稠密共现矩阵  只在小词表上用来核对count_cooccurrence
+    matrix = np.zeros((vocab_size, vocab_size))
+    for i in range(len(ids)):
+        for j in range(1, min(context_size, i) + 1):
+            matrix[ids[i - j], ids[i]] += 1.0 / j
+            matrix[ids[i], ids[i - j]] += 1.0 / j
+    return matrix
+
+
+if __name__ == '__main__':
+    import time
+
+    # 和稠密的结果核对  包括比窗口短的块 (如只有一两个词的行)
+    rng = np.random.RandomState(0)
+    for sizes, context_size in [([2], 3), ([3], 4), ([1, 2, 1, 5, 2], 3), ([7, 1, 1, 1, 9], 4), ([4] * 5, 2)]:
+        corpus = rng.randint(0, 10, sum(sizes))
+        chunks = np.split(corpus, np.cumsum(sizes)[:-1])
+        indptr, indices, data = count_cooccurrence(chunks, 10, context_size)
+        rows, cols, values = csr_to_coo(indptr, indices, data)
+        matrix = np.zeros((10, 10))
+        matrix[rows, cols] = values
+        assert np.allclose(matrix, dense_cooccurrence(corpus, 10, context_size)), (sizes, context_size)
+    print('dense check: OK')
+
+    # Zipf分布的百万词语料  看流式统计的耗时和非零元素个数
+    vocab_size, n_tokens = 50000, 1000000
+    rng = np.random.RandomState(0)
+    corpus = np.minimum(rng.zipf(1.2, n_tokens), vocab_size) - 1
+    for shard_dir in [None, '/tmp/glove_shards']:
+        start = time.time()
+        indptr, indices, data = count_cooccurrence(chunked(corpus, 100000), vocab_size, context_size=3,
+                                                   max_pairs=2000000, shard_dir=shard_dir)
+        print('shards: {}, tokens: {}, nnz: {}, {:.2f}s'.format(shard_dir, n_tokens, len(data), time.time() - start))
@@ -0,0 +1,80 @@
+"""
+
+@file   : glove.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+GloVe的训练  词向量和偏置各是一整块参数, 一个batch的加权最小二乘损失一次算完
+
+"""
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from cooccurrence import csr_to_coo
+
+
+def weighting(x, xmax, alpha):
+    # 权重函数 f(x) = (x / xmax) ^ alpha, x >= xmax 时为1
+    return np.minimum((x / xmax) ** alpha, 1.0)
+
+
+class GloVe(nn.Module):
+    def __init__(self, vocab_size, embed_size):
+        super(GloVe, self).__init__()
+        # sparse=True: 每步只更新这个batch里出现的词, 词表很大时也不用更新整个矩阵
+        self.l_embed = nn.Embedding(vocab_size, embed_size, sparse=True)
+        self.r_embed = nn.Embedding(vocab_size, embed_size, sparse=True)
+        self.l_biases = nn.Embedding(vocab_size, 1, sparse=True)
+        self.r_biases = nn.Embedding(vocab_size, 1, sparse=True)
+        for param in self.parameters():
+            nn.init.normal_(param, 0, 0.01)
+
+    def forward(self, rows, cols, log_covals, weights):
+        # sum_ij f(X_ij) * (w_i . w~_j + b_i + b~_j - log X_ij) ^ 2
+        dots = (self.l_embed(rows) * self.r_embed(cols)).sum(dim=1)
+        diff = dots + self.l_biases(rows).squeeze(1) + self.r_biases(cols).squeeze(1) - log_covals
+        return (weights * diff ** 2).sum()
+
+    def embeddings(self):
+        # 左右两组词向量相加作为最终的词向量
+        return (self.l_embed.weight + self.r_embed.weight).detach().cpu().numpy()
+
+
+def train(model, indptr, indices, data, batch_size=512, num_epochs=10, l_rate=0.001, xmax=100, alpha=0.75,
+          seed=None):
+    """
+    每个epoch把共现矩阵的非零元素打乱后按batch遍历一遍
+    :param model: GloVe
+    :param indptr, indices, data: count_cooccurrence的输出
+    :return: 每个epoch的平均loss
+    """
+    rows, cols, covals = csr_to_coo(indptr, indices, data)
+    rows = torch.from_numpy(rows.astype(np.int64))
+    cols = torch.from_numpy(cols.astype(np.int64))
+    log_covals = torch.from_numpy(np.log(covals).astype(np.float32))
+    weights = torch.from_numpy(weighting(covals, xmax, alpha).astype(np.float32))
+
+    optimizer = optim.SparseAdam(list(model.parameters()), lr=l_rate)
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+
+    losses = []
+    num_batches = int(np.ceil(len(rows) / batch_size))
+    for epoch in range(num_epochs):
+        order = torch.randperm(len(rows), generator=generator)
+        avg_loss = 0.0
+        for start in range(0, len(rows), batch_size):
+            batch = order[start: start + batch_size]
+            optimizer.zero_grad()
+            loss = model(rows[batch], cols[batch], log_covals[batch], weights[batch])
+            loss.backward()
+            optimizer.step()
+            avg_loss += loss.item() / num_batches
+        losses.append(avg_loss)
+        print("per epoch average loss:" + str(epoch + 1) + ": ", avg_loss)
+    return losses
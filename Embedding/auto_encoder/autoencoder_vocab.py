@@ -19,6 +19,11 @@ import os
 from sklearn.manifold import TSNE
 import matplotlib.pyplot as plt
 import seaborn as sns
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common.encoding import str_idx
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_store import save_embeddings
 
 
 
@@ -78,25 +83,6 @@ def build_dataset(words, n_words):
     return data, count, dictionary, reversed_dictionary
 
 
-def str_idx(corpus, dic, maxlen, UNK=3):
-    '''
-    将语料转为对应的id序列
-    :param corpus: 语料
-    :param dic: 词典
-    :param maxlen: 全部需要填充到这个维度
-    :param UNK: 没有的词标记为unk
-    :return: 返回的是语料转为id序列的numpy数组
-    '''
-    X = np.zeros((len(corpus), maxlen))
-    for i in range(len(corpus)):
-        for no, k in enumerate(corpus[i].split()[:maxlen][::-1]):
-            try:
-                X[i, -1 - no] = dic[k]
-            except Exception as e:
-                X[i, -1 - no] = UNK
-    return X
-
-
 # 加载数据集
 dataset = sklearn.datasets.load_files(container_path='data', encoding='UTF-8')
 dataset.data, dataset.target = separate_dataset(dataset)
@@ -196,6 +182,8 @@ for i in range(epoch):
 
 logits_test = sess.run(tf.nn.sigmoid(model.logits), feed_dict={model.X: X})
 print(logits_test.shape)
+# 句向量按样本编号保存  之后用 EmbeddingStore.load 加载, 可以查相似的句子
+save_embeddings('autoencoder_sentence_vectors', logits_test, range(len(logits_test)))
 
 
 # 将训练的此向量进行降维　降到2维 只是为了可视化
@@ -218,6 +206,3 @@ for i in range(manifold_polarity.shape[0]):
     plt.scatter(manifold_polarity[i,0],manifold_polarity[i,1],c=colors[Y[i]])
 plt.legend(dataset.target_names)
 plt.show()
-
-
-
@@ -0,0 +1,307 @@
+"""
+
+@file   : embedding_store.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+训练好的词向量(或句向量)的存储和近似最近邻查询
+    save_embeddings: 存成 .npy (float32/float16) + 词表, 加载时用mmap, 不需要整块读进内存
+    EmbeddingStore.most_similar / analogy: 不建索引时是分块的精确计算, 建了索引后走IVF-PQ
+    IVFPQIndex: 先用k-means把向量分到n_lists个桶, 桶内残差做乘积量化(每段256个中心, 一个uint8),
+                查询时只看最近的nprobe个桶, 用查表算近似内积, 最后取出少量候选用原向量精排
+    python embedding_store.py 会和精确计算比较召回率和每次查询的耗时
+
+"""
+import os
+import json
+import time
+
+import numpy as np
+
+
+def save_embeddings(path, vectors, words, dtype='float32'):
+    """
+    :param path: 前缀  写出 path.npy, path.vocab, path.meta.json
+    :param vectors: [n, dim]
+    :param words: 每一行对应的词 (句向量可以用编号)
+    :param dtype: float32 或 float16
+    """
+    vectors = np.asarray(vectors)
+    if len(words) != len(vectors):
+        raise ValueError('Got {} words for {} vectors'.format(len(words), len(vectors)))
+    np.save(path + '.npy', vectors.astype(dtype))
+    with open(path + '.vocab', 'w', encoding='utf8') as f:
+        f.write('\n'.join(str(word) for word in words) + '\n')
+    with open(path + '.meta.json', 'w') as f:
+        json.dump({'n': len(vectors), 'dim': vectors.shape[1], 'dtype': str(np.dtype(dtype))}, f)
+    return path
+
+
+def normalize(vectors, eps=1e-8):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), eps)
+
+
+def kmeans(x, k, iterations=20, batch_size=65536, rng=None):
+    """
+    Lloyd k-means  距离按块计算, 内存只和batch_size * k有关
+    :return: centroids [k, dim], assignment [n]
+    """
+    rng = rng or np.random.RandomState(0)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = assign(x, centroids, batch_size)
+        counts = np.bincount(assignment, minlength=k)
+        order = np.argsort(assignment, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        nonempty = counts > 0
+        sums = np.add.reduceat(x[order], starts[nonempty], axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+        # 空的簇重新随机取一个点
+        if (~nonempty).any():
+            centroids[~nonempty] = x[rng.choice(len(x), int((~nonempty).sum()), replace=False)]
+    return centroids, assign(x, centroids, batch_size)
+
+
+def assign(x, centroids, batch_size=65536):
+    # 每个点最近的中心  |x - c|^2 = |x|^2 - 2 x.c + |c|^2, |x|^2 不影响argmin
+    sq_norms = (centroids ** 2).sum(1)
+    return np.concatenate([np.argmin(sq_norms - 2 * x[i: i + batch_size] @ centroids.T, axis=1)
+                           for i in range(0, len(x), batch_size)]) if len(x) else np.zeros(0, dtype=np.int64)
+
+
+class IVFPQIndex(object):
+    def __init__(self, n_lists=None, n_subvectors=8, n_codes=256, iterations=20, train_size=50000, seed=0):
+        """
+        :param n_lists: 倒排桶的个数, 默认 4 * sqrt(n)
+        :param n_subvectors: 乘积量化把向量切成几段  dim必须能被整除
+        :param n_codes: 每段的中心个数  <=256, 编码为uint8
+        :param iterations: k-means迭代次数
+        :param train_size: k-means只在这么多个随机抽取的向量上训练, 再给所有向量分配
+        """
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.n_codes = n_codes
+        self.iterations = iterations
+        self.train_size = train_size
+        self.rng = np.random.RandomState(seed)
+
+    def fit(self, vectors):
+        # vectors: 已经归一化的 [n, dim]  内积即余弦相似度
+        x = np.asarray(vectors, dtype=np.float32)
+        n, dim = x.shape
+        if dim % self.n_subvectors:
+            raise ValueError('dim {} is not divisible by n_subvectors {}'.format(dim, self.n_subvectors))
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(n)))
+        sample = self.rng.choice(n, min(n, max(self.train_size, n_lists)), replace=False)
+        self.coarse, _ = kmeans(x[sample], n_lists, self.iterations, rng=self.rng)
+        lists = assign(x, self.coarse)
+
+        # 残差的乘积量化
+        residual = x - self.coarse[lists]
+        sub = dim // self.n_subvectors
+        self.codebooks = np.zeros((self.n_subvectors, min(self.n_codes, len(sample)), sub), dtype=np.float32)
+        codes = np.zeros((n, self.n_subvectors), dtype=np.uint8)
+        for m in range(self.n_subvectors):
+            part = residual[:, m * sub: (m + 1) * sub]
+            self.codebooks[m], _ = kmeans(part[sample], self.n_codes, self.iterations, rng=self.rng)
+            codes[:, m] = assign(part, self.codebooks[m])
+
+        # 按桶排好, 第l个桶是 ids/codes[offsets[l]: offsets[l + 1]]
+        order = np.argsort(lists, kind='stable')
+        self.ids = order.astype(np.int64)
+        self.codes = codes[order]
+        self.offsets = np.zeros(len(self.coarse) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=len(self.coarse)), out=self.offsets[1:])
+        return self
+
+    def candidates(self, query, n_candidates, nprobe=8):
+        """
+        单个查询的近似候选
+        :param query: [dim] 归一化后的查询向量
+        :return: ids, 近似内积  按近似内积从大到小
+        """
+        coarse_scores = self.coarse @ query
+        probe = np.argsort(-coarse_scores)[:nprobe]
+        # 查询和每段每个中心的内积  [n_subvectors, n_codes]
+        tables = np.einsum('mkd,md->mk', self.codebooks, query.reshape(self.n_subvectors, -1))
+        ids, scores = [], []
+        for l in probe:
+            start, end = self.offsets[l], self.offsets[l + 1]
+            if start == end:
+                continue
+            codes = self.codes[start: end]
+            approx = tables[np.arange(self.n_subvectors), codes].sum(1) + coarse_scores[l]
+            ids.append(self.ids[start: end])
+            scores.append(approx)
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        top = np.argsort(-scores)[:n_candidates]
+        return ids[top], scores[top]
+
+    def save(self, path):
+        np.savez(path, coarse=self.coarse, codebooks=self.codebooks, ids=self.ids, codes=self.codes,
+                 offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        index = cls(n_lists=len(arrays['coarse']), n_subvectors=arrays['codebooks'].shape[0],
+                    n_codes=arrays['codebooks'].shape[1])
+        for key in ['coarse', 'codebooks', 'ids', 'codes', 'offsets']:
+            setattr(index, key, arrays[key])
+        return index
+
+
+class EmbeddingStore(object):
+    def __init__(self, vectors, words):
+        """
+        :param vectors: [n, dim]  可以是np.load(..., mmap_mode='r')的结果
+        :param words: 每一行对应的词
+        """
+        self.vectors = vectors
+        self.words = list(words)
+        self.word2id = {word: i for i, word in enumerate(self.words)}
+        self.index = None
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        vectors = np.load(path + '.npy', mmap_mode='r' if mmap else None)
+        with open(path + '.vocab', encoding='utf8') as f:
+            words = f.read().split('\n')[:len(vectors)]
+        store = cls(vectors, words)
+        if os.path.exists(path + '.index.npz'):
+            store.index = IVFPQIndex.load(path + '.index.npz')
+        return store
+
+    def build_index(self, save_path=None, **kwargs):
+        # kwargs 传给 IVFPQIndex
+        self.index = IVFPQIndex(**kwargs).fit(self.normed(np.arange(len(self.words))))
+        if save_path is not None:
+            self.index.save(save_path + '.index.npz')
+        return self.index
+
+    def normed(self, ids):
+        return normalize(self.vectors[np.asarray(ids)])
+
+    def ids(self, words):
+        return [self.word2id[word] for word in words]
+
+    def vector(self, word):
+        return np.asarray(self.vectors[self.word2id[word]], dtype=np.float32)
+
+    def search(self, queries, topn=10, exclude=None, nprobe=8, rerank=10, exact=False, batch_size=8192):
+        """
+        批量查询最相似的向量
+        :param queries: [n_queries, dim]
+        :param topn:
+        :param exclude: 每个查询要排除的id (如查询词本身), list of list
+        :param nprobe: 查几个桶
+        :param rerank: 取 topn * rerank 个近似候选, 再用原向量精排
+        :param exact: 不走索引, 分块精确计算
+        :return: ids [n_queries, topn], scores [n_queries, topn]
+        """
+        queries = normalize(np.atleast_2d(queries))
+        exclude = exclude or [()] * len(queries)
+        n_extra = max(len(e) for e in exclude) if len(exclude) else 0
+        k = topn + n_extra
+        if exact or self.index is None:
+            ids, scores = self._exact(queries, k, batch_size)
+        else:
+            ids = np.zeros((len(queries), k), dtype=np.int64)
+            scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+            for i, query in enumerate(queries):
+                candidates, _ = self.index.candidates(query, k * rerank, nprobe)
+                candidates = np.sort(candidates)   # 按行号顺序读mmap
+                exact_scores = self.normed(candidates) @ query
+                order = np.argsort(-exact_scores)[:k]
+                ids[i, :len(order)] = candidates[order]
+                scores[i, :len(order)] = exact_scores[order]
+
+        # 候选不足topn个时 (桶太少), 剩下的位置id为-1
+        out_ids = np.full((len(queries), topn), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), topn), -np.inf, dtype=np.float32)
+        for i, skip in enumerate(exclude):
+            keep = ~np.isin(ids[i], list(skip)) & np.isfinite(scores[i])
+            row_ids, row_scores = ids[i][keep][:topn], scores[i][keep][:topn]
+            out_ids[i, :len(row_ids)], out_scores[i, :len(row_ids)] = row_ids, row_scores
+        return out_ids, out_scores
+
+    def _exact(self, queries, k, batch_size):
+        # 分块扫一遍所有向量  每块保留前k个
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.words), batch_size):
+            block = self.normed(np.arange(start, min(start + batch_size, len(self.words)))) @ queries.T
+            scores = np.concatenate([best_scores, block.T], axis=1)
+            ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + block.shape[0]),
+                                                            (len(queries), block.shape[0]))], axis=1)
+            top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_ids = np.take_along_axis(ids, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def most_similar(self, words, topn=10, **kwargs):
+        """
+        :param words: 一批词
+        :return: 每个词的 [(相似词, 余弦相似度), ...]
+        """
+        ids = self.ids(words)
+        result_ids, scores = self.search(self.normed(ids), topn, exclude=[[i] for i in ids], **kwargs)
+        return [[(self.words[j], float(s)) for j, s in zip(row_ids, row_scores) if j >= 0]
+                for row_ids, row_scores in zip(result_ids, scores)]
+
+    def analogy(self, triples, topn=10, **kwargs):
+        """
+        a之于b 相当于 c之于? : 查找和 b - a + c 最相似的词
+        :param triples: [(a, b, c), ...]
+        """
+        ids = np.array([self.ids(triple) for triple in triples])
+        normed = self.normed(ids.reshape(-1)).reshape(len(triples), 3, -1)
+        queries = normed[:, 1] - normed[:, 0] + normed[:, 2]
+        result_ids, scores = self.search(queries, topn, exclude=[list(row) for row in ids], **kwargs)
+        return [[(self.words[j], float(s)) for j, s in zip(row_ids, row_scores) if j >= 0]
+                for row_ids, row_scores in zip(result_ids, scores)]
+
+
+def benchmark(store, n_queries=200, topn=10, nprobes=(1, 2, 4, 8, 16, 32), seed=0):
+    # 召回率@topn 和 每个查询的耗时  以精确计算为准
+    rng = np.random.RandomState(seed)
+    query_ids = rng.choice(len(store.words), n_queries, replace=False)
+    queries = store.normed(query_ids)
+    start = time.time()
+    truth, _ = store.search(queries, topn, exact=True)
+    print('exact: {:.3f} ms/query'.format((time.time() - start) * 1000 / n_queries))
+    for nprobe in nprobes:
+        start = time.time()
+        found, _ = store.search(queries, topn, nprobe=nprobe)
+        elapsed = (time.time() - start) * 1000 / n_queries
+        recall = np.mean([len(np.intersect1d(a, b)) / topn for a, b in zip(found, truth)])
+        print('nprobe {:>3}: recall@{} {:.3f}, {:.3f} ms/query'.format(nprobe, topn, recall, elapsed))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Recall vs latency of the IVF-PQ index against brute force')
+    parser.add_argument('--path', default=None, help='prefix written by save_embeddings; synthetic data if omitted')
+    parser.add_argument('--n', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=128)
+    args = parser.parse_args()
+
+    if args.path is None:
+        # 有簇结构的随机向量, 接近词向量的分布
+        rng = np.random.RandomState(0)
+        centers = rng.normal(size=(1000, args.dim))
+        vectors = centers[rng.randint(0, 1000, args.n)] + 0.5 * rng.normal(size=(args.n, args.dim))
+        args.path = save_embeddings('/tmp/synthetic_embeddings', vectors, range(args.n), dtype='float16')
+    store = EmbeddingStore.load(args.path)
+    start = time.time()
+    store.build_index(n_subvectors=16)
+    print('build index: {:.1f}s'.format(time.time() - start))
+    benchmark(store)
@@ -0,0 +1,79 @@
+"""
+
+@file   : ngram_hashing.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+fastText的n-gram特征  用哈希桶代替精确的n-gram词典
+    每个n-gram(词id的元组)做FNV-1a哈希后对n_buckets取模, 特征id = vocab_size + 桶号
+    嵌入表大小固定为 vocab_size + n_buckets, 不随语料增长; 预测时新出现的n-gram也有对应的桶
+    整份语料拉平成一个id数组, 所有n-gram用滑动窗口一次算完, 不跨句子
+
+"""
+import numpy as np
+
+FNV_OFFSET = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
+
+
+def to_csr(sequences):
+    # list of id list -> offsets, ids
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    ids = np.fromiter((i for sequence in sequences for i in sequence), dtype=np.int64, count=int(offsets[-1]))
+    return offsets, ids
+
+
+def fnv1a(windows):
+    """
+    :param windows: [n_windows, n]  每行是一个n-gram的词id
+    :return: [n_windows] uint64  (以词id为单位做FNV-1a, 而不是逐字节)
+    """
+    h = np.full(len(windows), FNV_OFFSET, dtype=np.uint64)
+    for k in range(windows.shape[1]):
+        h = (h ^ windows[:, k].astype(np.uint64)) * FNV_PRIME
+    return h
+
+
+def ngram_buckets(ngram, vocab_size, n_buckets):
+    # 单个n-gram的特征id  如 ngram_buckets((12, 7), ...)
+    return int(vocab_size + fnv1a(np.array([ngram], dtype=np.int64))[0] % np.uint64(n_buckets))
+
+
+def add_hashed_ngrams(offsets, ids, vocab_size, ngram_range=2, n_buckets=2000000):
+    """
+    每句话后面依次接上它的2-gram, 3-gram, ..., ngram_range-gram的特征id (和原来add_ngram的顺序一样)
+    :param offsets: 第i句是 ids[offsets[i]: offsets[i + 1]]
+    :param ids: 词id
+    :param vocab_size: 词id都小于vocab_size, 桶的特征id从vocab_size开始
+    :param ngram_range: 最大的n
+    :param n_buckets: 桶的个数
+    :return: offsets, ids  加上n-gram后的CSR
+    """
+    lengths = np.diff(offsets)
+    sentence = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(len(ids)) - offsets[sentence]
+
+    # 每句话各阶n-gram的个数, 以及在输出中各段的起点
+    counts = [lengths] + [np.maximum(lengths - n + 1, 0) for n in range(2, ngram_range + 1)]
+    new_lengths = np.sum(counts, axis=0)
+    new_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(new_lengths, out=new_offsets[1:])
+    segment_starts = new_offsets[:-1] + np.cumsum([np.zeros_like(lengths)] + counts[:-1], axis=0)
+
+    new_ids = np.zeros(int(new_offsets[-1]), dtype=np.int64)
+    new_ids[segment_starts[0][sentence] + position] = ids
+    for n in range(2, ngram_range + 1):
+        if len(ids) < n:
+            break
+        # 从每个位置开始的n-gram, 去掉跨句子的
+        starts = np.arange(len(ids) - n + 1)
+        valid = sentence[starts] == sentence[starts + n - 1]
+        starts = starts[valid]
+        windows = np.lib.stride_tricks.sliding_window_view(ids, n)[starts]
+        buckets = vocab_size + (fnv1a(windows) % np.uint64(n_buckets)).astype(np.int64)
+        new_ids[segment_starts[n - 1][sentence[starts]] + position[starts]] = buckets
+    return new_offsets, new_ids
@@ -0,0 +1,145 @@
+"""
+
+@file   : word2vec_pairs.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+word2vec训练样本的流式生成  语料是一个词id数组, 按块处理, 不会把所有(目标词, 上下文)对放进一个list
+    高频词下采样: 每个epoch按 word2vec 的公式随机丢掉一部分高频词
+    动态窗口: 每个中心词的窗口大小在 1..window_size 之间随机, 离得近的上下文被采到的次数更多
+    负采样: unigram^0.75 分布的查表, 采样就是一次randint
+
+"""
+import numpy as np
+
+
+def word_counts(corpus, vocab_size):
+    return np.bincount(np.asarray(corpus), minlength=vocab_size)
+
+
+def subsample_keep_prob(counts, t=1e-5):
+    """
+    word2vec的下采样: 词频为f的词保留的概率为 (sqrt(f / t) + 1) * t / f, f为词频占比
+    :param counts: 每个词出现的次数
+    :param t: 阈值, 词频占比远大于t的词会被大量丢弃
+    """
+    freqs = counts / max(counts.sum(), 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keep = (np.sqrt(freqs / t) + 1) * t / freqs
+    return np.where(counts > 0, np.minimum(keep, 1.0), 0.0)
+
+
+class UnigramTable(object):
+    def __init__(self, counts, power=0.75, table_size=10000000):
+        """
+        负采样的查表  每个词在表里占的格数正比于 count^power
+        :param counts: 每个词出现的次数
+        :param power: 0.75
+        :param table_size: 表的大小  词表很大时要足够大, 低频词才能有格子
+        """
+        probs = counts ** power
+        probs = probs / probs.sum()
+        self.probs = probs
+        self.table = np.repeat(np.arange(len(counts), dtype=np.int32), np.round(probs * table_size).astype(np.int64))
+
+    def sample(self, shape, rng=np.random):
+        return self.table[rng.randint(0, len(self.table), size=shape)]
+
+
+def _chunks(corpus, chunk_size, keep_prob, rng):
+    # 按块取出语料  下采样在这里做
+    for start in range(0, len(corpus), chunk_size):
+        ids = np.asarray(corpus[start: start + chunk_size])
+        if keep_prob is not None:
+            ids = ids[rng.random_sample(len(ids)) < keep_prob[ids]]
+        yield ids
+
+
+def _windows(corpus, window_size, chunk_size, keep_prob, rng):
+    """
+    依次给出 (buf, start, end): buf[start: end] 是这次要处理的中心词, buf里前后各留了window_size个词做上下文
+    块与块之间的窗口是连续的, 和整份语料一起处理的结果一样
+    """
+    carry, start = np.zeros(0, dtype=np.int64), 0
+    for ids in _chunks(corpus, chunk_size, keep_prob, rng):
+        buf = np.concatenate([carry, ids])
+        end = len(buf) - window_size
+        if end > start:
+            yield buf, start, end
+            keep_from = max(end - window_size, 0)
+            carry, start = buf[keep_from:], end - keep_from
+        else:
+            carry = buf
+    if len(carry) > start:
+        yield carry, start, len(carry)
+
+
+def _batches(arrays, batch_size, shuffle, rng):
+    # 把一块块的样本攒成固定大小的batch  每块内先打乱; 最后不足一个batch的丢掉
+    pending = None
+    for block in arrays:
+        if shuffle:
+            order = rng.permutation(len(block[0]))
+            block = [array[order] for array in block]
+        if pending is not None:
+            block = [np.concatenate([old, new]) for old, new in zip(pending, block)]
+        n_full = len(block[0]) // batch_size * batch_size
+        for i in range(0, n_full, batch_size):
+            yield [array[i: i + batch_size] for array in block]
+        pending = [array[n_full:] for array in block]
+
+
+def skipgram_batches(corpus, batch_size, window_size=5, dynamic_window=True, keep_prob=None, negatives=0,
+                     unigram_table=None, shuffle=True, chunk_size=100000, seed=None):
+    """
+    skip-gram的(目标词, 上下文)样本  一个epoch
+    :param corpus: 词id数组 (可以是np.memmap)
+    :param batch_size:
+    :param window_size: 最大窗口
+    :param dynamic_window: 每个中心词的窗口在1..window_size之间随机
+    :param keep_prob: subsample_keep_prob的输出, None表示不下采样
+    :param negatives: 每个样本附带多少个负样本  0表示不需要 (如用tf.nn.nce_loss自己采样)
+    :param unigram_table: UnigramTable  negatives>0时需要
+    :param shuffle: 块内打乱
+    :param chunk_size: 每次处理多少个词  内存只和它有关, 和语料大小无关
+    :param seed:
+    :return: 生成器  targets [batch_size], contexts [batch_size, 1] (, negatives [batch_size, negatives])
+    """
+    rng = np.random.RandomState(seed)
+
+    def blocks():
+        for buf, start, end in _windows(corpus, window_size, chunk_size, keep_prob, rng):
+            centers = np.arange(start, end)
+            spans = rng.randint(1, window_size + 1, len(centers)) if dynamic_window else None
+            targets, contexts = [], []
+            for j in range(1, window_size + 1):
+                selected = centers if spans is None else centers[spans >= j]
+                for pos in [selected - j, selected + j]:
+                    valid = (pos >= 0) & (pos < len(buf))
+                    targets.append(buf[selected[valid]])
+                    contexts.append(buf[pos[valid]])
+            yield [np.concatenate(targets).astype(np.int32), np.concatenate(contexts).astype(np.int32)[:, None]]
+
+    for targets, contexts in _batches(blocks(), batch_size, shuffle, rng):
+        if negatives:
+            yield targets, contexts, unigram_table.sample((batch_size, negatives), rng)
+        else:
+            yield targets, contexts
+
+
+def cbow_batches(corpus, batch_size, window_size=3, keep_prob=None, shuffle=True, chunk_size=100000, seed=None):
+    """
+    CBOW的(上下文, 中心词)样本  一个epoch; 只取两边各有window_size个词的中心词, 上下文定长
+    :return: 生成器  contexts [batch_size, 2 * window_size], targets [batch_size, 1]
+    """
+    rng = np.random.RandomState(seed)
+    offsets = np.concatenate([np.arange(-window_size, 0), np.arange(1, window_size + 1)])
+
+    def blocks():
+        for buf, start, end in _windows(corpus, window_size, chunk_size, keep_prob, rng):
+            centers = np.arange(max(start, window_size), min(end, len(buf) - window_size))
+            yield [buf[centers[:, None] + offsets].astype(np.int32), buf[centers].astype(np.int32)[:, None]]
+
+    return _batches(blocks(), batch_size, shuffle, rng)
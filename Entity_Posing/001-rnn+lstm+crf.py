@@ -8,14 +8,23 @@
 
 """
 import re
+import os
+import sys
+import time
+import argparse
 import numpy as np
 import tensorflow as tf
-from sklearn.metrics import classification_report
+from sklearn.metrics import classification_report, f1_score
+from crf import TagDecoder, save_crf, viterbi_decode
+from ner_data import parse, CharIndex, NERDataset
+from char_encoder import char_lengths, encode_chars, CharEmbeddingCache
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.export import export_saved_model
 
 
 class Model:
     def __init__(self, dim_word, dim_char, dropout, learning_rate,
-                 hidden_size_char, hidden_size_word, num_layers):
+                 hidden_size_char, hidden_size_word, num_layers, char_encoder='bilstm'):
         '''
         :param dim_word: 词的维度
         :param dim_char: 字符维度
@@ -24,11 +33,15 @@ class Model:
         :param hidden_size_char: 字符隐层输出维度
         :param hidden_size_word: 词隐层输出维度
         :param num_layers: 几层
+        :param char_encoder: 字符编码  'bilstm' 或 'cnn' (卷积+max pooling, 比逐字符的LSTM快)
         '''
+        # 训练时是dropout, 验证、预测和导出时喂1.0
+        self.keep_prob = tf.placeholder_with_default(float(dropout), shape=[], name='keep_prob')
+
         def cells(size, reuse=False):
             return tf.contrib.rnn.DropoutWrapper(
                 tf.nn.rnn_cell.LSTMCell(size, initializer=tf.orthogonal_initializer(), reuse=reuse),
-                output_keep_prob=dropout
+                output_keep_prob=self.keep_prob
             )
 
         # 1. define input
@@ -44,21 +57,11 @@ class Model:
         word_embedded = tf.nn.embedding_lookup(self.word_embeddings, self.word_ids)
         char_embedded = tf.nn.embedding_lookup(self.char_embeddings, self.char_ids)
 
-        s = tf.shape(char_embedded)  # (51312, 50, 27, embedding_size)
-        char_embedded = tf.reshape(char_embedded, shape=[s[0] * s[1], s[-2], dim_char])
-
-        for n in range(num_layers):
-            (out_fw, out_bw), (state_fw, state_bw) = tf.nn.bidirectional_dynamic_rnn(
-                cell_fw=cells(hidden_size_char),
-                cell_bw=cells(hidden_size_char),
-                inputs=char_embedded,
-                dtype=tf.float32,
-                scope='bidirectional_rnn_char_%d' % n
-            )
-            char_embedded = tf.concat((out_fw, out_bw), 2)
-
-        output = tf.reshape(char_embedded[:, -1], shape=[s[0], s[1], 2*hidden_size_char])
-        word_embedded = tf.concat([word_embedded, output], axis=-1)  # 将词嵌入部分与字符嵌入通过双向lstm输出部分进行拼接
+        # 字符表示  推理时可以直接喂model.char_output (CharEmbeddingCache), 跳过字符编码
+        self.char_lengths = char_lengths(self.char_ids)
+        self.char_output = encode_chars(char_embedded, self.char_lengths, char_encoder, 2 * hidden_size_char,
+                                        num_layers, cells)
+        word_embedded = tf.concat([word_embedded, self.char_output], axis=-1)  # 将词嵌入部分与字符嵌入通过双向lstm输出部分进行拼接
 
         for n in range(num_layers):
             (out_fw, out_bw), (state_fw, state_bw) = tf.nn.bidirectional_dynamic_rnn(
@@ -70,7 +73,7 @@ class Model:
             )
             word_embedded = tf.concat((out_fw, out_bw), 2)
 
-        logits = tf.layers.Dense(word_embedded, len(idx2tag))
+        logits = tf.layers.dense(word_embedded, len(idx2tag))
 
         y_t = self.labels
         log_likelihood, transition_params = tf.contrib.crf.crf_log_likelihood(
@@ -86,6 +89,9 @@ class Model:
         )
 
         self.tags_seq = tf.identity(self.tags_seq, name='logits')
+        # 发射分数和转移矩阵  线上只跑到emissions, 解码用crf.py, 不需要训练图里的CRF
+        self.emissions = tf.identity(logits, name='emissions')
+        self.transition_params = transition_params
 
         y_t = tf.cast(y_t, tf.int32)
 
@@ -97,25 +103,6 @@ class Model:
         self.accuracy = tf.reduce_mean(tf.cast(correct_pred, tf.float32))
 
 
-def parse(file):
-    '''
-    加载文件并且解析
-    :param file: 文件名
-    :return: 词<->词性
-    '''
-    with open(file) as fopen:
-        texts = fopen.read().split('\n')
-
-    left, right = [], []
-    for text in texts:
-        if '-DOCSTART' in text or not len(text):
-            continue
-        splitted = text.split()
-        left.append(splitted[0])
-        right.append(splitted[-1])
-    return left, right
-
-
 def process_string(string):
     '''
     :param string:
@@ -158,50 +145,65 @@ def parse_XY(texts, labels):
     return X, np.array(Y)
 
 
-def iter_seq(x):
-    return np.array([x[i: i+seq_len] for i in range(0, len(x)-seq_len, 1)])
-
-
-def to_train_seq(*args):
+def run_epoch(sess, model, data, batch_size, e, train=False):
     '''
-    :param args:  词转为的id的序列　　　词性转为id的序列
-    :return:
+    训练或验证一个epoch
+    :return: 平均loss, 平均准确率, 每秒句子数
     '''
-    return [iter_seq(x) for x in args]
-
-
-def generate_char_seq(batch):
+    name = 'train_data' if train else 'test_data'
+    fetches = [model.accuracy, model.cost] + ([model.optimizer] if train else [])
+    total_loss, total_acc = 0, 0
+    start = time.time()
+    for step, (batch_x, batch_char, batch_y) in enumerate(data.batches(batch_size, shuffle=train)):
+        feed_dict = {
+            model.word_ids: batch_x,
+            model.char_ids: batch_char,
+            model.labels: batch_y
+        }
+        if not train:
+            feed_dict[model.keep_prob] = 1.0
+        acc, cost = sess.run(fetches, feed_dict=feed_dict)[:2]
+        total_loss += cost
+        total_acc += acc
+        print('{}: epoch:{}, step:{}, loss:{}, accuracy:{}'.format(name, e, step+1, cost, acc))
+    seconds = time.time() - start
+    return total_loss / (len(data) / batch_size), total_acc / (len(data) / batch_size), len(data) / seconds
+
+
+def predict(sess, model, data, batch_size, transitions, cache=None):
     '''
-    传进来是50一个块　总共有多少块
-    然后将每块的单词转为字符序列
-    :param batch:
-    :return:
+    整个数据集用numpy的Viterbi解码
+    :param cache: CharEmbeddingCache  给定时喂缓存的字符表示, 不再跑字符编码
+    :return: 真实标签id, 预测标签id (都去掉了窗口补齐的位置), 每秒句子数
     '''
-    x = [[len(idx2word[i]) for i in k] for k in batch]  # 得出每个单词的长度
-    maxlen = max([j for i in x for j in i])  # 最大长度
-    temp = np.zeros((batch.shape[0], batch.shape[1], maxlen), dtype=np.int32)
-
-    for i in range(batch.shape[0]):
-        for k in range(batch.shape[1]):
-            for no, c in enumerate(idx2word[batch[i, k]]):
-                temp[i, k, -1-no] = char2idx[c]
-    return temp   # [文章数, 单词个数, maxlen(每个单词按字符转的id)]
-
-
-def pred2label(pred):
-    # 将预测结果转为标签
-    out = []
-    for pred_i in pred:
-        out_i = []
-        for p in pred_i:
-            out_i.append(idx2tag[p])
-        out.append(out_i)
-    return out
+    real, predicted = [], []
+    start = time.time()
+    for batch_x, batch_char, batch_y in data.batches(batch_size, with_chars=cache is None):
+        feed_dict = {model.word_ids: batch_x, model.keep_prob: 1.0}
+        if cache is None:
+            feed_dict[model.char_ids] = batch_char
+        else:
+            feed_dict[model.char_output] = cache(batch_x)
+        emissions, lengths = sess.run([model.emissions, model.lengths], feed_dict=feed_dict)
+        tag_ids, _ = viterbi_decode(emissions, transitions, lengths)
+        # 窗口补齐的位置不参与评估
+        mask = np.arange(batch_y.shape[1])[None, :] < lengths[:, None]
+        predicted.append(tag_ids[mask])
+        real.append(batch_y[mask])
+    seconds = time.time() - start
+    return np.concatenate(real), np.concatenate(predicted), len(data) / seconds
 
 
 if __name__ == '__main__':
-    left_train, right_train = parse('./data/eng.train')
-    left_test, right_test = parse('./data/eng.testa')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--char_encoder', default='bilstm', choices=['bilstm', 'cnn'])
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--benchmark', action='store_true',
+                        help='bilstm和cnn两种字符编码各训练epochs轮, 比较每秒句子数和eng.testa上的F1 (含缓存字符表示时的F1)')
+    args = parser.parse_args()
+
+    left_train, right_train, sentences_train = parse('./data/eng.train')
+    left_test, right_test, sentences_test = parse('./data/eng.testa')
     # print(left_train[:10])
     # print(right_train[:10])
 
@@ -219,24 +221,16 @@ if __name__ == '__main__':
 
     idx2word = {idx: tag for tag, idx in word2idx.items()}
     idx2tag = {i: w for w, i in tag2idx.items()}
+    pred2label = TagDecoder(idx2tag)   # 将预测结果转为标签 (数组下标一次取出)
 
     seq_len = 50
 
-    X_seq, Y_seq = to_train_seq(train_X, train_Y)   # 长度为50为一个段落
-    X_char_seq = generate_char_seq(X_seq)
-    print(X_seq.shape)  # (203571, 50)
-    print(X_char_seq.shape)  # (203571, 50, 61)
-
-    X_seq_test, Y_seq_test = to_train_seq(test_X, test_Y)
-    X_char_seq_test = generate_char_seq(X_seq_test)
-    print(X_seq_test.shape)   # (51312, 50)
-    print(X_char_seq_test.shape)  # (51312, 50, 27)
-
-    train_X, train_Y, train_char = X_seq, Y_seq, X_char_seq
-    test_X, test_Y, test_char = X_seq_test, Y_seq_test, X_char_seq_test
-
-    tf.reset_default_graph()
-    sess = tf.Session()
+    # 每句话切成不超过50个词的窗口 (不跨句子, 长句按50个词依次切开不重叠, 最后一段可能更短), 字符id按batch现拼
+    char_index = CharIndex(idx2word, char2idx)
+    train_data = NERDataset(train_X, train_Y, sentences_train, char_index, seq_len)
+    test_data = NERDataset(test_X, test_Y, sentences_test, char_index, seq_len)
+    print(len(train_data))  # 14090
+    print(len(test_data))
 
     dim_word = 64
     dim_char = 128
@@ -247,69 +241,58 @@ if __name__ == '__main__':
     num_layers = 2
     batch_size = 32
 
-    model = Model(dim_word, dim_char, dropout, learning_rate,
-                  hidden_size_char, hidden_size_word, num_layers)
-    sess.run(tf.global_variables_initializer())
-
-    for e in range(3):
-        train_acc, train_loss, test_acc, test_loss = 0, 0, 0, 0
-        for i in range(0, len(train_X), batch_size):
-
-            batch_x = train_X[i: min(i + batch_size, train_X.shape[0])]
-            batch_char = train_char[i: min(i + batch_size, train_X.shape[0])]
-            batch_y = train_Y[i: min(i + batch_size, train_X.shape[0])]
-
-            acc, cost, _ = sess.run(
-                [model.accuracy, model.cost, model.optimizer],
-                feed_dict={
-                    model.word_ids: batch_x,
-                    model.char_ids: batch_char,
-                    model.labels: batch_y
-                },
-            )
-            train_loss += cost
-            train_acc += acc
-            print('train_data: epoch:{}, step:{}, loss:{}, accuracy:{}'.format(e, i//batch_size+1, cost, acc))
-
-        for i in range(0, len(test_X), batch_size):
-            batch_x = test_X[i: min(i + batch_size, test_X.shape[0])]
-            batch_char = test_char[i: min(i + batch_size, test_X.shape[0])]
-            batch_y = test_Y[i: min(i + batch_size, test_X.shape[0])]
-            acc, cost = sess.run(
-                [model.accuracy, model.cost],
-                feed_dict={
-                    model.word_ids: batch_x,
-                    model.char_ids: batch_char,
-                    model.labels: batch_y
-                },
-            )
-            test_loss += cost
-            test_acc += acc
-            print('test_data: epoch:{}, step:{}, loss:{}, accuracy:{}'.format(e, i//batch_size+1, cost, acc))
-
-        train_loss /= len(train_X) / batch_size
-        train_acc /= len(train_X) / batch_size
-        test_loss /= len(test_X) / batch_size
-        test_acc /= len(test_X) / batch_size
-
-        print('epoch: %d, training loss: %f, training acc: %f, valid loss: %f, valid acc: %f\n'
-              % (e, train_loss, train_acc, test_loss, test_acc))
-
-    real_Y, predict_Y = [], []
-    for i in range(0, len(test_X), batch_size):
-        batch_x = test_X[i: min(i + batch_size, test_X.shape[0])]
-        batch_char = test_char[i: min(i + batch_size, test_X.shape[0])]
-        batch_y = test_Y[i: min(i + batch_size, test_X.shape[0])]
-        predicted = pred2label(
-            sess.run(model.tags_seq,
-                     feed_dict={
-                         model.word_ids: batch_x,
-                         model.char_ids: batch_char,
-                     },
-                     )
-        )
-        real = pred2label(batch_y)
-        predict_Y.extend(predicted)
-        real_Y.extend(real)
-
-    print(classification_report(np.array(real_Y).ravel(), np.array(predict_Y).ravel()))
\ No newline at end of file
+    # 实体标签 (去掉PAD和O) 上的micro F1
+    entity_tags = [i for w, i in tag2idx.items() if w not in ('PAD', 'O')]
+    results = []
+    for char_encoder in (['bilstm', 'cnn'] if args.benchmark else [args.char_encoder]):
+        tf.reset_default_graph()
+        sess = tf.Session()
+
+        model = Model(dim_word, dim_char, dropout, learning_rate,
+                      hidden_size_char, hidden_size_word, num_layers, char_encoder)
+        sess.run(tf.global_variables_initializer())
+
+        for e in range(args.epochs):
+            train_loss, train_acc, train_speed = run_epoch(sess, model, train_data, batch_size, e, train=True)
+            test_loss, test_acc, _ = run_epoch(sess, model, test_data, batch_size, e)
+
+            print('epoch: %d, training loss: %f, training acc: %f, valid loss: %f, valid acc: %f\n'
+                  % (e, train_loss, train_acc, test_loss, test_acc))
+
+        # 转移矩阵单独保存, 测试集用numpy的Viterbi整批解码 (和图里的crf_decode结果一致)
+        transitions = sess.run(model.transition_params)
+        real_Y, predict_Y, predict_speed = predict(sess, model, test_data, batch_size, transitions)
+        f1 = f1_score(real_Y, predict_Y, labels=entity_tags, average='micro')
+
+        if args.benchmark:
+            # 第一遍把测试集里的词填进缓存, 第二遍是缓存命中后的速度
+            cache = CharEmbeddingCache(sess, model.char_ids, model.char_output, char_index, len(word2idx),
+                                       feed_dict={model.keep_prob: 1.0})
+            predict(sess, model, test_data, batch_size, transitions, cache)
+            _, cached_Y, cached_speed = predict(sess, model, test_data, batch_size, transitions, cache)
+            cached_f1 = f1_score(real_Y, cached_Y, labels=entity_tags, average='micro')
+            # 缓存只是换了算字符表示的方式, 预测结果应该和不缓存时一样
+            n_diff = int((cached_Y != predict_Y).sum())
+            if n_diff:
+                print('%s: %d tags differ between the cached and uncached paths' % (char_encoder, n_diff))
+            results.append((char_encoder, train_speed, predict_speed, cached_speed, f1, cached_f1))
+            sess.close()
+
+    if args.benchmark:
+        print('%-8s %14s %14s %16s %8s %10s' % ('encoder', 'train sent/s', 'infer sent/s', 'cached sent/s', 'F1',
+                                                'cached F1'))
+        for char_encoder, train_speed, predict_speed, cached_speed, f1, cached_f1 in results:
+            print('%-8s %14.1f %14.1f %16.1f %8.4f %10.4f' % (char_encoder, train_speed, predict_speed, cached_speed,
+                                                              f1, cached_f1))
+        sys.exit(0)
+
+    save_crf('./ner_crf.npz', transitions, idx2tag)
+    print(classification_report(pred2label(real_Y), pred2label(predict_Y)))
+    print('entity F1: %f' % f1)
+
+    # 导出CRF解码的推理图
+    export_saved_model(sess, './export/ner', {
+        'tags_seq': ({'word_ids': model.word_ids, 'char_ids': model.char_ids}, {'tags_seq': model.tags_seq}),
+        'emissions': ({'word_ids': model.word_ids, 'char_ids': model.char_ids},
+                      {'emissions': model.emissions, 'lengths': model.lengths}),
+    }, fixed={model.keep_prob: 1.0})
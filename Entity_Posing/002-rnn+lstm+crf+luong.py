@@ -11,10 +11,14 @@ import re
 import numpy as np
 import tensorflow as tf
 from sklearn.metrics import classification_report
+from crf import TagDecoder, save_crf, viterbi_decode
+from ner_data import parse, CharIndex, NERDataset
+from char_encoder import char_lengths, encode_chars
 
 
 class Model:
-    def __init__(self, dim_word, dim_char, dropout, learning_rate, hidden_size_char, hidden_size_word, num_layers):
+    def __init__(self, dim_word, dim_char, dropout, learning_rate, hidden_size_char, hidden_size_word, num_layers,
+                 char_encoder='bilstm'):
         def cells(size, reuse=False):
             return tf.contrib.rnn.DropoutWrapper(
                 tf.nn.rnn_cell.LSTMCell(size, initializer=tf.orthogonal_initializer(), reuse=reuse),
@@ -43,22 +47,11 @@ class Model:
         word_embedded = tf.nn.embedding_lookup(self.word_embeddings, self.word_ids)
         char_embedded = tf.nn.embedding_lookup(self.char_embeddings, self.char_ids)
 
-        s = tf.shape(char_embedded)
-        char_embedded = tf.reshape(char_embedded, shape=[s[0] * s[1], s[-2], dim_char])
-
-        for n in range(num_layers):
-            (out_fw, out_bw), (state_fw, state_bw) = tf.nn.bidirectional_dynamic_rnn(
-                cell_fw=cells(hidden_size_char),
-                cell_bw=cells(hidden_size_char),
-                inputs=char_embedded,
-                dtype=tf.float32,
-                scope='bidirectional_rnn_char_%d' % n
-            )
-            char_embedded = tf.concat((out_fw, out_bw), 2)
-
-        output = tf.reshape(char_embedded[:, -1], shape=[s[0], s[1], 2 * hidden_size_char])
-
-        word_embedded = tf.concat([word_embedded, output], axis=-1)
+        # 字符表示  推理时可以直接喂model.char_output (CharEmbeddingCache), 跳过字符编码
+        self.char_lengths = char_lengths(self.char_ids)
+        self.char_output = encode_chars(char_embedded, self.char_lengths, char_encoder, 2 * hidden_size_char,
+                                        num_layers, cells)
+        word_embedded = tf.concat([word_embedded, self.char_output], axis=-1)
 
         for n in range(num_layers):
             (out_fw, out_bw), (state_fw,state_bw) = tf.nn.bidirectional_dynamic_rnn(
@@ -81,6 +74,9 @@ class Model:
             logits, transition_params, self.lengths
         )
         self.tags_seq = tf.identity(self.tags_seq, name='logits')
+        # 发射分数和转移矩阵  线上只跑到emissions, 解码用crf.py, 不需要训练图里的CRF
+        self.emissions = tf.identity(logits, name='emissions')
+        self.transition_params = transition_params
 
         y_t = tf.cast(y_t, tf.int32)
         self.prediction = tf.boolean_mask(self.tags_seq, mask)
@@ -90,25 +86,6 @@ class Model:
         self.accuracy = tf.reduce_mean(tf.cast(correct_pred, tf.float32))
 
 
-def parse(file):
-    '''
-    加载文件并且解析
-    :param file: 文件名
-    :return: 词<->词性
-    '''
-    with open(file) as fopen:
-        texts = fopen.read().split('\n')
-
-    left, right = [], []
-    for text in texts:
-        if '-DOCSTART' in text or not len(text):
-            continue
-        splitted = text.split()
-        left.append(splitted[0])
-        right.append(splitted[-1])
-    return left, right
-
-
 def process_string(string):
     '''
     :param string:
@@ -151,50 +128,9 @@ def parse_XY(texts, labels):
     return X, np.array(Y)
 
 
-def iter_seq(x):
-    return np.array([x[i: i+seq_len] for i in range(0, len(x)-seq_len, 1)])
-
-
-def to_train_seq(*args):
-    '''
-    :param args:  词转为的id的序列　　　词性转为id的序列
-    :return:
-    '''
-    return [iter_seq(x) for x in args]
-
-
-def generate_char_seq(batch):
-    '''
-    传进来是50一个块　总共有多少块
-    然后将每块的单词转为字符序列
-    :param batch:
-    :return:
-    '''
-    x = [[len(idx2word[i]) for i in k] for k in batch]  # 得出每个单词的长度
-    maxlen = max([j for i in x for j in i])  # 最大长度
-    temp = np.zeros((batch.shape[0], batch.shape[1], maxlen), dtype=np.int32)
-
-    for i in range(batch.shape[0]):
-        for k in range(batch.shape[1]):
-            for no, c in enumerate(idx2word[batch[i, k]]):
-                temp[i, k, -1-no] = char2idx[c]
-    return temp   # [文章数, 单词个数, maxlen(每个单词按字符转的id)]
-
-
-def pred2label(pred):
-    # 将预测结果转为标签
-    out = []
-    for pred_i in pred:
-        out_i = []
-        for p in pred_i:
-            out_i.append(idx2tag[p])
-        out.append(out_i)
-    return out
-
-
 if __name__ == '__main__':
-    left_train, right_train = parse('./data/eng.train')
-    left_test, right_test = parse('./data/eng.testa')
+    left_train, right_train, sentences_train = parse('./data/eng.train')
+    left_test, right_test, sentences_test = parse('./data/eng.testa')
     # print(left_train[:10])
     # print(right_train[:10])
 
@@ -212,21 +148,16 @@ if __name__ == '__main__':
 
     idx2word = {idx: tag for tag, idx in word2idx.items()}
     idx2tag = {i: w for w, i in tag2idx.items()}
+    pred2label = TagDecoder(idx2tag)   # 将预测结果转为标签 (数组下标一次取出)
 
     seq_len = 50
 
-    X_seq, Y_seq = to_train_seq(train_X, train_Y)   # 长度为50为一个段落
-    X_char_seq = generate_char_seq(X_seq)
-    print(X_seq.shape)  # (203571, 50)
-    print(X_char_seq.shape)  # (203571, 50, 61)
-
-    X_seq_test, Y_seq_test = to_train_seq(test_X, test_Y)
-    X_char_seq_test = generate_char_seq(X_seq_test)
-    print(X_seq_test.shape)   # (51312, 50)
-    print(X_char_seq_test.shape)  # (51312, 50, 27)
-
-    train_X, train_Y, train_char = X_seq, Y_seq, X_char_seq
-    test_X, test_Y, test_char = X_seq_test, Y_seq_test, X_char_seq_test
+    # 每句话切成不超过50个词的窗口 (不跨句子, 长句按50个词依次切开不重叠, 最后一段可能更短), 字符id按batch现拼
+    char_index = CharIndex(idx2word, char2idx)
+    train_data = NERDataset(train_X, train_Y, sentences_train, char_index, seq_len)
+    test_data = NERDataset(test_X, test_Y, sentences_test, char_index, seq_len)
+    print(len(train_data))  # 14090
+    print(len(test_data))
 
     tf.reset_default_graph()
     sess = tf.Session()
@@ -238,20 +169,16 @@ if __name__ == '__main__':
     hidden_size_char = 128
     hidden_size_word = 128
     num_layers = 2
+    char_encoder = 'bilstm'   # 'bilstm' 或 'cnn'
     batch_size = 128
 
     model = Model(dim_word, dim_char, dropout, learning_rate,
-                  hidden_size_char, hidden_size_word, num_layers)
+                  hidden_size_char, hidden_size_word, num_layers, char_encoder)
     sess.run(tf.global_variables_initializer())
 
     for e in range(3):
         train_acc, train_loss, test_acc, test_loss = 0, 0, 0, 0
-        for i in range(0, len(train_X), batch_size):
-
-            batch_x = train_X[i: min(i + batch_size, train_X.shape[0])]
-            batch_char = train_char[i: min(i + batch_size, train_X.shape[0])]
-            batch_y = train_Y[i: min(i + batch_size, train_X.shape[0])]
-
+        for step, (batch_x, batch_char, batch_y) in enumerate(train_data.batches(batch_size, shuffle=True)):
             acc, cost, _ = sess.run(
                 [model.accuracy, model.cost, model.optimizer],
                 feed_dict={
@@ -262,12 +189,9 @@ if __name__ == '__main__':
             )
             train_loss += cost
             train_acc += acc
-            print('train_data: epoch:{}, step:{}, loss:{}, accuracy:{}'.format(e, i//batch_size+1, cost, acc))
+            print('train_data: epoch:{}, step:{}, loss:{}, accuracy:{}'.format(e, step+1, cost, acc))
 
-        for i in range(0, len(test_X), batch_size):
-            batch_x = test_X[i: min(i + batch_size, test_X.shape[0])]
-            batch_char = test_char[i: min(i + batch_size, test_X.shape[0])]
-            batch_y = test_Y[i: min(i + batch_size, test_X.shape[0])]
+        for step, (batch_x, batch_char, batch_y) in enumerate(test_data.batches(batch_size)):
             acc, cost = sess.run(
                 [model.accuracy, model.cost],
                 feed_dict={
@@ -278,31 +202,32 @@ if __name__ == '__main__':
             )
             test_loss += cost
             test_acc += acc
-            print('test_data: epoch:{}, step:{}, loss:{}, accuracy:{}'.format(e, i//batch_size+1, cost, acc))
+            print('test_data: epoch:{}, step:{}, loss:{}, accuracy:{}'.format(e, step+1, cost, acc))
 
-        train_loss /= len(train_X) / batch_size
-        train_acc /= len(train_X) / batch_size
-        test_loss /= len(test_X) / batch_size
-        test_acc /= len(test_X) / batch_size
+        train_loss /= len(train_data) / batch_size
+        train_acc /= len(train_data) / batch_size
+        test_loss /= len(test_data) / batch_size
+        test_acc /= len(test_data) / batch_size
 
         print('epoch: %d, training loss: %f, training acc: %f, valid loss: %f, valid acc: %f\n'
               % (e, train_loss, train_acc, test_loss, test_acc))
 
-    real_Y, predict_Y = [], []
-    for i in range(0, len(test_X), batch_size):
-        batch_x = test_X[i: min(i + batch_size, test_X.shape[0])]
-        batch_char = test_char[i: min(i + batch_size, test_X.shape[0])]
-        batch_y = test_Y[i: min(i + batch_size, test_X.shape[0])]
-        predicted = pred2label(
-            sess.run(model.tags_seq,
-                     feed_dict={
-                         model.word_ids: batch_x,
-                         model.char_ids: batch_char,
-                     },
-                     )
-        )
-        real = pred2label(batch_y)
-        predict_Y.extend(predicted)
-        real_Y.extend(real)
+    # 转移矩阵单独保存, 测试集用numpy的Viterbi整批解码 (和图里的crf_decode结果一致)
+    transitions = sess.run(model.transition_params)
+    save_crf('./ner_crf.npz', transitions, idx2tag)
 
-    print(classification_report(np.array(real_Y).ravel(), np.array(predict_Y).ravel()))
\ No newline at end of file
+    real_Y, predict_Y = [], []
+    for batch_x, batch_char, batch_y in test_data.batches(batch_size):
+        emissions, lengths = sess.run([model.emissions, model.lengths],
+                                      feed_dict={
+                                          model.word_ids: batch_x,
+                                          model.char_ids: batch_char,
+                                      },
+                                      )
+        tag_ids, _ = viterbi_decode(emissions, transitions, lengths)
+        # 窗口补齐的位置不参与评估
+        mask = np.arange(batch_y.shape[1])[None, :] < lengths[:, None]
+        predict_Y.append(pred2label(tag_ids[mask]))
+        real_Y.append(pred2label(batch_y[mask]))
+
+    print(classification_report(np.concatenate(real_Y), np.concatenate(predict_Y)))
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+
+@file  : char_encoder.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+NER模型中由字符得到词表示的部分
+    bilstm: 原来的做法, 每个词的字符过num_layers层双向LSTM, 取最后一个真实字符位置的输出
+    cnn: 和ELMo的char_level_token_encoder一样, 多种宽度的卷积 + 按字符取max + highway + 线性投影
+         字符之间没有递归, 一个batch的所有词并行算完
+    两种编码都只看每个词的真实字符 (bilstm用sequence_length, cnn把补齐位置置0并排除在max之外),
+    所以同一个词不管补齐到多宽, 得到的表示都一样  CharEmbeddingCache的结果和不缓存时一致
+CharEmbeddingCache: 推理时每个词的字符表示只算一次, 重复出现的词直接查表
+
+"""
+import numpy as np
+import tensorflow as tf
+
+# (卷积宽度, 卷积核个数)
+CNN_FILTERS = ((1, 32), (2, 32), (3, 64), (4, 128), (5, 256))
+
+
+def add_highway(x, size, i):
+    H = tf.layers.dense(x, size, tf.nn.relu, name='char_highway_activation' + str(i))
+    T = tf.layers.dense(x, size, tf.sigmoid, name='char_highway_transform_gate' + str(i))
+    return H * T + x * (1.0 - T)
+
+
+def char_lengths(char_ids):
+    '''
+    每个词的字符数  字符从左边放起, 取最后一个非0字符的位置 + 1
+    :param char_ids: [batch, words, chars]
+    :return: [batch, words] int32
+    '''
+    positions = tf.range(1, tf.shape(char_ids)[-1] + 1)
+    return tf.reduce_max(positions * tf.cast(char_ids > 0, tf.int32), axis=-1)
+
+
+def encode_chars(char_embedded, lengths, encoder, output_size, num_layers=2, cells=None, filters=CNN_FILTERS,
+                 n_highway=2):
+    '''
+    :param char_embedded: [batch, words, chars, dim_char]
+    :param lengths: [batch, words]  每个词的字符数 (char_lengths)
+    :param encoder: 'bilstm' 或 'cnn'
+    :param output_size: 每个词的字符表示的维度
+    :param num_layers: bilstm的层数
+    :param cells: bilstm用的 cells(size) 函数
+    :param filters: cnn的 (宽度, 卷积核个数)
+    :param n_highway: cnn后面的highway层数
+    :return: [batch, words, output_size]
+    '''
+    dim_char = char_embedded.shape[-1].value
+    s = tf.shape(char_embedded)
+    char_embedded = tf.reshape(char_embedded, shape=[s[0] * s[1], s[-2], dim_char])
+    lengths = tf.reshape(lengths, [-1])
+    # 补齐位置的输入置0  [words, chars, 1]
+    mask = tf.expand_dims(tf.sequence_mask(lengths, s[-2], dtype=tf.float32), -1)
+    char_embedded = char_embedded * mask
+
+    if encoder == 'bilstm':
+        for n in range(num_layers):
+            (out_fw, out_bw), (state_fw, state_bw) = tf.nn.bidirectional_dynamic_rnn(
+                cell_fw=cells(output_size // 2),
+                cell_bw=cells(output_size // 2),
+                inputs=char_embedded,
+                sequence_length=lengths,
+                dtype=tf.float32,
+                scope='bidirectional_rnn_char_%d' % n
+            )
+            char_embedded = tf.concat((out_fw, out_bw), 2)
+        # 最后一个真实字符位置的输出  没有字符的词 (PAD) 是0
+        last = tf.stack([tf.range(tf.shape(lengths)[0]), tf.maximum(lengths - 1, 0)], axis=1)
+        output = tf.gather_nd(char_embedded, last)
+    elif encoder == 'cnn':
+        token_embeds = []
+        for width, n_filters in filters:
+            convs = tf.layers.conv1d(char_embedded, n_filters, width, padding='same', name='char_conv_%d' % width)
+            convs -= (1.0 - mask) * 1e9   # 补齐位置不参与max
+            token_embeds.append(tf.tanh(tf.reduce_max(convs, axis=1)))   # 每个卷积核在所有真实字符位置上取最大
+        output = tf.concat(token_embeds, axis=-1)
+        size = sum(n for _, n in filters)
+        for i in range(n_highway):
+            output = add_highway(output, size, i)
+        output = tf.layers.dense(output, output_size, name='char_projection')
+    else:
+        raise ValueError('unknown char encoder: %s' % encoder)
+    return tf.reshape(output, shape=[s[0], s[1], output_size])
+
+
+class CharEmbeddingCache(object):
+    def __init__(self, sess, char_ids, char_output, char_index, vocab_size, feed_dict=None):
+        '''
+        :param sess:
+        :param char_ids: 模型的字符输入 [batch, words, chars]
+        :param char_output: 模型中encode_chars的输出 [batch, words, output_size]  推理时直接喂这个张量, 跳过字符编码
+        :param char_index: CharIndex
+        :param vocab_size: 词表大小
+        :param feed_dict: 编码时额外喂的值  如 {model.keep_prob: 1.0}
+        '''
+        self.sess = sess
+        self.feed_dict = feed_dict or {}
+        self.char_ids = char_ids
+        self.char_output = char_output
+        self.char_index = char_index
+        self.table = np.zeros((vocab_size, char_output.shape[-1].value), dtype=np.float32)
+        self.filled = np.zeros(vocab_size, dtype=bool)
+        self.hits = self.misses = 0
+
+    def __call__(self, word_ids, batch_size=1024):
+        '''
+        :param word_ids: [batch, words]
+        :return: [batch, words, output_size]  作为 feed_dict={model.char_output: ...}
+        '''
+        unique = np.unique(word_ids)
+        missing = unique[~self.filled[unique]]
+        self.misses += len(missing)
+        self.hits += len(unique) - len(missing)
+        for i in range(0, len(missing), batch_size):
+            # 每个词当成长度为1的句子, 只跑字符编码这部分
+            words = missing[i: i + batch_size, None]
+            feed_dict = dict(self.feed_dict)
+            feed_dict[self.char_ids] = self.char_index(words)
+            self.table[words[:, 0]] = self.sess.run(self.char_output, feed_dict=feed_dict)[:, 0]
+        self.filled[missing] = True
+        return self.table[word_ids]
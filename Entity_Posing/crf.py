@@ -0,0 +1,143 @@
+"""
+
+@file  : crf.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+CRF推理  训练好的转移矩阵单独保存, 解码不需要重建训练图
+    viterbi_decode: [batch, time, tags] 的发射分数整批解码, 超出长度的位置不参与
+    viterbi_nbest: 每句返回分数最高的n条标签序列
+    build_tf_decoder: 只包含解码的小图 (placeholder + 常量转移矩阵), 给TF serving用
+    TagDecoder: 标签id到标签名用数组下标一次取出, 不再逐个查字典
+
+"""
+import numpy as np
+
+
+def viterbi_decode(emissions, transitions, lengths=None):
+    """
+    :param emissions: [batch, time, n_tags]  每个位置每个标签的分数 (模型的logits)
+    :param transitions: [n_tags, n_tags]  transitions[i, j] 为从标签i转到标签j的分数
+    :param lengths: [batch]  None表示都是满长度
+    :return: tags [batch, time] (超出长度的位置为0), scores [batch]
+    """
+    emissions = np.asarray(emissions, dtype=np.float32)
+    batch, time, n_tags = emissions.shape
+    lengths = np.full(batch, time) if lengths is None else np.asarray(lengths)
+    backpointers = np.zeros((batch, time, n_tags), dtype=np.int32)
+    identity = np.arange(n_tags, dtype=np.int32)
+
+    score = emissions[:, 0]
+    for t in range(1, time):
+        # [batch, prev, next]
+        candidates = score[:, :, None] + transitions[None]
+        best_prev = candidates.argmax(axis=1).astype(np.int32)
+        new_score = np.take_along_axis(candidates, best_prev[:, None, :], axis=1)[:, 0] + emissions[:, t]
+        # 超出长度的位置分数不变, 回溯指针指向自己
+        active = (t < lengths)[:, None]
+        score = np.where(active, new_score, score)
+        backpointers[:, t] = np.where(active, best_prev, identity)
+
+    tags = np.zeros((batch, time), dtype=np.int32)
+    tags[:, -1] = score.argmax(axis=1)
+    best_score = score.max(axis=1)
+    for t in range(time - 1, 0, -1):
+        tags[:, t - 1] = np.take_along_axis(backpointers[:, t], tags[:, t, None], axis=1)[:, 0]
+    tags[np.arange(time)[None, :] >= lengths[:, None]] = 0
+    return tags, best_score
+
+
+def viterbi_nbest(emissions, transitions, lengths=None, n=3):
+    """
+    N-best Viterbi: 每个位置每个标签保留前n条路径
+    :return: tags [batch, n, time], scores [batch, n]  按分数从高到低
+    """
+    emissions = np.asarray(emissions, dtype=np.float32)
+    batch, time, n_tags = emissions.shape
+    lengths = np.full(batch, time) if lengths is None else np.asarray(lengths)
+
+    # score[b, tag, k]: 以tag结尾的第k好的路径分数  一开始只有一条路径, 其余为-inf
+    score = np.full((batch, n_tags, n), -np.inf, dtype=np.float32)
+    score[:, :, 0] = emissions[:, 0]
+    # 回溯指针: 上一步的 (标签, 名次) 编码成 标签 * n + 名次
+    backpointers = np.zeros((batch, time, n_tags, n), dtype=np.int32)
+    identity = np.broadcast_to(np.arange(n_tags)[:, None] * n + np.arange(n)[None, :], (n_tags, n))
+
+    for t in range(1, time):
+        # [batch, prev * n, next]
+        candidates = (score[:, :, :, None] + transitions[None, :, None, :]).reshape(batch, n_tags * n, n_tags)
+        top = np.argsort(-candidates, axis=1, kind='stable')[:, :n]          # [batch, n, next]
+        new_score = np.take_along_axis(candidates, top, axis=1) + emissions[:, t, None, :]
+        active = (t < lengths)[:, None, None]
+        score = np.where(active, new_score.transpose(0, 2, 1), score)
+        backpointers[:, t] = np.where(active, top.transpose(0, 2, 1), identity)
+
+    # 最后一步在所有 (标签, 名次) 中取前n
+    flat = score.reshape(batch, n_tags * n)
+    last = np.argsort(-flat, axis=1, kind='stable')[:, :n]                 # [batch, n]
+    best_scores = np.take_along_axis(flat, last, axis=1)
+    tags = np.zeros((batch, n, time), dtype=np.int32)
+    state = last
+    for t in range(time - 1, -1, -1):
+        tags[:, :, t] = state // n
+        if t > 0:
+            pointers = backpointers[:, t].reshape(batch, n_tags * n)
+            state = np.take_along_axis(pointers, state, axis=1)
+    tags[np.broadcast_to(np.arange(time)[None, None, :] >= lengths[:, None, None], tags.shape)] = 0
+    return tags, best_scores
+
+
+class TagDecoder(object):
+    def __init__(self, idx2tag):
+        # idx2tag: {id: 标签名}
+        self.tags = np.array([idx2tag[i] for i in range(len(idx2tag))], dtype=object)
+
+    def __call__(self, tag_ids, lengths=None):
+        """
+        :param tag_ids: [batch, time]
+        :param lengths: None时返回 [batch, time] 的标签名数组; 否则返回按长度截断的 list of list
+        """
+        names = self.tags[np.asarray(tag_ids)]
+        if lengths is None:
+            return names
+        return [row[:length].tolist() for row, length in zip(names, lengths)]
+
+
+def save_crf(path, transitions, idx2tag):
+    # 转移矩阵和标签表存在一起  解码端只依赖numpy
+    np.savez(path, transitions=np.asarray(transitions, dtype=np.float32),
+             tags=np.array([idx2tag[i] for i in range(len(idx2tag))]))
+
+
+class CRFDecoder(object):
+    def __init__(self, transitions, tags):
+        self.transitions = np.asarray(transitions, dtype=np.float32)
+        self.tag_decoder = TagDecoder(dict(enumerate(tags)))
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        return cls(arrays['transitions'], arrays['tags'].tolist())
+
+    def decode(self, emissions, lengths=None, nbest=1):
+        """
+        :return: nbest=1时 (tag_ids [batch, time], 标签名), 否则 (tag_ids [batch, nbest, time], scores)
+        """
+        if nbest > 1:
+            return viterbi_nbest(emissions, self.transitions, lengths, nbest)
+        tag_ids, _ = viterbi_decode(emissions, self.transitions, lengths)
+        return tag_ids, self.tag_decoder(tag_ids, lengths)
+
+
+def build_tf_decoder(transitions):
+    """
+    只包含CRF解码的图  输入发射分数和长度, 转移矩阵作为常量
+    :return: emissions placeholder, lengths placeholder, tags_seq, best_score
+    """
+    import tensorflow as tf
+    emissions = tf.placeholder(tf.float32, [None, None, transitions.shape[0]], name='emissions')
+    lengths = tf.placeholder(tf.int32, [None], name='lengths')
+    tags_seq, best_score = tf.contrib.crf.crf_decode(emissions, tf.constant(transitions, dtype=tf.float32), lengths)
+    return emissions, lengths, tags_seq, best_score
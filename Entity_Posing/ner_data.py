@@ -0,0 +1,124 @@
+"""
+
+@file  : ner_data.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+NER的数据管道
+    parse: 按 -DOCSTART / 空行 切句子, 返回拉平的词和标签以及每句的起点
+    sentence_windows: 窗口不跨句子, 长句按stride切成多个窗口 (stride=seq_len 时不重叠, 最后一个窗口可能不足seq_len)
+    CharIndex: 词表里每个词的字符id只算一次, 存成 (offsets, chars) 的不定长数组
+    NERDataset: 按batch现拼 词id / 标签 / 字符id, 只补齐到这个batch里最长的句子和最长的词
+
+"""
+import numpy as np
+
+
+def parse(file):
+    '''
+    加载文件并且解析
+    :param file: 文件名
+    :return: 词, 词性, 每句话在词列表中的起点 (最后多一个总词数)
+    '''
+    left, right, offsets = [], [], [0]
+    with open(file) as fopen:
+        for text in fopen:
+            text = text.strip()
+            if '-DOCSTART' in text or not len(text):
+                if len(left) > offsets[-1]:
+                    offsets.append(len(left))
+                continue
+            splitted = text.split()
+            left.append(splitted[0])
+            right.append(splitted[-1])
+    if len(left) > offsets[-1]:
+        offsets.append(len(left))
+    return left, right, np.array(offsets, dtype=np.int64)
+
+
+def sentence_windows(offsets, seq_len=50, stride=None):
+    '''
+    :param offsets: 每句话的起点
+    :param seq_len: 窗口最大长度
+    :param stride: 长句的窗口步长  None表示等于seq_len (不重叠, 每个词只出现在一个窗口里, 评估时不会重复计数)
+        小于seq_len时相邻窗口重叠, 只适合训练
+    :return: starts, lengths  每个窗口在拉平的词序列中的起点和长度
+    '''
+    stride = stride or seq_len
+    starts, lengths = [], []
+    for begin, end in zip(offsets[:-1], offsets[1:]):
+        # 盖到句尾的窗口就是最后一个  句尾剩下的部分单独成一个较短的窗口, 不往前挪
+        window_starts = list(range(begin, max(end - seq_len, begin), stride))
+        window_starts.append(window_starts[-1] + stride if window_starts else begin)
+        starts.extend(window_starts)
+        lengths.extend(min(seq_len, end - s) for s in window_starts)
+    return np.array(starts, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+
+class CharIndex(object):
+    def __init__(self, idx2word, char2idx):
+        '''
+        词表中每个词的字符id  第i个词是 chars[offsets[i]: offsets[i + 1]]
+        PAD(0)没有字符; 字符表里没有的字符记为0
+        '''
+        words = [idx2word[i] if i else '' for i in range(len(idx2word))]
+        self.lengths = np.array([len(w) for w in words], dtype=np.int64)
+        self.offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.chars = np.array([char2idx.get(c, 0) for w in words for c in w], dtype=np.int32)
+
+    def __call__(self, word_ids):
+        '''
+        :param word_ids: [batch, time]
+        :return: [batch, time, 这个batch里最长的词]  每个词倒序从最左边放起, 右边补0
+            (字符编码按长度取最后一个真实位置, 补齐到多宽结果都一样)
+        '''
+        flat = np.asarray(word_ids).ravel()
+        lengths = self.lengths[flat]
+        maxlen = max(int(lengths.max()) if len(lengths) else 0, 1)
+        temp = np.zeros((len(flat), maxlen), dtype=np.int32)
+        rows = np.repeat(np.arange(len(flat)), lengths)
+        no = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        temp[rows, lengths[rows] - 1 - no] = self.chars[np.repeat(self.offsets[flat], lengths) + no]
+        return temp.reshape(np.shape(word_ids) + (maxlen,))
+
+
+class NERDataset(object):
+    def __init__(self, word_ids, tag_ids, offsets, char_index, seq_len=50, stride=None):
+        '''
+        :param word_ids: 拉平的词id
+        :param tag_ids: 拉平的标签id
+        :param offsets: 每句话的起点 (parse的输出)
+        :param char_index: CharIndex
+        :param seq_len: 窗口最大长度
+        :param stride: 长句的窗口步长
+        '''
+        self.word_ids = np.asarray(word_ids, dtype=np.int32)
+        self.tag_ids = np.asarray(tag_ids, dtype=np.int32)
+        self.char_index = char_index
+        self.starts, self.lengths = sentence_windows(offsets, seq_len, stride)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def batch(self, index, with_chars=True):
+        '''
+        :param index: 窗口的下标
+        :param with_chars: False时不拼字符id (推理时用CharEmbeddingCache)
+        :return: 词id [batch, time], 字符id [batch, time, word_len], 标签 [batch, time]  time为这批里最长的窗口, 不足补0
+        '''
+        lengths = self.lengths[index]
+        time = int(lengths.max())
+        positions = self.starts[index][:, None] + np.arange(time)[None, :]
+        mask = np.arange(time)[None, :] < lengths[:, None]
+        positions = np.where(mask, positions, 0)
+        batch_x = np.where(mask, self.word_ids[positions], 0)
+        batch_y = np.where(mask, self.tag_ids[positions], 0)
+        return batch_x, self.char_index(batch_x) if with_chars else None, batch_y
+
+    def batches(self, batch_size, shuffle=False, rng=np.random, with_chars=True):
+        order = rng.permutation(len(self)) if shuffle else np.arange(len(self))
+        for i in range(0, len(order), batch_size):
+            yield self.batch(order[i: i + batch_size], with_chars)
@@ -8,12 +8,15 @@
 
 """
 import json
-from sklearn.utils import shuffle
 import tensorflow as tf
 import collections
 from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import TruncatedSVD
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.bucketing import BucketSampler, gather
 
 
 class Summarization:
@@ -239,20 +242,20 @@ if __name__ == '__main__':
     model = Summarization(size_layer, num_layers, embedded_size, len(vocab2id_from), len(vocab2id_to))
     sess.run(tf.global_variables_initializer())
 
+    # 长度相近的文章放在同一批次  减少补齐
+    train_sampler = BucketSampler(x_train, y_train, batch_size=batch_size)
+    test_sampler = BucketSampler(x_test, y_test, batch_size=batch_size)
+    print(len(x_train))   # 3516
+    print(len(x_test))   # 879
+    print('补齐浪费比例:', train_sampler.report())
+
     # 开始训练
     for epoch in range(10):
         total_loss, total_accuracy, total_loss_test, total_accuracy_test = 0, 0, 0, 0
-        x_train, y_train = shuffle(x_train, y_train)
-        print(len(x_train))   # 3516
-        print(len(y_train))   # 3516
-        print("*"*100)
-        x_test, y_test = shuffle(x_test, y_test)
-        print(len(x_test))   # 879
-        print(len(y_test))   # 879
-
-        for k in range(0, len(x_train), batch_size):
-            batch_x, _ = pad_sentence_batch(x_train[k: min(k + batch_size, len(x_train))], PAD)
-            batch_y, _ = pad_sentence_batch(y_train[k: min(k + batch_size, len(x_train))], PAD)
+
+        for step, batch_ids in enumerate(train_sampler):
+            batch_x, _ = pad_sentence_batch(gather(x_train, batch_ids), PAD)
+            batch_y, _ = pad_sentence_batch(gather(y_train, batch_ids), PAD)
 
             acc, loss, _ = sess.run([model.accuracy, model.cost, model.optimizer],
                                     feed_dict={model.X: batch_x, model.Y: batch_y})
@@ -260,19 +263,19 @@ if __name__ == '__main__':
             total_loss += loss
             total_accuracy += loss
             print("当前epoch:{}, 当前batch:{}, 损失:{}, 准确率:{}, 这是训练集上的表现".format(
-                epoch, k//batch_size, loss, acc
+                epoch, step, loss, acc
             ))
 
-        for k in range(0, len(x_test), batch_size):
-            batch_x, _ = pad_sentence_batch(x_test[k: min(k + batch_size, len(x_test))], PAD)
-            batch_y, _ = pad_sentence_batch(y_test[k: min(k + batch_size, len(y_test))], PAD)
+        for step, batch_ids in enumerate(test_sampler):
+            batch_x, _ = pad_sentence_batch(gather(x_test, batch_ids), PAD)
+            batch_y, _ = pad_sentence_batch(gather(y_test, batch_ids), PAD)
             acc, loss = sess.run([model.accuracy, model.cost],
                                  feed_dict={model.X: batch_x, model.Y: batch_y})
 
             total_loss_test += loss
             total_accuracy_test += acc
             print("当前epoch:{}, 当前batch:{}, 损失:{}, 准确率:{}, 这是测试集上的表现".format(
-                epoch, k // batch_size, loss, acc
+                epoch, step, loss, acc
             ))
 
             # 对测试集进行预测
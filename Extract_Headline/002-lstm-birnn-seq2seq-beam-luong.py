@@ -14,8 +14,11 @@ from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import TruncatedSVD
 from tqdm import tqdm
-from sklearn.utils import shuffle
 import time
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.bucketing import BucketSampler, gather
 
 
 class Summarization:
@@ -292,15 +295,17 @@ if __name__ == '__main__':
     model = Summarization(size_layer, num_layers, embedded_size, len(vocab2id_from), len(vocab2id_to), batch_size)
     sess.run(tf.global_variables_initializer())
 
+    # 长度相近的文章放在同一批次  减少补齐
+    train_sampler = BucketSampler(train_X, train_Y, batch_size=batch_size)
+    test_sampler = BucketSampler(test_X, test_Y, batch_size=batch_size)
+    print('补齐浪费比例:', train_sampler.report())
+
     for EPOCH in range(10):
         total_loss, total_accuracy, total_loss_test, total_accuracy_test = 0, 0, 0, 0
 
-        train_X, train_Y = shuffle(train_X, train_Y)
-        test_X, test_Y = shuffle(test_X, test_Y)
-
-        for k in range(0, len(train_X), batch_size):
-            batch_x, _ = pad_sentence_batch(train_X[k: min(k + batch_size, len(train_X))], PAD)
-            batch_y, _ = pad_sentence_batch(train_Y[k: min(k + batch_size, len(train_X))], PAD)
+        for step, batch_ids in enumerate(train_sampler):
+            batch_x, _ = pad_sentence_batch(gather(train_X, batch_ids), PAD)
+            batch_y, _ = pad_sentence_batch(gather(train_Y, batch_ids), PAD)
 
             acc, loss, _ = sess.run([model.accuracy, model.cost, model.optimizer],
                                     feed_dict={model.X: batch_x, model.Y: batch_y})
@@ -308,19 +313,19 @@ if __name__ == '__main__':
             total_loss += loss
             total_accuracy += acc
             print("当前epoch:{}, 当前batch:{}, 损失:{}, 准确率:{}, 这是训练集上的表现".format(
-                EPOCH, k//batch_size, loss, acc
+                EPOCH, step, loss, acc
             ))
 
-        for k in range(0, len(test_X), batch_size):
-            batch_x, _ = pad_sentence_batch(test_X[k: min(k + batch_size, len(test_X))], PAD)
-            batch_y, _ = pad_sentence_batch(test_Y[k: min(k + batch_size, len(test_X))], PAD)
+        for step, batch_ids in enumerate(test_sampler):
+            batch_x, _ = pad_sentence_batch(gather(test_X, batch_ids), PAD)
+            batch_y, _ = pad_sentence_batch(gather(test_Y, batch_ids), PAD)
             acc, loss = sess.run([model.accuracy, model.cost],
                                  feed_dict={model.X: batch_x,
                                             model.Y: batch_y})
             total_loss_test += loss
             total_accuracy_test += acc
             print("当前epoch:{}, 当前batch:{}, 损失:{}, 准确率:{}, 这是测试集上的表现".format(
-                EPOCH, k // batch_size, loss, acc
+                EPOCH, step, loss, acc
             ))
 
             # 对测试集进行预测
@@ -16,8 +16,11 @@ from tensor2tensor.utils import beam_search
 import re
 from unidecode import unidecode
 import random
-from sklearn.utils import shuffle
 import time
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.bucketing import BucketSampler, gather
 
 
 def embed_seq(x, vocab_sz, embed_dim, name, zero_pad=True):
@@ -331,24 +334,27 @@ if __name__ == '__main__':
     model.generate = beam_search_decoding()
     sess.run(tf.global_variables_initializer())
 
+    # 长度相近的文章放在同一批次  减少补齐
+    train_sampler = BucketSampler(train_X, train_Y, batch_size=batch_size)
+    test_sampler = BucketSampler(test_X, test_Y, batch_size=batch_size)
+    print('补齐浪费比例:', train_sampler.report())
+
     for EPOCH in range(10):
         lasttime = time.time()
         total_loss, total_accuracy, total_loss_test, total_accuracy_test = 0, 0, 0, 0
-        train_X, train_Y = shuffle(train_X, train_Y)
-        test_X, test_Y = shuffle(test_X, test_Y)
-        for k in range(0, len(train_X), batch_size):
-            batch_x, _ = pad_sentence_batch(train_X[k: min(k + batch_size, len(train_X))], PAD)
-            batch_y, _ = pad_sentence_batch(train_Y[k: min(k + batch_size, len(train_X))], PAD)
+        for step, batch_ids in enumerate(train_sampler):
+            batch_x, _ = pad_sentence_batch(gather(train_X, batch_ids), PAD)
+            batch_y, _ = pad_sentence_batch(gather(train_Y, batch_ids), PAD)
             acc, loss, _ = sess.run([model.accuracy, model.cost, model.optimizer],
                                     feed_dict={model.X: batch_x,
                                                model.Y: batch_y})
             total_loss += loss
             total_accuracy += acc
-            print("training--epoch: %d, step: %d, loss: %f, accuracy: %f" % (EPOCH, k // batch_size, loss, acc))
+            print("training--epoch: %d, step: %d, loss: %f, accuracy: %f" % (EPOCH, step, loss, acc))
 
-        for k in range(0, len(test_X), batch_size):
-            batch_x, _ = pad_sentence_batch(test_X[k: min(k + batch_size, len(test_X))], PAD)
-            batch_y, _ = pad_sentence_batch(test_Y[k: min(k + batch_size, len(test_X))], PAD)
+        for step, batch_ids in enumerate(test_sampler):
+            batch_x, _ = pad_sentence_batch(gather(test_X, batch_ids), PAD)
+            batch_y, _ = pad_sentence_batch(gather(test_Y, batch_ids), PAD)
             acc, loss = sess.run([model.accuracy, model.cost],
                                  feed_dict={
                                      model.X: batch_x,
@@ -357,7 +363,7 @@ if __name__ == '__main__':
                                  )
             total_loss_test += loss
             total_accuracy_test += acc
-            print("testing--epoch: %d, step: %d, loss: %f, accuracy: %f" % (EPOCH, k // batch_size, loss, acc))
+            print("testing--epoch: %d, step: %d, loss: %f, accuracy: %f" % (EPOCH, step, loss, acc))
 
         total_loss /= (len(train_X) / batch_size)
         total_accuracy /= (len(train_X) / batch_size)
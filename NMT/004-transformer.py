@@ -14,6 +14,9 @@ import re
 import time
 import collections
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.bucketing import BucketSampler, gather
 
 
 def layer_norm(inputs, epsilon=1e-8):
@@ -34,7 +37,18 @@ def layer_norm(inputs, epsilon=1e-8):
     return outputs
 
 
-def multihead_attn(queries, keys, q_masks, k_masks, future_binding, num_units, num_heads):
+def kv_projection(keys, num_units):
+    '''
+    把keys映射为注意力中的K和V  (和multihead_attn共用同一组参数)
+    :param keys:
+    :param num_units:
+    :return: K, V
+    '''
+    K_V = tf.layers.dense(keys, 2 * num_units, name='K_V')
+    return tf.split(K_V, 2, -1)
+
+
+def multihead_attn(queries, keys, q_masks, k_masks, future_binding, num_units, num_heads, kv=None):
     '''
     多头注意力
     :param queries:
@@ -44,14 +58,14 @@ def multihead_attn(queries, keys, q_masks, k_masks, future_binding, num_units, n
     :param future_binding:
     :param num_units:
     :param num_heads:
+    :param kv: 已经算好的(K, V)  增量解码时传入缓存, 此时不再使用keys
     :return:
     '''
+    K, V = kv if kv is not None else kv_projection(keys, num_units)
     T_q = tf.shape(queries)[1]
-    T_k = tf.shape(keys)[1]
+    T_k = tf.shape(K)[1]
 
     Q = tf.layers.dense(queries, num_units, name='Q')
-    K_V = tf.layers.dense(keys, 2 * num_units, name='K_V')
-    K, V = tf.split(K_V, 2, -1)
 
     Q_ = tf.concat(tf.split(Q, num_heads, axis=2), axis=0)
     K_ = tf.concat(tf.split(K, num_heads, axis=2), axis=0)
@@ -94,8 +108,9 @@ def pointwise_feedforward(inputs, hidden_units, activation=None):
     :param activation:
     :return:
     '''
-    outputs = tf.layers.dense(inputs, 4 * hidden_units, activation=activation)
-    outputs = tf.layers.dense(outputs, hidden_units, activation=None)
+    # 给每层起名字  训练和解码多次调用时才会复用同一组参数
+    outputs = tf.layers.dense(inputs, 4 * hidden_units, activation=activation, name='ffn_in')
+    outputs = tf.layers.dense(outputs, hidden_units, activation=None, name='ffn_out')
     outputs += inputs
     outputs = layer_norm(outputs)
     return outputs
@@ -117,9 +132,10 @@ def pointwise_feedforward(inputs, hidden_units, activation=None):
 #     return tf.expand_dims(tf.to_float(mask), -1) * outputs
 #
 #
-def sinusoidal_position_encoding(inputs, mask, repr_dim):
+def sinusoidal_position_encoding(inputs, mask, repr_dim, start=0):
+    # start: 第一个位置的下标  增量解码时每次只编码一个新的位置
     T = tf.shape(inputs)[1]
-    pos = tf.reshape(tf.range(0.0, tf.to_float(T), dtype=tf.float32), [-1, 1])
+    pos = tf.reshape(tf.range(tf.to_float(start), tf.to_float(start + T), dtype=tf.float32), [-1, 1])
     i = np.arange(0, repr_dim, 2, np.float32)
     denom = np.reshape(np.power(10000.0, i / repr_dim), [1, -1])
     enc = tf.expand_dims(tf.concat([tf.sin(pos / denom), tf.cos(pos / denom)], 1), 0)
@@ -151,8 +167,7 @@ class Model:
         decoder_input = tf.concat([tf.fill([batch_size, 1], GO), main], 1)
 
         # 4. define forward net
-        def forward(x, y):
-
+        def encode(x):
             encoder_embedded = tf.nn.embedding_lookup(encoder_embedding, x)
             en_masks = tf.sign(x)
             encoder_embedded += sinusoidal_position_encoding(x, en_masks, embedded_size)
@@ -172,6 +187,10 @@ class Model:
                     encoder_embedded = pointwise_feedforward(encoder_embedded,
                                                              embedded_size,
                                                              activation=tf.nn.relu)
+            return encoder_embedded, en_masks
+
+        def forward(x, y):
+            encoder_embedded, en_masks = encode(x)
 
             decoder_embedded = tf.nn.embedding_lookup(decoder_embedding, y)
             de_masks = tf.sign(y)
@@ -201,10 +220,11 @@ class Model:
                                                              embedded_size,
                                                              activation=tf.nn.relu)
 
-            return tf.layers.dense(decoder_embedded, to_dict_size, reuse=tf.AUTO_REUSE)
+            return tf.layers.dense(decoder_embedded, to_dict_size, name='logits', reuse=tf.AUTO_REUSE)
 
         self.training_logits = forward(self.X, decoder_input)
 
+        # 5. 原来的贪心解码: 每一步都把编码器和整个前缀重新算一遍  生成N个词要做N次完整的前向
         def cond(i, y, temp):
             return i < 2 * tf.reduce_max(self.X_seq_len)
 
@@ -222,8 +242,74 @@ class Model:
         target = tf.cast(target, tf.int64)
         self.target = target
 
-        _, self.predicting_ids, _ = tf.while_loop(cond, body,
-                                                  [tf.constant(0), target, target])
+        _, self.predicting_ids_full, _ = tf.while_loop(cond, body,
+                                                       [tf.constant(0), target, target])
+
+        # 6. 增量解码: 编码器只算一次, 解码器每层缓存之前位置的K/V, 每一步只把新的位置送进multihead_attn
+        encoder_embedded, en_masks = encode(self.X)
+        maxlen = 2 * tf.reduce_max(self.X_seq_len)
+
+        # 交叉注意力的K/V只依赖编码器的输出  循环外每层算一次
+        memory = []
+        for i in range(num_blocks):
+            with tf.variable_scope('decoder_attn_%d' % i, reuse=True):
+                memory.append(kv_projection(encoder_embedded, size_layer))
+
+        def cached_cond(t, ids, self_k, self_v, self_masks):
+            return t < maxlen
+
+        def cached_body(t, ids, self_k, self_v, self_masks):
+            # ids: [batch, t + 1]  第0位是GO, 只需要把最后一个词送进解码器
+            token = ids[:, -1:]
+            de_mask = tf.sign(token)
+            self_masks = tf.concat([self_masks, de_mask], 1)
+
+            decoder_embedded = tf.nn.embedding_lookup(decoder_embedding, token)
+            decoder_embedded += sinusoidal_position_encoding(token, de_mask, embedded_size, start=t)
+
+            new_k, new_v = [], []
+            for i in range(num_blocks):
+                with tf.variable_scope('decoder_self_attn_%d' % i, reuse=True):
+                    # 只算新位置的K/V, 拼到缓存后面  缓存里都是之前的位置, 不再需要future_binding
+                    k, v = kv_projection(decoder_embedded, size_layer)
+                    new_k.append(tf.concat([self_k[i], k], 1))
+                    new_v.append(tf.concat([self_v[i], v], 1))
+                    decoder_embedded = multihead_attn(queries=decoder_embedded,
+                                                      keys=None,
+                                                      q_masks=de_mask,
+                                                      k_masks=self_masks,
+                                                      future_binding=False,
+                                                      num_units=size_layer,
+                                                      num_heads=num_heads,
+                                                      kv=(new_k[i], new_v[i]))
+
+                with tf.variable_scope('decoder_attn_%d' % i, reuse=True):
+                    decoder_embedded = multihead_attn(queries=decoder_embedded,
+                                                      keys=None,
+                                                      q_masks=de_mask,
+                                                      k_masks=en_masks,
+                                                      future_binding=False,
+                                                      num_units=size_layer,
+                                                      num_heads=num_heads,
+                                                      kv=memory[i])
+
+                with tf.variable_scope('decoder_feedforward_%d' % i, reuse=True):
+                    decoder_embedded = pointwise_feedforward(decoder_embedded,
+                                                             embedded_size,
+                                                             activation=tf.nn.relu)
+
+            logits = tf.layers.dense(decoder_embedded, to_dict_size, name='logits', reuse=True)
+            ids = tf.concat([ids, tf.argmax(logits, -1, output_type=tf.int32)], 1)
+            return t + 1, ids, new_k, new_v, self_masks
+
+        empty_cache = [tf.zeros([batch_size, 0, size_layer]) for _ in range(num_blocks)]
+        cache_shape = [tf.TensorShape([None, None, size_layer]) for _ in range(num_blocks)]
+        _, ids, _, _, _ = tf.while_loop(cached_cond, cached_body,
+                                        [tf.constant(0), tf.fill([batch_size, 1], GO),
+                                         empty_cache, empty_cache, tf.zeros([batch_size, 0], tf.int32)],
+                                        shape_invariants=[tf.TensorShape([]), tf.TensorShape([None, None]),
+                                                          cache_shape, cache_shape, tf.TensorShape([None, None])])
+        self.predicting_ids = ids[:, 1:]
 
         masks = tf.sequence_mask(self.Y_seq_len, tf.reduce_max(self.Y_seq_len), dtype=tf.float32)
         self.cost = tf.contrib.seq2seq.sequence_loss(logits=self.training_logits,
@@ -273,6 +359,25 @@ def pad_sentence_batch(sentence_batch, pad_int):
     return padded_seqs, seq_lens
 
 
+def benchmark_decoding(sess, model, vocab_size, src_lengths=(8, 16, 32, 64), batch_size=16, repeat=5):
+    '''
+    比较两种贪心解码每秒生成的词数: 每步重算整个前缀 vs 缓存K/V的增量解码
+    :param vocab_size: 源语言词表大小  用来随机造输入
+    :param src_lengths: 测试的源句长度  生成的长度是其2倍
+    '''
+    for src_len in src_lengths:
+        batch_x = np.random.randint(4, vocab_size, (batch_size, src_len))
+        speed = []
+        for fetch in [model.predicting_ids_full, model.predicting_ids]:
+            sess.run(fetch, feed_dict={model.X: batch_x})   # 预热
+            start = time.time()
+            for _ in range(repeat):
+                sess.run(fetch, feed_dict={model.X: batch_x})
+            speed.append(batch_size * 2 * src_len * repeat / (time.time() - start))
+        print('src_len: %d, full: %.1f tokens/s, kv cache: %.1f tokens/s, speedup: %.2fx' % (
+            src_len, speed[0], speed[1], speed[1] / speed[0]))
+
+
 def str_idx(corpus, dic):
     X = []
     for i in corpus:
@@ -335,20 +440,25 @@ if __name__ == '__main__':
     maxlen_question = max([len(x) for x in X]) * 2
     maxlen_answer = max([len(y) for y in Y]) * 2
 
+    # 长度相近的句对放在同一批次  减少补齐
+    sampler = BucketSampler(X, Y, batch_size=batch_size)
+    print('补齐浪费比例:', sampler.report())
+
     for i in range(epoch):
         total_loss, total_accuracy = 0, 0
-        for k in range(0, len(text_to), batch_size):
-            index = min(k + batch_size, len(text_to))
-            batch_x, seq_x = pad_sentence_batch(X[k: index], PAD)
-            batch_y, seq_y = pad_sentence_batch(Y[k: index], PAD)
+        for step, batch_ids in enumerate(sampler):
+            batch_x, seq_x = pad_sentence_batch(gather(X, batch_ids), PAD)
+            batch_y, seq_y = pad_sentence_batch(gather(Y, batch_ids), PAD)
             predicted, accuracy, loss, _ = sess.run([model.predicting_ids,
                                                      model.accuracy, model.cost, model.optimizer],
                                                     feed_dict={model.X: batch_x,
                                                                model.Y: batch_y})
             total_loss += loss
             total_accuracy += accuracy
-            print("当前步:{}, 损失:{}, 准确率:{}".format(k // batch_size, loss, accuracy))
+            print("当前步:{}, 损失:{}, 准确率:{}".format(step, loss, accuracy))
 
         total_loss /= (len(text_to) / batch_size)
         total_accuracy /= (len(text_to) / batch_size)
-        print('epoch: %d, avg loss: %f, avg accuracy: %f' % (i + 1, total_loss, total_accuracy))
\ No newline at end of file
+        print('epoch: %d, avg loss: %f, avg accuracy: %f' % (i + 1, total_loss, total_accuracy))
+
+    benchmark_decoding(sess, model, len(vocab2id_from))
@@ -7,13 +7,15 @@
 @time  : 2019-07-26
 
 """
-import numpy as np
+import json
 import os
 import tensorflow as tf
 import matplotlib.pyplot as plt
 from scipy.misc import imresize
-import cv2
 import time
+from ocr_data import build_dataset, load_dataset, augment, Prefetcher
+from ocr_model import Model, sequence_lengths
+from ocr_metrics import MetricAccumulator
 
 # 1 读取图片文件名 总的图片有5001
 directory = './data/'
@@ -75,178 +77,55 @@ num_hidden = 128
 epoch = 500
 batch_size = 10
 initial_learning_rate = 1e-2
+use_augment = False   # 训练时是否做随机平移/亮度增强
+sequence_axis = 'channels'   # 'width': 卷积特征图的每一列作为时间步, 推理时可以识别任意宽度的图片
 
 
-class Model:
-    def __init__(self):
-        self.X = tf.placeholder(tf.float32, [None, image_height, image_width, image_channel])
-        self.Y = tf.sparse_placeholder(tf.int32)
-        self.SEQ_LEN = tf.placeholder(tf.int32, [None])
-        filters = [64, 128, 128, max_stepsize]
-        strides = [1, 2]
-
-        # 1. convolution1
-        x = self.conv2d(self.X, 'cnn_1', 3, 1, filters[0], strides[0])
-        x = self.batch_norm('bn1', x)
-        x = self.leaky_relu(x, 0.01)
-        x = self.max_pool(x, 2, strides[1])
-
-        # 2. convolution2
-        x = self.conv2d(x, 'cnn-2', 3, filters[0], filters[1], strides[0])
-        x = self.batch_norm('bn2', x)
-        x = self.leaky_relu(x, 0.01)
-        x = self.max_pool(x, 2, strides[1])
-
-        # 3. convolution3
-        x = self.conv2d(x, 'cnn-3', 3, filters[1], filters[2], strides[0])
-        x = self.batch_norm('bn3', x)
-        x = self.leaky_relu(x, 0.01)
-        x = self.max_pool(x, 2, strides[1])
-
-        # 4. convolution4
-        x = self.conv2d(x, 'cnn-4', 3, filters[2], filters[3], strides[0])
-        x = self.batch_norm('bn4', x)
-        x = self.leaky_relu(x, 0.01)
-        x = self.max_pool(x, 2, strides[1])
-
-        x = tf.reshape(x, [batch_size, -1, filters[3]])
-        x = tf.transpose(x, [0, 2, 1])
-        x.set_shape([batch_size, filters[3], 48])
-
-        # 5. 两层LSTM
-        cell = tf.contrib.rnn.LSTMCell(num_hidden, state_is_tuple=True)
-        cell = tf.contrib.rnn.DropoutWrapper(cell=cell, output_keep_prob=0.8)
-        cell1 = tf.contrib.rnn.LSTMCell(num_hidden, state_is_tuple=True)
-        cell1 = tf.contrib.rnn.DropoutWrapper(cell=cell1, output_keep_prob=0.8)
-        stack = tf.contrib.rnn.MultiRNNCell([cell, cell1], state_is_tuple=True)
-        outputs, _ = tf.nn.dynamic_rnn(stack, x, self.SEQ_LEN, dtype=tf.float32)
-
-        # 6. 定义输出
-        outputs = tf.reshape(outputs, [-1, num_hidden])
-        W = tf.get_variable(name='W',
-                            shape=[num_hidden, num_classes],
-                            dtype=tf.float32,
-                            initializer=tf.contrib.layers.xavier_initializer())
-        b = tf.get_variable(name='b',
-                            shape=[num_classes],
-                            dtype=tf.float32,
-                            initializer=tf.constant_initializer())
-
-        self.logits = tf.matmul(outputs, W) + b
-        shape = tf.shape(x)
-        self.logits = tf.reshape(self.logits, [shape[0], -1, num_classes])
-        self.logits = tf.transpose(self.logits, (1, 0, 2))
-        self.global_step = tf.Variable(0, trainable=True)
-
-        # 7. 定义损失和优化器
-        self.loss = tf.nn.ctc_loss(labels=self.Y,
-                                   inputs=self.logits,
-                                   sequence_length=self.SEQ_LEN)
-
-        self.cost = tf.reduce_mean(self.loss)
-        self.optimizer = tf.train.AdamOptimizer(learning_rate=initial_learning_rate).minimize(self.cost)
-        self.decoded, self.log_prob = tf.nn.ctc_beam_search_decoder(self.logits,
-                                                                    self.SEQ_LEN,
-                                                                    merge_repeated=False)
-        self.dense_decoded = tf.sparse_tensor_to_dense(self.decoded[0], default_value=1)
-
-        self.cost = tf.reduce_mean(self.loss)
-        self.optimizer = tf.train.AdamOptimizer(learning_rate=initial_learning_rate).minimize(self.cost)
-        self.decoded, self.log_prob = tf.nn.ctc_beam_search_decoder(self.logits,
-                                                                    self.SEQ_LEN,
-                                                                    merge_repeated=False)
-        self.dense_decoded = tf.sparse_tensor_to_dense(self.decoded[0], default_value=-1)
-
-    def conv2d(self, x, name, filter_size, channel_in, channel_out, strides):
-        # 2_dim conv
-        with tf.variable_scope(name):
-            kernel = tf.get_variable(name='W',
-                                     shape=[filter_size, filter_size, channel_in, channel_out])
-            b = tf.get_variable(name='b',
-                                shape=[channel_out, ],
-                                dtype=tf.float32,
-                                initializer=tf.contrib.layers.xavier_initializer())
-            return tf.nn.conv2d(x, kernel, [1, strides, strides, 1], padding='SAME') + b
-
-    def batch_norm(self, name, x):
-        # batch_normalization
-        with tf.variable_scope(name):
-            params_shape = [x.get_shape()[-1]]
-            # 加入beta和gamma是为了让模型不接近线性
-            beta = tf.get_variable('beta', params_shape, tf.float32,
-                                   initializer=tf.constant_initializer(0.0, tf.float32))
-            gamma = tf.get_variable('gamma', params_shape, tf.float32,
-                                    initializer=tf.constant_initializer(1.0, tf.float32))
-
-            mean, variance = tf.nn.moments(x, [0, 1, 2], name='moments')
-            x_bn = tf.nn.batch_normalization(x, mean, variance, beta, gamma, 0.001)
-            x_bn.set_shape(x.get_shape())
-            return x_bn
-
-    def leaky_relu(self, x, leak=0.0):
-        # leak=0 代表最原始的relu
-        return tf.where(tf.less(x, 0.0), leak*x, x, name='leaky_relu')
-
-    def max_pool(self, x, size, strides):
-        # 最大化池化
-        return tf.nn.max_pool(x, ksize=[1, size, size, 1],
-                              strides=[1, strides, strides, 1],
-                              padding='SAME',
-                              name='max_pool')
-
-
-def accuracy_calculation(original_seq, decoded_seq, ignore_value=-1):
-    count = 0
-    for i, origin_label in enumerate(original_seq):
-        decoded_label = [j for j in decoded_seq[i] if j != ignore_value]
-        if origin_label == decoded_label:
-            count += 1
-    return count * 1.0 / len(original_seq)
-
-
-def sparse_tuple_from_label(sequences, dtype=np.int32):
-    indices, values = [], []
-    for n, seq in enumerate(sequences):
-        indices.extend(zip([n] * len(seq), range(len(seq))))
-        values.extend(seq)
-    indices = np.asarray(indices, dtype=np.int64)
-    values = np.asarray(values, dtype=dtype)
-    shape = np.asarray([len(sequences), np.asarray(indices).max(0)[1] + 1], dtype=np.int64)
-    return indices, values, shape
+# 图片只在第一次运行时解码一次, 存成uint8的npy; 之后直接memmap读取
+dataset_path = build_dataset(images, labels, char2id, directory + 'train', image_height, image_width)
+train_images, label_offsets, label_ids = load_dataset(dataset_path)
+train_batches = Prefetcher(train_images, label_offsets, label_ids, batch_size,
+                           shuffle=True, augment_fn=augment if use_augment else None)
 
 
 tf.reset_default_graph()
 sess = tf.Session()
-model = Model()
+model = Model(num_classes, image_height, image_width, image_channel, max_stepsize, num_hidden, initial_learning_rate,
+              sequence_axis)
 sess.run(tf.global_variables_initializer())
 
 
+metrics = MetricAccumulator()
 for i in range(epoch):
-    total_lost, total_acc = 0, 0
+    total_lost = 0
+    metrics.reset()
     last_time = time.time()
-    for k in range(0, (len(images)//batch_size)*batch_size, batch_size):
-        batch_x = np.zeros((batch_size, image_height, image_width, image_channel))
-        batch_label = []
-        for n in range(batch_size):
-            batch_x[n] = (cv2.imread(images[k+n], 0).astype(np.float32)/255.).reshape((60, 180, 1))
-            batch_label.append([SPACE_INDEX if labels[0] == SPACE_TOKEN else char2id[c] for c in labels[k+n]])
-        batch_len = np.asarray([max_stepsize for _ in [1]*batch_size], dtype=np.int64)
-        batch_y = sparse_tuple_from_label(batch_label)
+    for batch_x, batch_y in train_batches:
+        batch_len = sequence_lengths([image_width] * len(batch_x), sequence_axis, max_stepsize)
         feed = {model.X: batch_x,
                 model.Y: batch_y,
                 model.SEQ_LEN: batch_len}
-        decoded, loss, _ = sess.run([model.dense_decoded, model.cost, model.optimizer],
+        # 训练时的准确率用greedy解码看, beam search每步都跑太慢
+        decoded, loss, _ = sess.run([model.greedy_dense_decoded, model.cost, model.optimizer],
                                     feed_dict=feed)
-        acc = accuracy_calculation(batch_label, decoded, ignore_value=-1)
+        metrics.update(batch_y, decoded)
         total_lost += loss
-        total_acc += acc
-    total_lost /= (len(images)//batch_size)
-    total_acc /= (len(images)//batch_size)
+    total_lost /= len(train_batches)
     if (i+1) % 100 == 0:
-        print('epoch %d, avg loss %f, avg acc %f, time taken %f s' % (i+1,
-                                                                      total_lost,
-                                                                      total_acc,
-                                                                      time.time()-last_time))
+        print('epoch %d, avg loss %f, avg acc %f, cer %f, time taken %f s' % (i+1,
+                                                                              total_lost,
+                                                                              metrics.accuracy,
+                                                                              metrics.cer,
+                                                                              time.time()-last_time))
+
+# 保存参数  推理见ocr_infer.py, 会建一个batch大小不固定的推理图再恢复这些参数
+saver = tf.train.Saver()
+os.makedirs(directory + 'checkpoint', exist_ok=True)
+saver.save(sess, directory + 'checkpoint/ocr')
+with open(directory + 'checkpoint/config.json', 'w') as f:
+    json.dump({'charset': charset, 'num_classes': num_classes, 'image_height': image_height,
+               'image_width': image_width, 'image_channel': image_channel, 'max_stepsize': max_stepsize,
+               'num_hidden': num_hidden, 'sequence_axis': sequence_axis}, f)
 
 
 # batch_x = np.zeros((batch_size,image_height, image_width, image_channel))
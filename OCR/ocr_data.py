@@ -0,0 +1,151 @@
+"""
+
+@file  : ocr_data.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+OCR训练数据
+    build_dataset: 所有图片只解码一次 (灰度 + 缩放到固定大小), 存成uint8的 .npy, 标签打包成 (offsets, ids)
+    load_dataset: 图片用memmap打开, 不全部读进内存
+    Prefetcher: 后台线程按batch取图片、做增强、转float, 放进队列, 训练时sess.run不用等磁盘和解码
+
+"""
+import os
+import sys
+from multiprocessing.pool import ThreadPool
+
+import cv2
+import numpy as np
+
+from ocr_metrics import sparse_tuple_from_packed
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.prefetch import prefetch
+
+
+def encode_labels(labels, char2id):
+    '''
+    :param labels: list of str  如 ['(7+3)*8', ...]
+    :param char2id: 字符到id
+    :return: offsets, ids  第i个标签是 ids[offsets[i]: offsets[i + 1]]
+    '''
+    lengths = np.array([len(label) for label in labels], dtype=np.int64)
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    ids = np.array([char2id[c] for label in labels for c in label], dtype=np.int32)
+    return offsets, ids
+
+
+def read_image(path, image_height, image_width):
+    image = cv2.imread(path, 0)
+    if image is None:
+        raise IOError('cannot read image: %s' % path)
+    if image.shape != (image_height, image_width):
+        image = cv2.resize(image, (image_width, image_height), interpolation=cv2.INTER_AREA)
+    return image
+
+
+def build_dataset(images, labels, char2id, out_path, image_height=60, image_width=180, workers=8):
+    '''
+    :param images: 图片路径
+    :param labels: 对应的标签文本
+    :param char2id: 字符到id
+    :param out_path: 输出前缀  生成 out_path.images.npy 和 out_path.labels.npz, 已经存在时直接返回
+    :param workers: 解码图片的线程数  (cv2解码时会释放GIL)
+    :return: out_path
+    '''
+    image_file, label_file = out_path + '.images.npy', out_path + '.labels.npz'
+    if os.path.exists(image_file) and os.path.exists(label_file):
+        return out_path
+
+    # 先写到临时文件, 中途失败不会留下不完整的数据集
+    array = np.lib.format.open_memmap(image_file + '.tmp', mode='w+', dtype=np.uint8,
+                                      shape=(len(images), image_height, image_width, 1))
+
+    def decode(i):
+        array[i, :, :, 0] = read_image(images[i], image_height, image_width)
+
+    pool = ThreadPool(workers)
+    try:
+        pool.map(decode, range(len(images)), chunksize=64)
+    finally:
+        pool.close()
+    array.flush()
+    del array
+    os.replace(image_file + '.tmp', image_file)
+
+    offsets, ids = encode_labels(labels, char2id)
+    np.savez(label_file, offsets=offsets, ids=ids)
+    return out_path
+
+
+def load_dataset(path):
+    '''
+    :return: images [N, height, width, 1] uint8 (memmap), offsets, ids
+    '''
+    images = np.load(path + '.images.npy', mmap_mode='r')
+    arrays = np.load(path + '.labels.npz')
+    return images, arrays['offsets'], arrays['ids']
+
+
+def augment(batch, rng, max_shift=4, max_scale=0.2):
+    '''
+    训练时的简单增强: 随机水平/竖直平移 (边缘像素填充), 随机调整亮度对比度
+    :param batch: [batch, height, width, 1] float32  已经除以255
+    '''
+    out = np.empty_like(batch)
+    height, width = batch.shape[1:3]
+    for n, image in enumerate(batch):
+        dy, dx = rng.randint(-max_shift, max_shift + 1, size=2)
+        padded = np.pad(image, ((max_shift, max_shift), (max_shift, max_shift), (0, 0)), mode='edge')
+        out[n] = padded[max_shift - dy: max_shift - dy + height, max_shift - dx: max_shift - dx + width]
+    scale = 1.0 + rng.uniform(-max_scale, max_scale, size=(len(batch), 1, 1, 1))
+    shift = rng.uniform(-max_scale, max_scale, size=(len(batch), 1, 1, 1)) / 2
+    return np.clip(out * scale + shift, 0.0, 1.0).astype(np.float32)
+
+
+class Prefetcher(object):
+    def __init__(self, images, offsets, ids, batch_size, shuffle=True, augment_fn=None, n_prefetch=8, seed=None):
+        '''
+        后台线程准备好的batch放在队列里, 训练循环每次直接取
+        :param images: load_dataset的图片数组
+        :param offsets, ids: 打包的标签
+        :param batch_size: 不足一个batch的尾部丢掉
+        :param shuffle: 每个epoch打乱
+        :param augment_fn: augment(batch, rng) 之类的函数, None表示不增强
+        :param n_prefetch: 队列里最多放几个batch
+        '''
+        self.images = images
+        self.offsets = offsets
+        self.ids = ids
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.augment_fn = augment_fn
+        self.n_prefetch = n_prefetch
+        self.rng = np.random.RandomState(seed)
+
+    def __len__(self):
+        return len(self.images) // self.batch_size
+
+    def labels(self, index):
+        # 直接从打包的标签生成喂给model.Y的 (indices, values, shape)
+        return sparse_tuple_from_packed(self.offsets, self.ids, index)
+
+    def batch(self, index):
+        # memmap上按排好序的下标取, 读盘是顺序的
+        order = np.argsort(index)
+        batch_x = np.empty((len(index),) + self.images.shape[1:], dtype=np.float32)
+        batch_x[order] = self.images[index[order]]
+        batch_x /= 255.
+        if self.augment_fn is not None:
+            batch_x = self.augment_fn(batch_x, self.rng)
+        return batch_x, self.labels(index)
+
+    def __iter__(self):
+        '''
+        一个epoch  每次给出 batch_x [batch, height, width, 1] float32, batch_y (indices, values, shape)
+        '''
+        order = self.rng.permutation(len(self.images)) if self.shuffle else np.arange(len(self.images))
+        batches = (self.batch(order[k * self.batch_size: (k + 1) * self.batch_size]) for k in range(len(self)))
+        return prefetch(batches, self.n_prefetch)
@@ -0,0 +1,133 @@
+"""
+
+@file  : ocr_infer.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+OCR推理  恢复cnn_rnn_ctc.py保存的参数, 建一个batch大小不固定的推理图
+    python ocr_infer.py --images 0.png 1.png --decoder beam --beam_width 10
+    python ocr_infer.py --benchmark   # 不同batch大小下greedy / beam解码每秒识别多少张图
+
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from ocr_model import Model, sequence_lengths
+
+
+class OCRRecognizer(object):
+    def __init__(self, checkpoint_dir, decoder='greedy', beam_width=10):
+        '''
+        :param checkpoint_dir: cnn_rnn_ctc.py保存参数的目录 (含config.json)
+        :param decoder: 'greedy' 或 'beam'
+        :param beam_width: beam search的宽度
+        '''
+        with open(os.path.join(checkpoint_dir, 'config.json')) as f:
+            self.config = json.load(f)
+        self.sequence_axis = self.config['sequence_axis']
+        self.image_height = self.config['image_height']
+        # 'width' 的模型可以识别任意宽度, 'channels' 的模型只能识别训练时的大小
+        self.image_width = self.config['image_width'] if self.sequence_axis == 'channels' else None
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.model = Model(self.config['num_classes'], self.image_height, self.image_width,
+                               self.config['image_channel'], self.config['max_stepsize'], self.config['num_hidden'],
+                               sequence_axis=self.sequence_axis, beam_width=beam_width, training=False)
+            self.sess = tf.Session(graph=self.graph)
+            tf.train.Saver().restore(self.sess, os.path.join(checkpoint_dir, 'ocr'))
+        if decoder == 'greedy':
+            self.decoded = self.model.greedy_dense_decoded
+        elif decoder == 'beam':
+            self.decoded = self.model.dense_decoded
+        else:
+            raise ValueError('unknown decoder: %s' % decoder)
+        # id 0 是空格, 1..len(charset) 是字符
+        self.id2char = np.array([''] + list(self.config['charset']) + [''], dtype=object)
+
+    def prepare(self, images):
+        '''
+        :param images: list of [height, width] 或 [height, width, 1]  uint8(0~255) 或 float(0~1)
+        :return: batch_x [batch, height, 最大宽度, 1] (右侧用最后一列补齐), 每张图的宽度
+        '''
+        images = [np.asarray(image) for image in images]
+        images = [image.reshape(image.shape[:2] + (1,)) for image in images]
+        for image in images:
+            if image.shape[0] != self.image_height or (self.image_width and image.shape[1] != self.image_width):
+                raise ValueError('image shape %s does not fit the model (%s, %s)'
+                                 % (image.shape[:2], self.image_height, self.image_width))
+        widths = np.array([image.shape[1] for image in images], dtype=np.int64)
+        batch_x = np.empty((len(images), self.image_height, widths.max(), 1), dtype=np.float32)
+        for n, image in enumerate(images):
+            image = image.astype(np.float32) / 255. if image.dtype == np.uint8 else image
+            batch_x[n, :, :image.shape[1]] = image
+            batch_x[n, :, image.shape[1]:] = image[:, -1:]
+        return batch_x, widths
+
+    def predict_ids(self, images, batch_size=64):
+        '''
+        :return: 每张图识别出的字符id
+        '''
+        # 按宽度排序后分batch, 补齐的部分最少; 结果再按原来的顺序放回
+        widths = np.array([np.shape(image)[1] for image in images])
+        order = np.argsort(widths, kind='stable')
+        results = [None] * len(images)
+        for i in range(0, len(order), batch_size):
+            index = order[i: i + batch_size]
+            batch_x, batch_widths = self.prepare([images[k] for k in index])
+            decoded = self.sess.run(self.decoded, feed_dict={
+                self.model.X: batch_x,
+                self.model.SEQ_LEN: sequence_lengths(batch_widths, self.sequence_axis, self.config['max_stepsize'])})
+            for k, row in zip(index, decoded):
+                results[k] = row[row >= 0]
+        return results
+
+    def predict(self, images, batch_size=64):
+        return [''.join(self.id2char[ids]) for ids in self.predict_ids(images, batch_size)]
+
+
+def benchmark(checkpoint_dir, images, batch_sizes=(1, 8, 32, 128, 512), beam_width=10):
+    '''
+    不同batch大小下每秒识别多少张图
+    :param images: [N, height, width, 1]
+    '''
+    print('%-8s %10s %12s' % ('decoder', 'batch', 'images/s'))
+    for decoder in ['greedy', 'beam']:
+        recognizer = OCRRecognizer(checkpoint_dir, decoder, beam_width)
+        for batch_size in batch_sizes:
+            recognizer.predict_ids(images[:batch_size], batch_size)   # 预热
+            start = time.time()
+            recognizer.predict_ids(images, batch_size)
+            print('%-8s %10d %12.1f' % (decoder, batch_size, len(images) / (time.time() - start)))
+        recognizer.sess.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint_dir', default='./data/checkpoint')
+    parser.add_argument('--images', nargs='*', default=[], help='要识别的图片')
+    parser.add_argument('--decoder', default='greedy', choices=['greedy', 'beam'])
+    parser.add_argument('--beam_width', type=int, default=10)
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--dataset', default='./data/train', help='benchmark用的build_dataset输出')
+    parser.add_argument('--n_images', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        from ocr_data import load_dataset
+        images = load_dataset(args.dataset)[0][:args.n_images]
+        benchmark(args.checkpoint_dir, list(images), beam_width=args.beam_width)
+    else:
+        import cv2
+        recognizer = OCRRecognizer(args.checkpoint_dir, args.decoder, args.beam_width)
+        texts = recognizer.predict([cv2.imread(path, 0) for path in args.images], args.batch_size)
+        for path, text in zip(args.images, texts):
+            print(path, text)
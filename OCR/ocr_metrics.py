@@ -0,0 +1,134 @@
+"""
+
+@file  : ocr_metrics.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+CTC标签的打包和识别指标
+    sparse_tuple_from_label / sparse_tuple_from_packed: 生成 tf.sparse_placeholder 要的 (indices, values, shape), 全部用numpy的repeat/concatenate
+    exact_match / edit_distance: 整个batch一起算, 编辑距离在batch维上向量化
+    MetricAccumulator: 一个epoch内累加 完全正确的条数 / 编辑距离 / 字符数, 不保存每个batch的解码结果
+
+"""
+import numpy as np
+
+
+def _sparse_tuple(lengths, values, dtype=np.int32):
+    # 第n条的第k个元素在 (n, k)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    cols = np.arange(len(values), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    indices = np.stack([rows, cols], axis=1)
+    shape = np.array([len(lengths), max(int(lengths.max()) if len(lengths) else 0, 1)], dtype=np.int64)
+    return indices, np.asarray(values, dtype=dtype), shape
+
+
+def sparse_tuple_from_label(sequences, dtype=np.int32):
+    '''
+    :param sequences: list of id list
+    :return: indices [n, 2], values [n], shape [2]
+    '''
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    values = np.concatenate([np.asarray(seq, dtype=dtype) for seq in sequences]) if len(sequences) else np.zeros(0)
+    return _sparse_tuple(lengths, values, dtype)
+
+
+def sparse_tuple_from_packed(offsets, ids, index, dtype=np.int32):
+    '''
+    直接从打包的标签 (ocr_data.encode_labels的输出) 取出一个batch
+    :param index: 这个batch的样本下标
+    '''
+    starts, ends = offsets[index], offsets[np.asarray(index) + 1]
+    lengths = ends - starts
+    within = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return _sparse_tuple(lengths, ids[np.repeat(starts, lengths) + within], dtype)
+
+
+def sparse_to_dense(sparse, default_value=-1):
+    indices, values, shape = sparse
+    dense = np.full(shape, default_value, dtype=np.int64)
+    dense[indices[:, 0], indices[:, 1]] = values
+    return dense
+
+
+def _lengths(dense, ignore_value=-1):
+    # 补齐值只出现在末尾
+    return (dense != ignore_value).sum(axis=1)
+
+
+def _pad_to(dense, width, ignore_value=-1):
+    if dense.shape[1] >= width:
+        return dense
+    return np.pad(dense, ((0, 0), (0, width - dense.shape[1])), constant_values=ignore_value)
+
+
+def exact_match(truth, decoded, ignore_value=-1):
+    '''
+    :param truth: [batch, L1]  补齐值为ignore_value
+    :param decoded: [batch, L2]  如 model.dense_decoded
+    :return: [batch] bool  整条完全识别正确
+    '''
+    width = max(truth.shape[1], decoded.shape[1])
+    return (_pad_to(truth, width, ignore_value) == _pad_to(decoded, width, ignore_value)).all(axis=1)
+
+
+def edit_distance(truth, decoded, ignore_value=-1):
+    '''
+    Levenshtein距离  动态规划表的每一格对整个batch一起算
+    :return: [batch] int
+    '''
+    batch, L1 = truth.shape
+    L2 = decoded.shape[1]
+    # table[:, i, j]: truth前i个和decoded前j个之间的编辑距离
+    table = np.zeros((batch, L1 + 1, L2 + 1), dtype=np.int64)
+    table[:, :, 0] = np.arange(L1 + 1)
+    table[:, 0, :] = np.arange(L2 + 1)
+    for i in range(1, L1 + 1):
+        substitute = table[:, i - 1, :-1] + (truth[:, i - 1, None] != decoded)    # [batch, L2]
+        delete = table[:, i - 1, 1:] + 1
+        row = np.minimum(substitute, delete)
+        # 插入依赖同一行左边的格子, 只能按列顺序算
+        current = table[:, i]
+        for j in range(1, L2 + 1):
+            current[:, j] = np.minimum(row[:, j - 1], current[:, j - 1] + 1)
+    n = np.arange(batch)
+    return table[n, _lengths(truth, ignore_value), _lengths(decoded, ignore_value)]
+
+
+class MetricAccumulator(object):
+    def __init__(self, ignore_value=-1):
+        self.ignore_value = ignore_value
+        self.reset()
+
+    def reset(self):
+        self.n_samples = 0
+        self.n_correct = 0
+        self.n_edits = 0
+        self.n_chars = 0
+
+    def update(self, truth, decoded):
+        '''
+        :param truth: sparse tuple (喂给model.Y的那个) 或 [batch, L] 补齐的数组
+        :param decoded: [batch, L2]  model.dense_decoded / model.greedy_dense_decoded
+        :return: 这个batch的准确率
+        '''
+        if isinstance(truth, tuple):
+            truth = sparse_to_dense(truth, self.ignore_value)
+        correct = exact_match(truth, decoded, self.ignore_value)
+        self.n_samples += len(truth)
+        self.n_correct += int(correct.sum())
+        self.n_edits += int(edit_distance(truth, decoded, self.ignore_value).sum())
+        self.n_chars += int(_lengths(truth, self.ignore_value).sum())
+        return correct.mean()
+
+    @property
+    def accuracy(self):
+        # 整条完全正确的比例
+        return self.n_correct / max(self.n_samples, 1)
+
+    @property
+    def cer(self):
+        # 字错率: 编辑距离之和 / 标签字符数之和
+        return self.n_edits / max(self.n_chars, 1)
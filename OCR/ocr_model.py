@@ -0,0 +1,184 @@
+"""
+
+@file  : ocr_model.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+CNN + 两层LSTM + CTC 的识别模型  训练脚本和推理共用
+    batch维是动态的, 推理时一次可以送任意多张图
+    sequence_axis='channels': 原来的结构, 最后一层卷积的64个通道作为64个时间步, 输入必须是 image_height x image_width
+    sequence_axis='width': 卷积特征图的每一列作为一个时间步, 时间步数 = ceil(宽度 / 16), 可以识别任意宽度的图片
+    解码: greedy (每步取最大, 快) 或 beam search (beam_width可配置)
+
+"""
+import numpy as np
+import tensorflow as tf
+
+# 四次步长为2的池化
+DOWNSAMPLE = 16
+
+
+def sequence_lengths(widths, sequence_axis='channels', max_stepsize=64):
+    '''
+    每张图的时间步数  喂给model.SEQ_LEN
+    :param widths: 每张图的实际宽度
+    '''
+    widths = np.asarray(widths, dtype=np.int64)
+    if sequence_axis == 'channels':
+        return np.full(len(widths), max_stepsize, dtype=np.int64)
+    return (widths + DOWNSAMPLE - 1) // DOWNSAMPLE
+
+
+class Model:
+    def __init__(self, num_classes, image_height=60, image_width=180, image_channel=1, max_stepsize=64,
+                 num_hidden=128, learning_rate=1e-2, sequence_axis='channels', beam_width=100, training=True):
+        '''
+        :param num_classes: 字符数 + 2 (空格和CTC的blank)
+        :param image_width: sequence_axis='width' 时可以为None (任意宽度)
+        :param max_stepsize: 最后一层卷积的通道数  sequence_axis='channels' 时也是时间步数
+        :param sequence_axis: 'channels' 或 'width'
+        :param beam_width: beam search解码的宽度
+        :param training: False时不建损失和优化器, dropout关闭, batch norm用训练时的滑动平均
+        '''
+        if sequence_axis == 'channels' and image_width is None:
+            raise ValueError("sequence_axis='channels' needs a fixed image_width")
+        self.training = training
+        self.X = tf.placeholder(tf.float32, [None, image_height, image_width, image_channel])
+        self.Y = tf.sparse_placeholder(tf.int32)
+        self.SEQ_LEN = tf.placeholder(tf.int32, [None])
+        filters = [64, 128, 128, max_stepsize]
+        strides = [1, 2]
+
+        # 1. convolution1
+        x = self.conv2d(self.X, 'cnn_1', 3, image_channel, filters[0], strides[0])
+        x = self.batch_norm('bn1', x)
+        x = self.leaky_relu(x, 0.01)
+        x = self.max_pool(x, 2, strides[1])
+
+        # 2. convolution2
+        x = self.conv2d(x, 'cnn-2', 3, filters[0], filters[1], strides[0])
+        x = self.batch_norm('bn2', x)
+        x = self.leaky_relu(x, 0.01)
+        x = self.max_pool(x, 2, strides[1])
+
+        # 3. convolution3
+        x = self.conv2d(x, 'cnn-3', 3, filters[1], filters[2], strides[0])
+        x = self.batch_norm('bn3', x)
+        x = self.leaky_relu(x, 0.01)
+        x = self.max_pool(x, 2, strides[1])
+
+        # 4. convolution4
+        x = self.conv2d(x, 'cnn-4', 3, filters[2], filters[3], strides[0])
+        x = self.batch_norm('bn4', x)
+        x = self.leaky_relu(x, 0.01)
+        x = self.max_pool(x, 2, strides[1])
+
+        feature_height = -(-image_height // DOWNSAMPLE)
+        s = tf.shape(x)
+        if sequence_axis == 'channels':
+            # [batch, 64, h * w]  每个通道是一个时间步
+            feature_width = -(-image_width // DOWNSAMPLE)
+            x = tf.reshape(x, [s[0], -1, filters[3]])
+            x = tf.transpose(x, [0, 2, 1])
+            x.set_shape([None, filters[3], feature_height * feature_width])
+        elif sequence_axis == 'width':
+            # [batch, w, h * 64]  每一列是一个时间步
+            x = tf.transpose(x, [0, 2, 1, 3])
+            x = tf.reshape(x, [s[0], s[2], feature_height * filters[3]])
+        else:
+            raise ValueError('unknown sequence_axis: %s' % sequence_axis)
+
+        # 5. 两层LSTM
+        keep_prob = 0.8 if training else 1.0
+        cell = tf.contrib.rnn.LSTMCell(num_hidden, state_is_tuple=True)
+        cell = tf.contrib.rnn.DropoutWrapper(cell=cell, output_keep_prob=keep_prob)
+        cell1 = tf.contrib.rnn.LSTMCell(num_hidden, state_is_tuple=True)
+        cell1 = tf.contrib.rnn.DropoutWrapper(cell=cell1, output_keep_prob=keep_prob)
+        stack = tf.contrib.rnn.MultiRNNCell([cell, cell1], state_is_tuple=True)
+        outputs, _ = tf.nn.dynamic_rnn(stack, x, self.SEQ_LEN, dtype=tf.float32)
+
+        # 6. 定义输出
+        outputs = tf.reshape(outputs, [-1, num_hidden])
+        W = tf.get_variable(name='W',
+                            shape=[num_hidden, num_classes],
+                            dtype=tf.float32,
+                            initializer=tf.contrib.layers.xavier_initializer())
+        b = tf.get_variable(name='b',
+                            shape=[num_classes],
+                            dtype=tf.float32,
+                            initializer=tf.constant_initializer())
+
+        self.logits = tf.matmul(outputs, W) + b
+        shape = tf.shape(x)
+        self.logits = tf.reshape(self.logits, [shape[0], -1, num_classes])
+        self.logits = tf.transpose(self.logits, (1, 0, 2))   # [time, batch, num_classes]
+        self.global_step = tf.Variable(0, trainable=False)
+
+        # 7. 解码  greedy和beam search都在图里, 用哪个就取哪个
+        self.greedy_decoded, _ = tf.nn.ctc_greedy_decoder(self.logits, self.SEQ_LEN)
+        self.greedy_dense_decoded = tf.sparse_tensor_to_dense(self.greedy_decoded[0], default_value=-1)
+        self.decoded, self.log_prob = tf.nn.ctc_beam_search_decoder(self.logits,
+                                                                    self.SEQ_LEN,
+                                                                    beam_width=beam_width,
+                                                                    merge_repeated=False)
+        self.dense_decoded = tf.sparse_tensor_to_dense(self.decoded[0], default_value=-1)
+
+        if training:
+            # 8. 定义损失和优化器  batch norm的滑动平均跟着每步一起更新
+            self.loss = tf.nn.ctc_loss(labels=self.Y,
+                                       inputs=self.logits,
+                                       sequence_length=self.SEQ_LEN)
+            self.cost = tf.reduce_mean(self.loss)
+            with tf.control_dependencies(tf.get_collection(tf.GraphKeys.UPDATE_OPS)):
+                self.optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(
+                    self.cost, global_step=self.global_step)
+
+    def conv2d(self, x, name, filter_size, channel_in, channel_out, strides):
+        # 2_dim conv
+        with tf.variable_scope(name):
+            kernel = tf.get_variable(name='W',
+                                     shape=[filter_size, filter_size, channel_in, channel_out])
+            b = tf.get_variable(name='b',
+                                shape=[channel_out, ],
+                                dtype=tf.float32,
+                                initializer=tf.contrib.layers.xavier_initializer())
+            return tf.nn.conv2d(x, kernel, [1, strides, strides, 1], padding='SAME') + b
+
+    def batch_norm(self, name, x, decay=0.99):
+        # batch_normalization  训练时用当前batch的均值方差并更新滑动平均, 推理时用滑动平均 (结果和batch大小无关)
+        with tf.variable_scope(name):
+            params_shape = [x.get_shape()[-1]]
+            # 加入beta和gamma是为了让模型不接近线性
+            beta = tf.get_variable('beta', params_shape, tf.float32,
+                                   initializer=tf.constant_initializer(0.0, tf.float32))
+            gamma = tf.get_variable('gamma', params_shape, tf.float32,
+                                    initializer=tf.constant_initializer(1.0, tf.float32))
+            moving_mean = tf.get_variable('moving_mean', params_shape, tf.float32,
+                                          initializer=tf.constant_initializer(0.0, tf.float32), trainable=False)
+            moving_variance = tf.get_variable('moving_variance', params_shape, tf.float32,
+                                              initializer=tf.constant_initializer(1.0, tf.float32), trainable=False)
+
+            if self.training:
+                mean, variance = tf.nn.moments(x, [0, 1, 2], name='moments')
+                tf.add_to_collection(tf.GraphKeys.UPDATE_OPS, tf.assign(
+                    moving_mean, decay * moving_mean + (1 - decay) * mean))
+                tf.add_to_collection(tf.GraphKeys.UPDATE_OPS, tf.assign(
+                    moving_variance, decay * moving_variance + (1 - decay) * variance))
+            else:
+                mean, variance = moving_mean, moving_variance
+            x_bn = tf.nn.batch_normalization(x, mean, variance, beta, gamma, 0.001)
+            x_bn.set_shape(x.get_shape())
+            return x_bn
+
+    def leaky_relu(self, x, leak=0.0):
+        # leak=0 代表最原始的relu
+        return tf.where(tf.less(x, 0.0), leak*x, x, name='leaky_relu')
+
+    def max_pool(self, x, size, strides):
+        # 最大化池化
+        return tf.nn.max_pool(x, ksize=[1, size, size, 1],
+                              strides=[1, strides, strides, 1],
+                              padding='SAME',
+                              name='max_pool')
@@ -8,14 +8,17 @@
 
 """
 import sklearn.datasets
-import numpy as np
-import re
 import collections
 import random
 from sklearn import metrics
 from nltk.corpus import stopwords
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common.encoding import str_idx
+from common import cleaning
 
-english_stopwords = stopwords.words('english')
+english_stopwords = frozenset(stopwords.words('english'))
 
 
 def clearstring(string):
@@ -24,12 +27,7 @@ def clearstring(string):
     :param string: 穿进来一条语料
     :return: 返回清洗过后的语料
     '''
-    string = re.sub('[^A-Za-z0-9 ]+', '', string)
-    string = string.split(' ')
-    string = filter(None, string)
-    string = [y.strip() for y in string if y.strip() not in english_stopwords]
-    string = ' '.join(string)
-    return string.lower()
+    return cleaning.clearstring(string, english_stopwords)
 
 
 def separate_dataset(trainset, ratio=0.5):
@@ -75,19 +73,3 @@ def build_dataset(words, n_words):
     count[0][1] = unk_count
     reversed_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
     return data, count, dictionary, reversed_dictionary
-
-
-def str_idx(corpus, dic, maxlen, UNK = 3):
-    '''
-    将语料转为对应的id序列
-    :param corpus: 语料
-    :param dic: 词典
-    :param maxlen: 最大长度
-    :param UNK: 未知字符的标记
-    :return: 将语料转为对应的id
-    '''
-    X = np.zeros((len(corpus), maxlen))
-    for i in range(len(corpus)):
-        for no, k in enumerate(corpus[i].split()[:maxlen][::-1]):
-            X[i, -1 - no] = dic.get(k, UNK)
-    return X
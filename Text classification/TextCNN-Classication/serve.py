@@ -0,0 +1,226 @@
+"""
+
+@file  : serve.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+"""
+import json
+import queue
+import random
+import threading
+import time
+import os
+import socketserver
+from concurrent.futures import Future
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.contrib import learn
+
+import data_helpers
+
+# 服务相关参数
+tf.flags.DEFINE_string("checkpoint_dir", "./runs/1563341674/", "Checkpoint directory from training run")
+tf.flags.DEFINE_string("host", "127.0.0.1", "Host to listen on")
+tf.flags.DEFINE_integer("port", 8000, "Port to listen on")
+tf.flags.DEFINE_integer("max_batch_size", 64, "Max sentences in one micro-batch (default: 64)")
+tf.flags.DEFINE_float("batch_window_ms", 5.0, "Max time to wait for more requests before running a batch (default: 5ms)")
+
+# 压测相关参数
+tf.flags.DEFINE_boolean("benchmark", False, "Run the load generator instead of serving")
+tf.flags.DEFINE_string("benchmark_windows", "0,1,2,5,10", "Comma-separated batch windows in ms to benchmark")
+tf.flags.DEFINE_integer("benchmark_clients", 32, "Number of concurrent clients")
+tf.flags.DEFINE_integer("benchmark_requests", 200, "Requests sent by each client")
+tf.flags.DEFINE_string("positive_data_file", "./data/rt-polarity.pos", "Data source for the positive data.")
+tf.flags.DEFINE_string("negative_data_file", "./data/rt-polarity.neg", "Data source for the negative data.")
+
+FLAGS = tf.flags.FLAGS
+
+
+class TextCNNPredictor:
+    # 词表和模型常驻内存  每次请求只做transform和一次sess.run
+    def __init__(self, checkpoint_dir):
+        self.vocab_processor = learn.preprocessing.VocabularyProcessor.restore(os.path.join(checkpoint_dir, "vocab"))
+
+        checkpoint_file = tf.train.latest_checkpoint(os.path.join(checkpoint_dir, "checkpoints"))
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.sess = tf.Session()
+            saver = tf.train.import_meta_graph("{}.meta".format(checkpoint_file))
+            saver.restore(self.sess, checkpoint_file)
+
+        self.input_x = self.graph.get_operation_by_name("input_x").outputs[0]
+        self.dropout_keep_prob = self.graph.get_operation_by_name("dropout_keep_prob").outputs[0]
+        self.predictions = self.graph.get_operation_by_name("output/predictions").outputs[0]
+
+    def predict(self, texts):
+        x = np.array(list(self.vocab_processor.transform([data_helpers.clean_str(text) for text in texts])))
+        return self.sess.run(self.predictions, {self.input_x: x, self.dropout_keep_prob: 1.0})
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=64, max_latency=0.005):
+        '''
+        把并发的请求合并成一个批次再调用模型
+        第一个请求到达后最多再等max_latency秒, 或者凑够max_batch_size句就执行, 再把结果按请求拆开
+        :param predict_fn: list of text -> array of predictions
+        :param max_batch_size: 一个批次最多多少句
+        :param max_latency: 批次窗口(秒)
+        '''
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+        self.n_batches, self.n_texts = 0, 0
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, texts):
+        future = Future()
+        self.queue.put((texts, future))
+        return future
+
+    def __call__(self, texts):
+        return self.submit(texts).result()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            items = [item]
+            n = len(item[0])
+            deadline = time.time() + self.max_latency
+            stop = False
+            while n < self.max_batch_size:
+                remaining = deadline - time.time()
+                try:
+                    # 窗口用完后仍然把已经在队列里的请求一起带上
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+                n += len(item[0])
+            self.run_batch(items)
+            if stop:
+                return
+
+    def run_batch(self, items):
+        texts = [text for item_texts, _ in items for text in item_texts]
+        try:
+            predictions = self.predict_fn(texts)
+        except Exception as e:
+            if len(items) == 1:
+                items[0][1].set_exception(e)
+                return
+            # 合并的批次里可能混进了一个坏请求  逐个请求重跑, 不连累其他客户端
+            for item_texts, future in items:
+                self.run_batch([(item_texts, future)])
+            return
+        self.n_batches += 1
+        self.n_texts += len(texts)
+        start = 0
+        for item_texts, future in items:
+            future.set_result(predictions[start: start + len(item_texts)])
+            start += len(item_texts)
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        # POST /predict  {"texts": ["...", ...]}  ->  {"predictions": [1, 0, ...]}
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_error(404)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf8'))
+                texts = body['texts'] if 'texts' in body else [body['text']]
+            except (ValueError, KeyError, TypeError):
+                texts = None
+            # 进入批次前检查  坏请求不能和其他客户端的请求合并
+            if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+                self.send_error(400, 'expected {"texts": [str, ...]}')
+                return
+            try:
+                predictions = batcher(texts)
+            except Exception as e:
+                self.send_error(500, 'prediction failed', '{}: {}'.format(type(e).__name__, e))
+                return
+            data = json.dumps({'predictions': predictions.tolist()}).encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def benchmark(predictor, texts):
+    # 多个客户端并发, 每次请求一句话; 比较不同批次窗口下的延迟和吞吐
+    settings = [('no batching', 1, 0.0)] + [('window %sms' % w, FLAGS.max_batch_size, float(w) / 1000)
+                                           for w in FLAGS.benchmark_windows.split(',')]
+    for name, max_batch_size, max_latency in settings:
+        batcher = MicroBatcher(predictor.predict, max_batch_size, max_latency)
+        batcher(texts[:1])   # 预热
+        latencies = []
+
+        def client(seed):
+            rng = random.Random(seed)
+            for _ in range(FLAGS.benchmark_requests):
+                start = time.time()
+                batcher([rng.choice(texts)])
+                latencies.append(time.time() - start)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(FLAGS.benchmark_clients)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        batcher.close()
+
+        latencies = np.array(latencies) * 1000
+        print('{}: p50 {:.2f}ms, p99 {:.2f}ms, throughput {:.1f} req/s, avg batch {:.1f}'.format(
+            name, np.percentile(latencies, 50), np.percentile(latencies, 99), len(latencies) / elapsed,
+            batcher.n_texts / max(batcher.n_batches, 1)))
+
+
+def main(argv=None):
+    predictor = TextCNNPredictor(FLAGS.checkpoint_dir)
+    if FLAGS.benchmark:
+        x_text, _ = data_helpers.load_data_and_labels(FLAGS.positive_data_file, FLAGS.negative_data_file)
+        benchmark(predictor, x_text)
+        return
+
+    batcher = MicroBatcher(predictor.predict, FLAGS.max_batch_size, FLAGS.batch_window_ms / 1000)
+    server = ThreadedHTTPServer((FLAGS.host, FLAGS.port), make_handler(batcher))
+    print("Serving on http://{}:{}/predict".format(FLAGS.host, FLAGS.port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -12,9 +12,12 @@ import numpy as np
 import os
 import time
 import datetime
+import sys
 import data_helpers
 from text_cnn import TextCNN
 from tensorflow.contrib import learn
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common.export import export_saved_model
 
 # 参数
 
@@ -183,6 +186,12 @@ def train(x_train, y_train, vocab_processor, x_dev, y_dev):
                     path = saver.save(sess, checkpoint_prefix, global_step=current_step)
                     print("保存模型中:{}".format(path))
 
+            # 导出推理图  dropout_keep_prob固定为1.0后会被常量折叠掉
+            export_saved_model(sess, os.path.join(out_dir, 'export'), {
+                'predictions': ({'input_x': cnn.input_x},
+                                {'predictions': cnn.predictions, 'scores': cnn.scores}),
+            }, fixed={cnn.dropout_keep_prob: 1.0})
+
 
 def main(argv=None):
     x_train, y_train, vocab_processor, x_dev, y_dev = preprocess()
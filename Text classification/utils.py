@@ -8,25 +8,22 @@
 
 """
 import sklearn.datasets
-import numpy as np
-import re
 import collections
 import random
 from sklearn import metrics
 from nltk.corpus import stopwords
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.encoding import str_idx
+from common import cleaning
 
 # 获取英语的停用词
-english_stopwords = stopwords.words('english')
+english_stopwords = frozenset(stopwords.words('english'))
 
 def clearstring(string):
     # 数据预处理
-    string = re.sub('[^A-Za-z0-9 ]+', '', string)  # 过滤无用字符
-    string = string.split(' ')   # 分词
-    string = filter(None, string)   # 过滤空字符
-    # 去除停用词
-    string = [y.strip() for y in string if y.strip() not in english_stopwords]
-    string = ' '.join(string)
-    return string.lower()
+    return cleaning.clearstring(string, english_stopwords)
 
 
 def separate_dataset(trainset, radio=0.5):
@@ -66,16 +63,3 @@ def build_dataset(words, n_words):
     reversed_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
 
     return data, count, dictionary, reversed_dictionary
-
-
-# str_idx(train_X[i:i+batch_size],dictionary,maxlen)
-def str_idx(corpus, dic, maxlen, UNK=3):
-    # corpus 一批数据     dic词典   maxlen 把数据都pad到这个长度
-    X = np.zeros((len(corpus), maxlen), dtype=np.int32)
-    for i in range(len(corpus)):
-        for no, k in enumerate(corpus[i].split()[:maxlen][::-1]):
-            X[i, -1-no] = dic.get(k, UNK)   # UNK 表示获取不到这个词标记为3
-    return X
-
-
-
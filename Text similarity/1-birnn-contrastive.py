@@ -9,17 +9,26 @@
 """
 import tensorflow as tf
 import re
+import json
 import numpy as np
 import pandas as pd
 import collections
 from unidecode import unidecode
 from sklearn.model_selection import train_test_split
 import time
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.encoding import str_idx
+from common.export import export_saved_model
+from common.vector_index import encode_corpus, VectorIndex
+from siamese import build_towers, index_questions, pair_feed
 
 
 # 定义模型
 class Model:
-    def __init__(self, size_layer, num_layers, embedded_size, dict_size, learning_rate, dropout):
+    def __init__(self, size_layer, num_layers, embedded_size, dict_size, learning_rate, dropout, shared=False):
         '''
         :param size_layer: 每步输出的维度
         :param num_layers: 几层
@@ -27,11 +36,16 @@ class Model:
         :param dict_size: 词表大小
         :param learning_rate: 学习率
         :param dropout: dropout率
+        :param shared: 左右是否共用一个编码器 (siamese.build_towers)
         '''
+        # 训练时是dropout, 验证、编码问题库和导出时喂1.0
+        self.keep_prob = tf.placeholder_with_default(float(dropout), shape=[], name='keep_prob')
+        self.inference_feed = {self.keep_prob: 1.0}
+
         def cells(size, reuse=False):
             # 定义单元
             cell = tf.nn.rnn_cell.LSTMCell(size, initializer=tf.orthogonal_initializer(), reuse=reuse)
-            return tf.contrib.rnn.DropoutWrapper(cell, output_keep_prob=dropout)
+            return tf.contrib.rnn.DropoutWrapper(cell, output_keep_prob=self.keep_prob)
 
         # 双向rnn
         def birnn(inputs, scope):
@@ -50,15 +64,12 @@ class Model:
         self.X_left = tf.placeholder(tf.int32, [None, None])
         self.X_right = tf.placeholder(tf.int32, [None, None])
         self.Y = tf.placeholder(tf.float32, [None])
-        self.batch_size = tf.shape(self.X_left)[0]
+        self.batch_size = tf.shape(self.Y)[0]
 
         # embedding for left and right
         encoder_embeddings = tf.Variable(tf.random_uniform([dict_size, embedded_size], -1, 1))
-        embedded_left = tf.nn.embedding_lookup(encoder_embeddings, self.X_left)
-        embedded_right = tf.nn.embedding_lookup(encoder_embeddings, self.X_right)
 
-        self.output_left = birnn(embedded_left, 'left')
-        self.output_right = birnn(embedded_right, 'right')
+        build_towers(self, birnn, encoder_embeddings, shared)
 
         # distance 欧氏距离
         self.distance = tf.sqrt(tf.reduce_sum(tf.square(tf.subtract(self.output_left, self.output_right)), 1, keep_dims=True))
@@ -113,23 +124,6 @@ def build_dataset(words, n_words):
     return data, count, dictionary, reversed_dictionary
 
 
-def str_idx(corpus, dic, maxlen, UNK=3):
-    '''
-    将语料转为对应的id序列
-    :param corpus: 语料
-    :param dic: 词典
-    :param maxlen: 最大长度
-    :param UNK: 不知道的标号
-    :return:
-    '''
-    X = np.zeros((len(corpus), maxlen))
-    for i in range(len(corpus)):
-        for no, k in enumerate(corpus[i][:maxlen][::-1]):
-            val = dic[k] if k in dic else UNK
-            X[i, -1 - no] = val
-    return X
-
-
 def cleaning(string):
     '''
     简单清洗语料
@@ -143,6 +137,11 @@ def cleaning(string):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shared', action='store_true', help='左右共用一个编码器, 参数减半')
+    parser.add_argument('--dedup', action='store_true', help='同一个batch里重复的问题只编码一次')
+    args = parser.parse_args()
+
     df = pd.read_csv('./data/quora_duplicate_questions.tsv', delimiter='\t').dropna()
     print(df.head())
 
@@ -174,20 +173,18 @@ if __name__ == '__main__':
     batch_size = 128
     dropout = 0.8
 
-    # 将语料转为id序列
-    vectors_left = str_idx(left, vocab2id, maxlen)
-    vectors_right = str_idx(right, vocab2id, maxlen)
+    # 将语料转为id序列  每个不同的问题只转一次, 句对用两个问题的下标表示
+    questions, left_ids, right_ids = index_questions(left, right)
+    vectors = str_idx(questions, vocab2id, maxlen)
 
     # 切分数据集
-    train_X_left, test_X_left, train_X_right, test_X_right, train_Y, test_Y = train_test_split(vectors_left,
-                                                                                               vectors_right,
-                                                                                               label,
-                                                                                               test_size=0.2)
+    train_left, test_left, train_right, test_right, train_Y, test_Y = train_test_split(left_ids, right_ids, label,
+                                                                                       test_size=0.2)
 
     # 开始训练
     tf.reset_default_graph()
     sess = tf.Session()
-    model = Model(size_layer, num_layers, embedded_size, len(vocab2id), learning_rate, dropout)
+    model = Model(size_layer, num_layers, embedded_size, len(vocab2id), learning_rate, dropout, shared=args.shared)
     sess.run(tf.global_variables_initializer())
     EARLY_STOPPING, CURRENT_CHECKPOINT, CURRENT_ACC, EPOCH = 3, 0, 0, 0
     while True:
@@ -195,42 +192,39 @@ if __name__ == '__main__':
             print('break epoch: %d\n' % EPOCH)
             break
         train_acc, train_loss, test_acc, test_loss = 0, 0, 0, 0
+        train_encoded, test_encoded = 0, 0
         # train_acc_list, train_loss_list, test_acc_list, test_loss_list = [], [], [], []  # 收集每步的损失　
-        for i in range(0, len(train_X_left), batch_size):
-            batch_x_left = train_X_left[i: min(i + batch_size, train_X_left.shape[0])]
-            batch_x_right = train_X_right[i: min(i + batch_size, train_X_left.shape[0])]
-            batch_y = train_Y[i: min(i + batch_size, train_X_left.shape[0])]
-            acc, loss, _ = sess.run([model.accuracy, model.cost, model.optimizer],
-                                    feed_dict={
-                                        model.X_left: batch_x_left,
-                                        model.X_right: batch_x_right,
-                                        model.Y: batch_y
-                                    }
-                                    )
+        for i in range(0, len(train_left), batch_size):
+            feed_dict, n_encoded = pair_feed(model, vectors, train_left[i: i + batch_size], train_right[i: i + batch_size],
+                                             args.dedup)
+            feed_dict[model.Y] = train_Y[i: i + batch_size]
+            train_encoded += n_encoded
+            acc, loss, _ = sess.run([model.accuracy, model.cost, model.optimizer], feed_dict=feed_dict)
             assert not np.isnan(loss)
             train_loss += loss
             train_acc += acc
             print("training--epoch: %d, step: %d, loss: %f, accuracy: %f" % (EPOCH, i // batch_size, loss, acc))
 
         # 测试集进行测试
-        for i in range(0, len(test_X_left), batch_size):
-            batch_x_left = test_X_left[i: min(i + batch_size, test_X_left.shape[0])]
-            batch_x_right = test_X_right[i: min(i + batch_size, test_X_left.shape[0])]
-            batch_y = test_Y[i: min(i + batch_size, test_X_left.shape[0])]
-            acc, loss = sess.run([model.accuracy, model.cost],
-                                 feed_dict={
-                                     model.X_left: batch_x_left,
-                                     model.X_right: batch_x_right,
-                                     model.Y: batch_y
-                                 })
+        for i in range(0, len(test_left), batch_size):
+            feed_dict, n_encoded = pair_feed(model, vectors, test_left[i: i + batch_size], test_right[i: i + batch_size],
+                                             args.dedup)
+            feed_dict[model.Y] = test_Y[i: i + batch_size]
+            feed_dict.update(model.inference_feed)
+            test_encoded += n_encoded
+            acc, loss = sess.run([model.accuracy, model.cost], feed_dict=feed_dict)
             test_loss += loss
             test_acc += acc
             print("testing--epoch: %d, step: %d, loss: %f, accuracy: %f" % (EPOCH, i // batch_size, loss, acc))
 
-        train_loss /= (len(train_X_left) / batch_size)
-        train_acc /= (len(train_X_left) / batch_size)
-        test_loss /= (len(test_X_left) / batch_size)
-        test_acc /= (len(test_X_left) / batch_size)
+        train_loss /= (len(train_left) / batch_size)
+        train_acc /= (len(train_left) / batch_size)
+        test_loss /= (len(test_left) / batch_size)
+        test_acc /= (len(test_left) / batch_size)
+
+        # 每个句对平均编码了几次问题  不去重时是2
+        print('epoch: %d, encoded per pair: train %f, test %f' % (EPOCH, train_encoded / len(train_left),
+                                                                    test_encoded / len(test_left)))
 
         if test_acc > CURRENT_ACC:
             # 测试集的准确率大于刚才的准确率 则继续进行训练
@@ -244,9 +238,33 @@ if __name__ == '__main__':
                                                                                                    train_acc, test_loss,
                                                                                                    test_acc))
 
+    # 导出两个塔的编码器  问题库只编码一次, 新问题编码一次再查索引, 不需要和库里每个问题配对跑一遍模型
+    export_saved_model(sess, './export/similarity', {
+        'encode_left': ({'X': model.left_encoder[0]}, {'vectors': model.left_encoder[1]}),
+        'encode_right': ({'X': model.right_encoder[0]}, {'vectors': model.right_encoder[1]}),
+    }, fixed=model.inference_feed)
+    with open('./export/similarity_vocab.json', 'w') as f:
+        json.dump({'vocab2id': vocab2id, 'maxlen': maxlen}, f)
+
+    # 问题库用右塔编码, 查询用左塔编码, 和训练时的distance一致
+    def encode_right(x):
+        return sess.run(model.right_encoder[1], feed_dict={model.right_encoder[0]: x, **model.inference_feed})
+
+    question_vectors = encode_corpus(encode_right, vectors, './data/questions.vectors.npy')
+    index = VectorIndex(question_vectors.shape[1], metric='contrastive')
+    index.add(question_vectors)
+    index.save('./data/questions.index')
+
+    query = str_idx([cleaning('How can I learn Python quickly?')], vocab2id, maxlen)
+    ids, dists = index.search(sess.run(model.left_encoder[1],
+                                       feed_dict={model.left_encoder[0]: query, **model.inference_feed}), k=5)
+    for i, d in zip(ids[0], dists[0]):
+        print('similarity: %f, %s' % (1 - d, questions[i]))
+
     left = str_idx(['a person is outdoors, on a horse.'], vocab2id, maxlen)
     right = str_idx(['a person on a horse jumps over a broken down airplane.'], vocab2id, maxlen)
     sess.run([model.temp_sim, 1-model.distance],
              feed_dict={
                  model.X_left: left,
-                 model.X_right: right})
+                 model.X_right: right,
+                 **model.inference_feed})
@@ -14,6 +14,10 @@ import pandas as pd
 import collections
 from unidecode import unidecode
 from sklearn.model_selection import train_test_split
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.encoding import str_idx
 
 
 def position_encoding(inputs):
@@ -105,23 +109,6 @@ def build_dataset(words, n_words):
     return data, count, dictionary, reversed_dictionary
 
 
-def str_idx(corpus, dic, maxlen, UNK=3):
-    '''
-    将语料转为对应的id序列
-    :param corpus: 语料
-    :param dic: 词典
-    :param maxlen: 最大长度
-    :param UNK: 不知道的标号
-    :return:
-    '''
-    X = np.zeros((len(corpus), maxlen))
-    for i in range(len(corpus)):
-        for no, k in enumerate(corpus[i][:maxlen][::-1]):
-            val = dic[k] if k in dic else UNK
-            X[i, -1 - no] = val
-    return X
-
-
 def cleaning(string):
     '''
     简单清洗语料
@@ -228,4 +215,3 @@ if __name__ == '__main__':
         print('epoch: %d, training loss: %f, training acc: %f, valid loss: %f, valid acc: %f\n' % (EPOCH, train_loss,
                                                                                                    train_acc, test_loss,
                                                                                                    test_acc))
-
@@ -17,13 +17,17 @@ import tensorflow as tf
 import pandas as pd
 from sklearn.model_selection import train_test_split
 import time
+import argparse
+from bert_features import convert_corpus
+from rerank import TowerRetriever, BertScorer, benchmark
 
 
 class Model:
-    def __init__(self, dimension_output, learning_rate=2e-5):
+    def __init__(self, dimension_output, learning_rate=2e-5, is_training=True):
         '''
         :param dimension_output:
         :param learning_rate:
+        :param is_training: False时不带dropout, 也不建优化器  在reuse=True的scope里建, 和训练的Model共用参数
         '''
         self.X = tf.placeholder(tf.int32, [None, None])
         self.segment_ids = tf.placeholder(tf.int32, [None, None])
@@ -33,48 +37,41 @@ class Model:
         # 实例化bert模型
         model = modeling.BertModel(
             config=bert_config,
-            is_training=True,
+            is_training=is_training,
             input_ids=self.X,
             input_mask=self.input_masks,
             token_type_ids=self.segment_ids,
-            use_one_hot_embeddings=False
+            use_one_hot_embeddings=False,
+            scope='bert'
         )
 
         # 获取模型的输出 进行dense
         output_layer = model.get_pooled_output()
-        self.logits = tf.layers.dense(output_layer, dimension_output)
+        self.logits = tf.layers.dense(output_layer, dimension_output, name='dense')
         self.logits = tf.identity(self.logits, name='logits')
 
         # 损失
         self.cost = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(logits=self.logits, labels=self.Y))
 
         # 使用bert内置的优化器
-        self.optimizer = optimization.create_optimizer(self.cost, learning_rate, num_train_steps, num_warmup_steps, False)
+        if is_training:
+            self.optimizer = optimization.create_optimizer(self.cost, learning_rate, num_train_steps, num_warmup_steps, False)
 
         # 算准确率
         correct_pred = tf.equal(tf.argmax(self.logits, 1, output_type=tf.int32), self.Y)
         self.accuracy = tf.reduce_mean(tf.cast(correct_pred, tf.float32))
 
 
-def _truncate_seq_pair(tokens_a, tokens_b, max_length):
-    '''
-    把两句话的长度之和缩减到不超过maxlen-3
-    :param tokens_a: 第一句话
-    :param tokens_b: 第二句话
-    :param max_length: 最大长度
-    :return:
-    '''
-    while True:
-        total_length = len(tokens_a) + len(tokens_b)
-        if total_length <= max_length:
-            break
-        if len(tokens_a) > len(tokens_b):
-            tokens_a.pop()
-        else:
-            tokens_b.pop()
-
-
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=None, help='分词的进程数, 默认cpu个数')
+    parser.add_argument('--rerank_benchmark', action='store_true',
+                        help='训练后比较 全部用BERT打分 和 相似度模型召回+BERT重排 (需要先运行1~3之一导出编码器)')
+    parser.add_argument('--n_queries', type=int, default=100)
+    parser.add_argument('--corpus_size', type=int, default=2000)
+    parser.add_argument('--rerank_batch_size', type=int, default=64)
+    args = parser.parse_args()
+
     # 词表　与训练权重　配置文件
     BERT_VOCAB = 'uncased_L-12_H-768_A-12/vocab.txt'
     BERT_INIT_CHKPNT = 'uncased_L-12_H-768_A-12/bert_model.ckpt'
@@ -90,49 +87,9 @@ if __name__ == '__main__':
 
     left, right, label = df['question1'].tolist(), df['question2'].tolist(), df['is_duplicate'].tolist()
 
-    input_ids, input_masks, segment_ids = [], [], []
-
-    for i in range(len(left)):
-        # 分词
-        tokens_a = tokenizer.tokenize(left[i])
-        tokens_b = tokenizer.tokenize(right[i])
-
-        # 将两句话长度缩减到不超过100
-        _truncate_seq_pair(tokens_a, tokens_b, MAX_SEQ_LENGTH - 3)
-
-        tokens = []
-        segment_id = []
-
-        tokens.append("[CLS]")
-        segment_id.append(0)
-
-        # 第一句话全部标记为0
-        for token in tokens_a:
-            tokens.append(token)
-            segment_id.append(0)
-
-        tokens.append("[SEP]")
-        segment_id.append(0)
-
-        # 第二句话全部标记为1
-        for token in tokens_b:
-            tokens.append(token)
-            segment_id.append(1)
-
-        tokens.append("[SEP]")
-        segment_id.append(1)
-
-        input_id = tokenizer.convert_tokens_to_ids(tokens)   # 将文本转为id序列
-        input_mask = [1] * len(input_id)   # 制造mask  有文本就是1,否则就是0
-
-        while len(input_id) < MAX_SEQ_LENGTH:
-            input_id.append(0)
-            input_mask.append(0)
-            segment_id.append(0)
-
-        input_ids.append(input_id)
-        input_masks.append(input_mask)
-        segment_ids.append(segment_id)
+    # 多进程分词, 结果缓存在./data下, 不补齐地存
+    features = convert_corpus(BERT_VOCAB, left, right, MAX_SEQ_LENGTH, cache_dir='./data', workers=args.workers)
+    label = np.array(label, dtype=np.int32)
 
     # 配置文件
     bert_config = modeling.BertConfig.from_json_file(BERT_CONFIG)
@@ -149,6 +106,9 @@ if __name__ == '__main__':
     tf.reset_default_graph()
     sess = tf.Session()
     model = Model(dimension_output, learning_rate)
+    # 测试和重排打分用的图  共用参数, 不带dropout
+    with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+        eval_model = Model(dimension_output, is_training=False)
 
     sess.run(tf.global_variables_initializer())
 
@@ -157,9 +117,8 @@ if __name__ == '__main__':
 
     saver.restore(sess, BERT_INIT_CHKPNT)
 
-    train_input_ids, test_input_ids, train_input_masks, test_input_masks, train_segment_ids, test_segment_ids, train_Y, test_Y = train_test_split(
-        input_ids, input_masks, segment_ids, label, test_size=0.2
-    )
+    train_index, test_index = train_test_split(np.arange(len(features)), test_size=0.2)
+    rng = np.random.RandomState(0)
 
     EARLY_STOPPING, CURRENT_CHECKPOINT, CURRENT_ACC, EPOCH = 3, 0, 0, 0
 
@@ -171,13 +130,11 @@ if __name__ == '__main__':
 
         train_acc, train_loss, test_acc, test_loss = 0, 0, 0, 0
 
-        # 训练
-        for i in range(0, len(train_input_ids), batch_size):
-            index = min(i + batch_size, len(train_input_ids))
-            batch_x = train_input_ids[i: index]
-            batch_masks = train_input_masks[i: index]
-            batch_segment = train_segment_ids[i: index]
-            batch_y = train_Y[i: index]
+        # 训练  按长度分桶, 每个batch只补齐到自己最长的那条
+        train_batches = features.batches(train_index, batch_size, shuffle=True, rng=rng)
+        for step, index in enumerate(train_batches):
+            batch_x, batch_masks, batch_segment = features.batch(index)
+            batch_y = label[index]
 
             acc, cost, _ = sess.run([model.accuracy, model.cost, model.optimizer],
                                     feed_dict={
@@ -190,31 +147,29 @@ if __name__ == '__main__':
             assert not np.isnan(cost)
             train_loss += cost
             train_acc += acc
-            print('training--epoch: %d, step: %d, loss: %f, accuracy: %f' % (EPOCH, i // batch_size, cost, acc))
+            print('training--epoch: %d, step: %d, loss: %f, accuracy: %f' % (EPOCH, step, cost, acc))
 
         # 测试
-        for i in range(0, len(test_input_ids), batch_size):
-            index = min(i + batch_size, len(test_input_ids))
-            batch_x = test_input_ids[i: index]
-            batch_masks = test_input_masks[i: index]
-            batch_segment = test_segment_ids[i: index]
-            batch_y = test_Y[i: index]
-            acc, cost = sess.run([model.accuracy, model.cost],
+        test_batches = features.batches(test_index, batch_size)
+        for step, index in enumerate(test_batches):
+            batch_x, batch_masks, batch_segment = features.batch(index)
+            batch_y = label[index]
+            acc, cost = sess.run([eval_model.accuracy, eval_model.cost],
                                  feed_dict={
-                                     model.Y: batch_y,
-                                     model.X: batch_x,
-                                     model.segment_ids: batch_segment,
-                                     model.input_masks: batch_masks
+                                     eval_model.Y: batch_y,
+                                     eval_model.X: batch_x,
+                                     eval_model.segment_ids: batch_segment,
+                                     eval_model.input_masks: batch_masks
                                  })
 
             test_loss += cost
             test_acc += acc
-            print('testing--epoch: %d, step: %d, loss: %f, accuracy: %f' % (EPOCH, i // batch_size, cost, acc))
+            print('testing--epoch: %d, step: %d, loss: %f, accuracy: %f' % (EPOCH, step, cost, acc))
 
-        train_loss /= len(train_input_ids) / batch_size
-        train_acc /= len(train_input_ids) / batch_size
-        test_loss /= len(test_input_ids) / batch_size
-        test_acc /= len(test_input_ids) / batch_size
+        train_loss /= len(train_batches)
+        train_acc /= len(train_batches)
+        test_loss /= len(test_batches)
+        test_acc /= len(test_batches)
 
         if test_acc > CURRENT_ACC:
             print('epoch: %d, pass acc: %f, current acc: %f' % (EPOCH, CURRENT_ACC, test_acc))
@@ -226,3 +181,12 @@ if __name__ == '__main__':
         print('epoch: %d, training loss: %f, training acc: %f, valid loss: %f, valid acc: %f\n' % (EPOCH, train_loss, train_acc, test_loss, test_acc))
         EPOCH += 1
 
+    if args.rerank_benchmark:
+        # 查询是重复问题对中的question1, 库是对应的question2再加上随机的其他问题
+        duplicates = df[df['is_duplicate'] == 1].sample(args.n_queries, random_state=0)
+        others = df[~df.index.isin(duplicates.index)]['question2'].sample(args.corpus_size - args.n_queries,
+                                                                          random_state=0)
+        corpus = duplicates['question2'].tolist() + others.tolist()
+        scorer = BertScorer(sess, eval_model, tokenizer, MAX_SEQ_LENGTH)
+        benchmark(TowerRetriever(), scorer, duplicates['question1'].tolist(), np.arange(args.n_queries), corpus,
+                  batch_size=args.rerank_batch_size)
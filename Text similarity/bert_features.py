@@ -0,0 +1,235 @@
+"""
+
+@file  : bert_features.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+两句话拼成BERT的输入  [CLS] a [SEP] b [SEP]
+6-bert.py训练和rerank.py重排共用
+    convert_corpus: 整个语料用多进程分词, 结果按 词表/max_seq_length/语料 的hash缓存成 .npz, 再次运行直接读
+    PairFeatures: 不补齐地存 (ids拼在一起 + offsets), 取batch时只补齐到这个batch里最长的那条
+        batches按长度分桶, 同一batch的长度接近, 补齐的位置少  (注意力的计算量随长度平方增长)
+
+"""
+import os
+import hashlib
+from multiprocessing import Pool
+
+import numpy as np
+
+
+def _truncate_seq_pair(tokens_a, tokens_b, max_length):
+    '''
+    把两句话的长度之和缩减到不超过maxlen-3
+    :param tokens_a: 第一句话
+    :param tokens_b: 第二句话
+    :param max_length: 最大长度
+    :return:
+    '''
+    while True:
+        total_length = len(tokens_a) + len(tokens_b)
+        if total_length <= max_length:
+            break
+        if len(tokens_a) > len(tokens_b):
+            tokens_a.pop()
+        else:
+            tokens_b.pop()
+
+
+def tokenize_pair(tokenizer, text_a, text_b, max_seq_length):
+    '''
+    :return: input_id (不补齐), 第一句话连同[CLS][SEP]的长度  (前面的segment_id是0, 后面是1)
+    '''
+    # 分词
+    tokens_a = tokenizer.tokenize(text_a)
+    tokens_b = tokenizer.tokenize(text_b)
+
+    # 将两句话长度缩减到不超过max_seq_length
+    _truncate_seq_pair(tokens_a, tokens_b, max_seq_length - 3)
+
+    tokens = ["[CLS]"] + tokens_a + ["[SEP]"] + tokens_b + ["[SEP]"]
+    return tokenizer.convert_tokens_to_ids(tokens), len(tokens_a) + 2
+
+
+def convert_pair(tokenizer, text_a, text_b, max_seq_length):
+    '''
+    :return: input_id, input_mask, segment_id  都补齐到max_seq_length
+    '''
+    input_id, len_a = tokenize_pair(tokenizer, text_a, text_b, max_seq_length)
+    # 第一句话全部标记为0, 第二句话全部标记为1
+    segment_id = [0] * len_a + [1] * (len(input_id) - len_a)
+    input_mask = [1] * len(input_id)   # 制造mask  有文本就是1,否则就是0
+
+    padding = [0] * (max_seq_length - len(input_id))
+    return input_id + padding, input_mask + padding, segment_id + padding
+
+
+def convert_pairs(tokenizer, pairs, max_seq_length):
+    '''
+    :param pairs: list of (text_a, text_b)
+    :return: input_ids, input_masks, segment_ids  [len(pairs), 这批里最长的长度] int32
+    '''
+    return PairFeatures.from_tokenized([tokenize_pair(tokenizer, a, b, max_seq_length) for a, b in pairs]).batch()
+
+
+def pad_batch(ids, offsets, a_lengths, index):
+    '''
+    :param ids, offsets: 第i条是 ids[offsets[i]: offsets[i + 1]]
+    :param a_lengths: 每条里segment_id为0的长度
+    :param index: 这个batch的下标
+    :return: input_ids, input_masks, segment_ids  [len(index), 这批里最长的长度] int32
+    '''
+    index = np.asarray(index, dtype=np.int64)
+    starts = offsets[index]
+    lengths = offsets[index + 1] - starts
+    width = int(lengths.max()) if len(index) else 0
+    positions = np.arange(width)
+    input_masks = (positions < lengths[:, None]).astype(np.int32)
+    input_ids = np.zeros((len(index), width), dtype=np.int32)
+    # mask按行展开的顺序就是各条ids拼接的顺序
+    within = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    input_ids[input_masks.astype(bool)] = ids[np.repeat(starts, lengths) + within]
+    segment_ids = (positions >= a_lengths[index][:, None]).astype(np.int32) * input_masks
+    return input_ids, input_masks, segment_ids
+
+
+class PairFeatures(object):
+    def __init__(self, ids, offsets, a_lengths):
+        '''
+        :param ids: 所有句对的input_id拼在一起 int32
+        :param offsets: [n + 1]  第i条是 ids[offsets[i]: offsets[i + 1]]
+        :param a_lengths: [n]  第一句话连同[CLS][SEP]的长度
+        '''
+        self.ids = ids
+        self.offsets = offsets
+        self.a_lengths = a_lengths
+
+    @classmethod
+    def from_tokenized(cls, tokenized):
+        # tokenized: list of (input_id, len_a)
+        lengths = np.array([len(input_id) for input_id, _ in tokenized], dtype=np.int64)
+        offsets = np.zeros(len(tokenized) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.array([i for input_id, _ in tokenized for i in input_id], dtype=np.int32)
+        a_lengths = np.array([len_a for _, len_a in tokenized], dtype=np.int64)
+        return cls(ids, offsets, a_lengths)
+
+    @classmethod
+    def concatenate(cls, parts):
+        lengths = np.concatenate([np.diff(part.offsets) for part in parts])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(np.concatenate([part.ids for part in parts]), offsets,
+                   np.concatenate([part.a_lengths for part in parts]))
+
+    def save(self, path):
+        # 先写临时文件, 中途失败不会留下不完整的缓存
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, ids=self.ids, offsets=self.offsets, a_lengths=self.a_lengths)
+        os.replace(path + '.tmp', path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        return cls(arrays['ids'], arrays['offsets'], arrays['a_lengths'])
+
+    def __len__(self):
+        return len(self.a_lengths)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def batch(self, index=None):
+        '''
+        :return: input_ids, input_masks, segment_ids  只补齐到这个batch里最长的长度
+        '''
+        return pad_batch(self.ids, self.offsets, self.a_lengths, np.arange(len(self)) if index is None else index)
+
+    def batches(self, index, batch_size, shuffle=False, rng=None, bucket_size=100):
+        '''
+        按长度分桶: 每 batch_size * bucket_size 条按长度排序再切成batch
+        :param index: 参与的样本下标 (如训练集的下标)
+        :param shuffle: 先打乱样本, 切好的batch再打乱顺序  长度相近的样本仍在同一个batch
+        :return: 每个batch的样本下标
+        '''
+        rng = rng or np.random
+        index = np.asarray(index, dtype=np.int64)
+        if shuffle:
+            index = index[rng.permutation(len(index))]
+        lengths = self.lengths[index]
+        chunk = batch_size * bucket_size
+        batches = []
+        for i in range(0, len(index), chunk):
+            order = index[i: i + chunk][np.argsort(lengths[i: i + chunk], kind='stable')]
+            batches.extend(order[j: j + batch_size] for j in range(0, len(order), batch_size))
+        if shuffle:
+            batches = [batches[k] for k in rng.permutation(len(batches))]
+        return batches
+
+
+# 子进程里的分词器  每个进程初始化一次
+_tokenizer = None
+
+
+def _init_worker(vocab_file, do_lower_case):
+    global _tokenizer
+    from bert import tokenization
+    _tokenizer = tokenization.FullTokenizer(vocab_file=vocab_file, do_lower_case=do_lower_case)
+
+
+def _convert_chunk(args):
+    pairs, max_seq_length = args
+    return PairFeatures.from_tokenized([tokenize_pair(_tokenizer, a, b, max_seq_length) for a, b in pairs])
+
+
+def cache_key(vocab_file, left, right, max_seq_length, do_lower_case=True):
+    # 词表内容 + 参数 + 语料 决定缓存文件, 任何一个变了都重新分词
+    md5 = hashlib.md5()
+    with open(vocab_file, 'rb') as f:
+        md5.update(f.read())
+    md5.update(('%d %d %d\n' % (max_seq_length, do_lower_case, len(left))).encode('utf-8'))
+    for a, b in zip(left, right):
+        md5.update(('%s\t%s\n' % (a, b)).encode('utf-8'))
+    return md5.hexdigest()[:16]
+
+
+def convert_corpus(vocab_file, left, right, max_seq_length, do_lower_case=True, cache_dir='./data', workers=None,
+                   chunk_size=2000):
+    '''
+    :param vocab_file: BERT的vocab.txt
+    :param left, right: 两句话的列表
+    :param cache_dir: 缓存目录  None表示不缓存
+    :param workers: 分词的进程数  默认cpu个数, 1表示在当前进程里做
+    :return: PairFeatures
+    '''
+    path = None
+    if cache_dir is not None:
+        key = cache_key(vocab_file, left, right, max_seq_length, do_lower_case)
+        path = os.path.join(cache_dir, 'bert_features.%d.%s.npz' % (max_seq_length, key))
+        if os.path.exists(path):
+            return PairFeatures.load(path)
+
+    pairs = list(zip(left, right))
+    chunks = [(pairs[i: i + chunk_size], max_seq_length) for i in range(0, len(pairs), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(vocab_file, do_lower_case)
+        parts = [_convert_chunk(chunk) for chunk in chunks]
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=(vocab_file, do_lower_case))
+        try:
+            # imap保持顺序
+            parts = list(pool.imap(_convert_chunk, chunks))
+        finally:
+            pool.close()
+            pool.join()
+    features = PairFeatures.concatenate(parts) if parts else PairFeatures.from_tokenized([])
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        features.save(path)
+    return features
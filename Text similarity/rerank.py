@@ -0,0 +1,162 @@
+"""
+
+@file  : rerank.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+两阶段的相似问题检索
+    TowerRetriever: 1~3中相似度模型导出的编码器 + VectorIndex, 新问题编码一次再查索引, 取出前k个候选
+    BertScorer: 6-bert.py的Model对 (问题, 候选) 打分, 按batch送进BERT
+    Cascade: 只对召回的k个候选用BERT重新打分排序
+    benchmark: 在一个问题子集上比较 全部用BERT打分 / 只用召回 / 召回+重排 的recall@1和每秒查询数
+
+"""
+import os
+import re
+import sys
+import json
+import time
+
+import numpy as np
+from unidecode import unidecode
+
+from bert_features import convert_pairs
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.encoding import str_idx
+from common.export import ExportedModel
+from common.vector_index import VectorIndex
+
+
+def cleaning(string):
+    # 和1~3训练时的cleaning一致
+    string = unidecode(string).replace('.', ' . ').replace(',', ' , ')
+    string = re.sub('[^A-Za-z\- ]+', ' ', string)
+    string = re.sub(r'[ ]+', ' ', string).strip()
+    return string.lower()
+
+
+class TowerRetriever(object):
+    def __init__(self, export_dir='./export/similarity', vocab_file='./export/similarity_vocab.json', index=None):
+        '''
+        :param export_dir: 1~3导出的编码器 (encode_left / encode_right 两个签名)
+        :param vocab_file: 训练时的词表和maxlen
+        :param index: 已经建好的VectorIndex (如1~3保存的问题库索引)  None时用build_index建
+        '''
+        self.model = ExportedModel(export_dir)
+        with open(vocab_file) as f:
+            meta = json.load(f)
+        self.vocab2id, self.maxlen = meta['vocab2id'], meta['maxlen']
+        self.index = index
+
+    def encode(self, texts, side='left', batch_size=1024):
+        # 查询用左塔, 库用右塔 (和训练时的distance一致)
+        ids = str_idx([cleaning(text) for text in texts], self.vocab2id, self.maxlen)
+        return np.concatenate([self.model.predict('encode_' + side, X=ids[i: i + batch_size])['vectors']
+                               for i in range(0, len(ids), batch_size)])
+
+    def build_index(self, corpus, train_size=20000):
+        vectors = self.encode(corpus, 'right')
+        self.index = VectorIndex(vectors.shape[1], metric='contrastive', train_size=train_size)
+        self.index.add(vectors)
+        return self.index
+
+    def __call__(self, queries, k):
+        '''
+        :return: 候选在库中的下标 [len(queries), k]  不足k个为-1
+        '''
+        return self.index.search(self.encode(queries, 'left'), k)[0]
+
+
+class BertScorer(object):
+    def __init__(self, sess, model, tokenizer, max_seq_length=100):
+        '''
+        :param sess: 6-bert.py训练好的会话
+        :param model: 6-bert.py里is_training=False建的Model (不带dropout, 打分是确定的)  第1类的概率作为相似度
+        '''
+        self.sess = sess
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+
+    def __call__(self, pairs):
+        input_ids, input_masks, segment_ids = convert_pairs(self.tokenizer, pairs, self.max_seq_length)
+        logits = self.sess.run(self.model.logits, feed_dict={
+            self.model.X: input_ids,
+            self.model.segment_ids: segment_ids,
+            self.model.input_masks: input_masks
+        })
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+        return probs[:, 1]
+
+
+def score_in_batches(scorer, pairs, batch_size):
+    if not pairs:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate([scorer(pairs[i: i + batch_size]) for i in range(0, len(pairs), batch_size)])
+
+
+class Cascade(object):
+    def __init__(self, retriever, scorer, k=20, batch_size=64):
+        '''
+        :param retriever: TowerRetriever
+        :param scorer: BertScorer  list of (a, b) -> 相似度
+        :param k: 召回的候选个数  只有这k个会送进BERT
+        :param batch_size: 重排时每次送进BERT的句对数  多个查询的候选拼在一起凑batch
+        '''
+        self.retriever = retriever
+        self.scorer = scorer
+        self.k = k
+        self.batch_size = batch_size
+
+    def __call__(self, queries, corpus, top_n=1):
+        '''
+        :param queries: 新问题
+        :param corpus: 索引里的问题文本 (下标和索引一致)
+        :return: ids [len(queries), top_n], scores [len(queries), top_n]  按BERT的分数从高到低
+        '''
+        candidates = self.retriever(queries, self.k)
+        rows, cols = np.nonzero(candidates >= 0)
+        pairs = [(queries[n], corpus[candidates[n, j]]) for n, j in zip(rows, cols)]
+        scores = np.full(candidates.shape, -np.inf, dtype=np.float32)
+        scores[rows, cols] = score_in_batches(self.scorer, pairs, self.batch_size)
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :top_n]
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def benchmark(retriever, scorer, queries, gold, corpus, ks=(5, 10, 20, 50), batch_size=64, full=True):
+    '''
+    :param queries: 查询
+    :param gold: queries[i] 的正确答案是 corpus[gold[i]]
+    :param corpus: 问题库 (正确答案 + 干扰项)
+    :param ks: 召回的候选个数
+    :param full: 是否也跑 每个查询和整个库都用BERT打分 (很慢, 库要小)
+    '''
+    gold = np.asarray(gold)
+    retriever.build_index(corpus)
+    rows = []
+    if full:
+        start, hits = time.time(), 0
+        for n, query in enumerate(queries):
+            scores = score_in_batches(scorer, [(query, text) for text in corpus], batch_size)
+            hits += int(scores.argmax() == gold[n])
+        rows.append(('bert-all', len(corpus), hits / len(queries), len(queries) / (time.time() - start)))
+
+    start = time.time()
+    candidates = retriever(queries, max(ks))
+    seconds = time.time() - start
+    rows.append(('tower', 1, float(np.mean(candidates[:, 0] == gold)), len(queries) / seconds))
+    for k in ks:
+        print('tower recall@%d: %f' % (k, np.mean((candidates[:, :k] == gold[:, None]).any(axis=1))))
+
+    for k in ks:
+        start = time.time()
+        ids, _ = Cascade(retriever, scorer, k, batch_size)(queries, corpus)
+        rows.append(('tower+bert', k, float(np.mean(ids[:, 0] == gold)), len(queries) / (time.time() - start)))
+
+    print('%-12s %8s %10s %12s' % ('pipeline', 'k', 'recall@1', 'queries/s'))
+    for name, k, recall, qps in rows:
+        print('%-12s %8d %10.4f %12.2f' % (name, k, recall, qps))
+    return rows
@@ -0,0 +1,80 @@
+"""
+
+@file  : siamese.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+1~3对比损失模型共用的左右两塔
+    build_towers: shared=False 时左右各一个编码器 (原来的做法); shared=True 时共用一套参数, 左右拼成一个batch只跑一次编码器
+        编码结果再按 left_index / right_index 取出每个句对的左右句向量
+    pair_feed: 训练时按问题去重  同一个batch里重复出现的问题只编码一次, 用下标取给每个句对
+
+"""
+import collections
+
+import numpy as np
+import tensorflow as tf
+
+
+def build_towers(model, encoder, embeddings, shared=False):
+    '''
+    :param model: 已经有 X_left, X_right 两个placeholder
+    :param encoder: encoder(embedded, scope) -> [batch, dim]
+    :param embeddings: 词向量矩阵
+    :param shared: 左右是否共用一个编码器  共用时X_left和X_right要补齐到同样的长度
+    设置 model.output_left, model.output_right: 每个句对的左右句向量
+        model.left_index, model.right_index: 句对到编码结果的下标  不喂时就是一一对应
+        model.left_encoder, model.right_encoder: (输入, 句向量)  导出和给问题库编码用
+        shared=True时还有 model.X: 要编码的问题  不喂时是X_left和X_right拼起来
+    '''
+    model.shared = shared
+    n_left, n_right = tf.shape(model.X_left)[0], tf.shape(model.X_right)[0]
+    if shared:
+        model.X = tf.placeholder_with_default(tf.concat([model.X_left, model.X_right], 0), [None, None])
+        encoded_left = encoded_right = encoder(tf.nn.embedding_lookup(embeddings, model.X), 'encoder')
+        default_right = tf.range(n_left, n_left + n_right)
+        model.left_encoder = model.right_encoder = (model.X, encoded_left)
+    else:
+        encoded_left = encoder(tf.nn.embedding_lookup(embeddings, model.X_left), 'left')
+        encoded_right = encoder(tf.nn.embedding_lookup(embeddings, model.X_right), 'right')
+        default_right = tf.range(n_right)
+        model.left_encoder = (model.X_left, encoded_left)
+        model.right_encoder = (model.X_right, encoded_right)
+
+    model.left_index = tf.placeholder_with_default(tf.range(n_left), [None])
+    model.right_index = tf.placeholder_with_default(default_right, [None])
+    model.output_left = tf.gather(encoded_left, model.left_index)
+    model.output_right = tf.gather(encoded_right, model.right_index)
+
+
+def index_questions(left, right):
+    '''
+    :return: questions 去重后的问题 (按第一次出现的顺序), left_ids, right_ids 每个句对的两个问题在questions里的下标
+    '''
+    questions = list(collections.OrderedDict.fromkeys(left + right))
+    question2id = {question: i for i, question in enumerate(questions)}
+    left_ids = np.array([question2id[question] for question in left], dtype=np.int64)
+    right_ids = np.array([question2id[question] for question in right], dtype=np.int64)
+    return questions, left_ids, right_ids
+
+
+def pair_feed(model, vectors, left_ids, right_ids, dedup=False):
+    '''
+    :param vectors: 所有问题的id序列 (str_idx(questions, ...))
+    :param left_ids, right_ids: 这个batch里句对的问题下标
+    :param dedup: 是否去重  shared时左右一起去重, 否则左右各自去重
+    :return: feed_dict (不含Y), 这个batch实际编码的问题数
+    '''
+    if not dedup:
+        return {model.X_left: vectors[left_ids], model.X_right: vectors[right_ids]}, len(left_ids) + len(right_ids)
+    if model.shared:
+        unique, inverse = np.unique(np.concatenate([left_ids, right_ids]), return_inverse=True)
+        return {model.X: vectors[unique],
+                model.left_index: inverse[:len(left_ids)],
+                model.right_index: inverse[len(left_ids):]}, len(unique)
+    left_unique, left_index = np.unique(left_ids, return_inverse=True)
+    right_unique, right_index = np.unique(right_ids, return_inverse=True)
+    return {model.X_left: vectors[left_unique], model.X_right: vectors[right_unique],
+            model.left_index: left_index, model.right_index: right_index}, len(left_unique) + len(right_unique)
@@ -0,0 +1,125 @@
+"""
+
+@file  : atec_data.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+ATEC句子相似度数据
+    load_dataset: 逐行读文件, 一遍同时建字表和转id  两句话各自用 (offsets, ids) 存成int32, 不补齐
+        字表按字频从高到低编号, 0 代表unk, 也用来补齐 (和原来的build_char一致)
+    ATECDataset.batches: 每个epoch打乱后切成互不重叠的batch, 每个batch只补齐到这个batch里最长的句子
+    prefetch: common.prefetch  后台线程提前准备batch, 放进队列
+
+"""
+import os
+import sys
+from array import array
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common.encoding import pad, take
+from common.prefetch import prefetch
+
+
+def read_pairs(path):
+    # 每行: 编号 \t 句子1 \t 句子2 \t 标签
+    with open(path, 'r', encoding='utf8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            _, s1, s2, label = line.split('\t')
+            yield s1, s2, int(label)
+
+
+def _finish_vocab(first_seen, ids, min_count):
+    '''
+    按第一次出现的顺序编的id 换成按字频排序的id
+    :param first_seen: {字: 第一次出现时给的id (从1开始)}
+    :param ids: 用first_seen编码的所有id
+    :return: char2id, 旧id到新id的映射表
+    '''
+    counts = np.bincount(ids, minlength=len(first_seen) + 1)
+    chars = sorted(first_seen, key=lambda c: (-counts[first_seen[c]], first_seen[c]))
+    char2id = {'unk': 0}
+    remap = np.zeros(len(first_seen) + 1, dtype=np.int32)
+    for c in chars:
+        if counts[first_seen[c]] < min_count:
+            break
+        char2id[c] = len(char2id)
+        remap[first_seen[c]] = char2id[c]
+    return char2id, remap
+
+
+def load_dataset(path, char2id=None, min_count=1):
+    '''
+    :param path: 训练或测试文件
+    :param char2id: 已有的字表 (如测试集用训练集的字表)  None表示从这份数据建
+    :param min_count: 建字表时出现次数少于这个的字当作unk
+    :return: ATECDataset, char2id
+    '''
+    build = char2id is None
+    lookup = {} if build else char2id
+    offsets = [array('q', [0]), array('q', [0])]
+    ids = [array('i'), array('i')]
+    labels = array('i')
+    for s1, s2, label in read_pairs(path):
+        for side, sentence in enumerate((s1, s2)):
+            if build:
+                ids[side].extend([lookup.setdefault(c, len(lookup) + 1) for c in sentence])
+            else:
+                ids[side].extend([lookup.get(c, 0) for c in sentence])
+            offsets[side].append(len(ids[side]))
+        labels.append(label)
+
+    offsets = [np.frombuffer(o, dtype=np.int64) for o in offsets]
+    ids = [np.frombuffer(i, dtype=np.int32) for i in ids]
+    if build:
+        char2id, remap = _finish_vocab(lookup, np.concatenate(ids), min_count)
+        ids = [remap[i] for i in ids]
+    data = ATECDataset(offsets[0], ids[0], offsets[1], ids[1], np.frombuffer(labels, dtype=np.int32))
+    return data, char2id
+
+
+class ATECDataset(object):
+    def __init__(self, left_offsets, left_ids, right_offsets, right_ids, labels):
+        '''
+        第i对是 left_ids[left_offsets[i]: left_offsets[i + 1]] 和 right_ids[right_offsets[i]: right_offsets[i + 1]]
+        '''
+        self.left_offsets = left_offsets
+        self.left_ids = left_ids
+        self.right_offsets = right_offsets
+        self.right_ids = right_ids
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def maxlen(self):
+        return int(max(np.diff(self.left_offsets).max(), np.diff(self.right_offsets).max())) if len(self) else 0
+
+    def batch(self, index):
+        '''
+        :return: x1, x2 [len(index), 本batch最长的长度] int32 右边补0, y [len(index)]
+        '''
+        x1 = pad(*take(self.left_offsets, self.left_ids, index), padding='post')
+        x2 = pad(*take(self.right_offsets, self.right_ids, index), padding='post')
+        return x1, x2, self.labels[index]
+
+    def batches(self, batch_size, shuffle=True, rng=None, drop_last=False):
+        '''
+        一个epoch的所有batch的下标  每条数据恰好出现一次
+        '''
+        rng = rng or np.random
+        order = rng.permutation(len(self)) if shuffle else np.arange(len(self))
+        end = len(order) // batch_size * batch_size if drop_last else len(order)
+        return [order[i: min(i + batch_size, end)] for i in range(0, end, batch_size)]
+
+    def iter_batches(self, batch_size, shuffle=True, rng=None, drop_last=False):
+        for index in self.batches(batch_size, shuffle, rng, drop_last):
+            yield self.batch(index)
+
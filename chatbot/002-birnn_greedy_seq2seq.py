@@ -11,6 +11,10 @@ import re
 import collections
 import json
 import tensorflow as tf
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.bucketing import BucketSampler, gather
 
 
 def build_dataset(words, n_words, atleast=1):
@@ -312,12 +316,15 @@ if __name__ == '__main__':
 
     sess.run(tf.global_variables_initializer())
 
+    # 长度相近的问答放在同一批次  减少补齐
+    sampler = BucketSampler(X, Y, batch_size=batch_size)
+    print('补齐浪费比例:', sampler.report())
+
     for i in range(epoch):
         total_loss, total_accuracy = 0, 0
-        for k in range(0, len(short_questions), batch_size):
-            index = min(k + batch_size, len(short_questions))
-            batch_x, seq_x = pad_sentence_batch(X[k: index], PAD)
-            batch_y, seq_y = pad_sentence_batch(Y[k: index], PAD)
+        for batch_ids in sampler:
+            batch_x, seq_x = pad_sentence_batch(gather(X, batch_ids), PAD)
+            batch_y, seq_y = pad_sentence_batch(gather(Y, batch_ids), PAD)
 
             predicted, accuracy, loss, _ = sess.run([model.predicting_ids, model.accuracy, model.cost, model.optimizer],
                                                     feed_dict={model.X: batch_x, model.Y: batch_y})
@@ -9,12 +9,14 @@
 """
 import numpy as np
 import tensorflow as tf
-from sklearn.utils import shuffle
 import re
 import time
 import collections
 import os
 import matplotlib.pyplot as plt
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.bucketing import BucketSampler, gather
 
 
 # 定义模型
@@ -352,20 +354,22 @@ if __name__ == '__main__':
     loss_list = []
     accuracy_list = []
 
+    # 问题是补齐到固定长度的  只按回答的长度分桶
+    sampler = BucketSampler(Y, batch_size=batch_size)
+    print('补齐浪费比例:', sampler.report())
+
     for i in range(epoch):
         total_loss, total_accuracy = 0, 0
-        X, Y = shuffle(X, Y)
-        for k in range(0, len(short_questions), batch_size):
-            index = min(k + batch_size, len(short_questions))
-            batch_x, _ = pad_sentence_batch_static(X[k: index], PAD)
-            batch_y, seq_y = pad_sentence_batch(Y[k: index], PAD)
+        for step, batch_ids in enumerate(sampler):
+            batch_x, _ = pad_sentence_batch_static(gather(X, batch_ids), PAD)
+            batch_y, seq_y = pad_sentence_batch(gather(Y, batch_ids), PAD)
             predicted, loss, _, accuracy = sess.run([model.predicting_ids, model.cost,
                                                      model.optimizer, model.accuracy],
                                                     feed_dict={model.X: batch_x,
                                                                model.Y: batch_y})
             total_loss += loss
             total_accuracy += accuracy
-            print('epoch: %d, step: %d, loss: %f, accuracy: %f' % (i, k//batch_size, loss, accuracy))
+            print('epoch: %d, step: %d, loss: %f, accuracy: %f' % (i, step, loss, accuracy))
 
         total_loss /= (len(short_questions) / batch_size)
         total_accuracy /= (len(short_questions) / batch_size)
@@ -375,11 +379,9 @@ if __name__ == '__main__':
 
     for i in range(epoch):
         total_loss, total_accuracy = 0, 0
-        X, Y = shuffle(X, Y)
-        for k in range(0, len(short_questions), batch_size):
-            index = min(k+batch_size, len(short_questions))
-            batch_x, _ = pad_sentence_batch_static(X[k: index], PAD)
-            batch_y, seq_y = pad_sentence_batch(Y[k: index], PAD)
+        for step, batch_ids in enumerate(sampler):
+            batch_x, _ = pad_sentence_batch_static(gather(X, batch_ids), PAD)
+            batch_y, seq_y = pad_sentence_batch(gather(Y, batch_ids), PAD)
             predicted, loss, _, accuracy = sess.run([model.predicting_ids, model.cost,
                                                      model.optimizer, model.accuracy],
                                                     feed_dict={model.X: batch_x,
@@ -387,7 +389,7 @@ if __name__ == '__main__':
 
             total_loss += loss
             total_accuracy += accuracy
-            print('epoch: %d, step: %d, loss: %f, accuracy: %f' % (i, k//batch_size, loss, accuracy))
+            print('epoch: %d, step: %d, loss: %f, accuracy: %f' % (i, step, loss, accuracy))
 
         total_loss /= (len(short_questions) / batch_size)
         total_accuracy /= (len(short_questions) / batch_size)
@@ -87,7 +87,7 @@ def attention_mask(nd, ns, *, dtype):
     return tf.cast(m, dtype)
 
 
-def attn(x, scope, n_state, *, past, hparams):
+def attn(x, scope, n_state, *, past, hparams, pad_lengths = None):
     assert x.shape.ndims == 3  # Should be [batch, sequence, features]
     assert n_state % hparams.n_head == 0
     if past is not None:
@@ -108,6 +108,10 @@ def attn(x, scope, n_state, *, past, hparams):
         _, _, nd, ns = shape_list(w)
         b = attention_mask(nd, ns, dtype = w.dtype)
         b = tf.reshape(b, [1, 1, nd, ns])
+        if pad_lengths is not None:
+            # Left-padded rows: the first pad_lengths[i] key positions of row i are padding
+            key_mask = tf.cast(tf.range(ns)[None, :] >= pad_lengths[:, None], w.dtype)
+            b = b * tf.reshape(key_mask, [-1, 1, 1, ns])
         w = w * b - tf.cast(1e10, w.dtype) * (1 - b)
         return w
 
@@ -143,11 +147,12 @@ def mlp(x, scope, n_state, *, hparams):
         return h2
 
 
-def block(x, scope, *, past, hparams):
+def block(x, scope, *, past, hparams, pad_lengths = None):
     with tf.variable_scope(scope):
         nx = x.shape[-1].value
         a, present = attn(
-            norm(x, 'ln_1'), 'attn', nx, past = past, hparams = hparams
+            norm(x, 'ln_1'), 'attn', nx, past = past, hparams = hparams,
+            pad_lengths = pad_lengths
         )
         x = x + a
         m = mlp(norm(x, 'ln_2'), 'mlp', nx * 4, hparams = hparams)
@@ -176,10 +181,18 @@ def expand_tile(value, size):
 def positions_for(tokens, past_length):
     batch_size = tf.shape(tokens)[0]
     nsteps = tf.shape(tokens)[1]
+    if isinstance(past_length, tf.Tensor) and past_length.shape.ndims == 1:
+        # Per-row past_length; padding slots get negative positions, clamp them to 0
+        return tf.maximum(past_length[:, None] + tf.range(nsteps)[None, :], 0)
     return expand_tile(past_length + tf.range(nsteps), batch_size)
 
 
-def model(hparams, X, past = None, scope = 'model', reuse = False):
+def model(hparams, X, past = None, scope = 'model', reuse = False, pad_lengths = None):
+    """
+    pad_lengths: optional [batch] int32, number of left-padding slots of each row
+    (in past + X). Padding is masked out of attention and positions restart at 0
+    after it, so a batch of prompts with different lengths can share one past.
+    """
     with tf.variable_scope(scope, reuse = reuse):
         results = {}
         batch, sequence = shape_list(X)
@@ -195,6 +208,8 @@ def model(hparams, X, past = None, scope = 'model', reuse = False):
             initializer = tf.random_normal_initializer(stddev = 0.02),
         )
         past_length = 0 if past is None else tf.shape(past)[-2]
+        if pad_lengths is not None:
+            past_length = past_length - pad_lengths
         h = tf.gather(wte, X) + tf.gather(wpe, positions_for(X, past_length))
 
         # Transformer
@@ -206,7 +221,10 @@ def model(hparams, X, past = None, scope = 'model', reuse = False):
         )
         assert len(pasts) == hparams.n_layer
         for layer, past in enumerate(pasts):
-            h, present = block(h, 'h%d' % layer, past = past, hparams = hparams)
+            h, present = block(
+                h, 'h%d' % layer, past = past, hparams = hparams,
+                pad_lengths = pad_lengths
+            )
             presents.append(present)
         results['present'] = tf.stack(presents, axis = 1)
         h = norm(h, 'ln_f')
@@ -0,0 +1,181 @@
+"""
+
+@file  : sample_GPT2.py
+
+@author: xiaolu
+
+@time  : 2026-10-17
+
+"""
+import time
+import numpy as np
+import tensorflow as tf
+import model_GPT2
+
+
+def left_pad(prompts, pad_id=0):
+    '''
+    把长短不一的prompt左补齐, 这样每一行最后一个词都对齐在同一列, 可以一起往后生成
+    :param prompts: list of id list
+    :param pad_id:
+    :return: context [batch, maxlen], pad_lengths [batch] 每行补齐的个数
+    '''
+    lengths = np.array([len(prompt) for prompt in prompts])
+    maxlen = lengths.max()
+    context = np.full((len(prompts), maxlen), pad_id, dtype=np.int32)
+    for i, prompt in enumerate(prompts):
+        context[i, maxlen - len(prompt):] = prompt
+    return context, (maxlen - lengths).astype(np.int32)
+
+
+def top_k_logits(logits, k):
+    # 只在概率最大的k个词里采样  k=0表示不截断
+    if k == 0:
+        return logits
+    values, _ = tf.nn.top_k(logits, k=k)
+    min_values = values[:, -1, tf.newaxis]
+    return tf.where(logits < min_values, tf.ones_like(logits) * -1e10, logits)
+
+
+def top_p_logits(logits, p):
+    # nucleus采样: 只保留累计概率刚好达到p的最小词集合  p=1表示不截断
+    if p >= 1.0:
+        return logits
+    sorted_logits = tf.sort(logits, direction='DESCENDING', axis=-1)
+    cumulative_probs = tf.cumsum(tf.nn.softmax(sorted_logits, axis=-1), axis=-1)
+    indices = tf.stack([
+        tf.range(tf.shape(logits)[0]),
+        tf.maximum(tf.reduce_sum(tf.cast(cumulative_probs <= p, tf.int32), axis=-1) - 1, 0),
+    ], axis=-1)
+    min_values = tf.gather_nd(sorted_logits, indices)
+    return tf.where(logits < min_values[:, tf.newaxis], tf.ones_like(logits) * -1e10, logits)
+
+
+def step(hparams, tokens, past=None, pad_lengths=None, scope='model'):
+    # 跑一步模型  返回logits和这一步新增的present(K/V缓存)
+    lm_output = model_GPT2.model(hparams, tokens, past=past, scope=scope, reuse=tf.AUTO_REUSE,
+                                 pad_lengths=pad_lengths)
+    presents = lm_output['present']
+    presents.set_shape(model_GPT2.past_shape(hparams=hparams))
+    return lm_output['logits'], presents
+
+
+def sample_sequence(hparams, length, context, pad_lengths=None, temperature=1.0, top_k=0, top_p=1.0,
+                    scope='model'):
+    '''
+    自回归采样  prompt只完整地算一次, 之后每一步只把上一步生成的词和缓存的past送进模型
+    :param length: 生成多少个词
+    :param context: [batch, T] 左补齐后的prompt
+    :param pad_lengths: [batch] 每行左补齐的个数, None表示没有补齐
+    :param temperature:
+    :param top_k:
+    :param top_p:
+    :return: [batch, T + length]
+    '''
+    with tf.name_scope('sample_sequence'):
+        _, context_past = step(hparams, context[:, :-1], pad_lengths=pad_lengths, scope=scope)
+
+        def body(past, prev, output):
+            logits, presents = step(hparams, prev[:, tf.newaxis], past=past, pad_lengths=pad_lengths, scope=scope)
+            logits = logits[:, -1, :] / temperature
+            logits = top_p_logits(top_k_logits(logits, top_k), top_p)
+            samples = tf.multinomial(logits, num_samples=1, output_dtype=tf.int32)
+            return [tf.concat([past, presents], axis=-2), samples[:, 0], tf.concat([output, samples], axis=1)]
+
+        _, _, tokens = tf.while_loop(
+            cond=lambda *args: True,
+            body=body,
+            maximum_iterations=length,
+            loop_vars=[context_past, context[:, -1], context],
+            shape_invariants=[tf.TensorShape(model_GPT2.past_shape(hparams=hparams)),
+                              tf.TensorShape([None]),
+                              tf.TensorShape([None, None])],
+            back_prop=False)
+        return tokens
+
+
+def beam_search(hparams, length, context, beam_width=4, pad_lengths=None, end_token=None, scope='model'):
+    '''
+    批量的beam search  每个prompt展开成beam_width行, 和采样一样复用past
+    :param length: 最多生成多少个词
+    :param context: [batch, T] 左补齐后的prompt
+    :param beam_width:
+    :param pad_lengths: [batch] 每行左补齐的个数, None表示没有补齐
+    :param end_token: 结束标志  所有beam都结束后提前停止
+    :return: tokens [batch, beam_width, T + n] 按分数从高到低排列, scores [batch, beam_width] 对数概率之和
+    '''
+    with tf.name_scope('beam_search'):
+        batch = tf.shape(context)[0]
+        n_vocab = hparams.n_vocab
+
+        # prompt对所有beam都一样  只算一次再复制
+        _, context_past = step(hparams, context[:, :-1], pad_lengths=pad_lengths, scope=scope)
+        beam_rows = tf.reshape(tf.tile(tf.range(batch)[:, tf.newaxis], [1, beam_width]), [-1])
+        beam_pad_lengths = tf.gather(pad_lengths, beam_rows) if pad_lengths is not None else None
+
+        # 一开始所有beam都一样  只让第0个beam参与选择, 否则会选出beam_width个相同的结果
+        scores = tf.tile(tf.constant([[0.0] + [-1e9] * (beam_width - 1)]), [batch, 1])
+        finished = tf.zeros([batch, beam_width], dtype=tf.bool)
+
+        def cond(past, tokens, scores, finished):
+            return tf.logical_not(tf.reduce_all(finished))
+
+        def body(past, tokens, scores, finished):
+            logits, presents = step(hparams, tokens[:, -1:], past=past, pad_lengths=beam_pad_lengths, scope=scope)
+            log_probs = tf.reshape(tf.nn.log_softmax(logits[:, -1, :]), [batch, beam_width, n_vocab])
+            if end_token is not None:
+                # 已经结束的beam只能继续输出end_token, 分数不再变化
+                done = tf.to_float(finished)[:, :, tf.newaxis]
+                end_only = tf.one_hot(end_token, n_vocab, on_value=0.0, off_value=-1e9)
+                log_probs = log_probs * (1.0 - done) + end_only * done
+
+            total = scores[:, :, tf.newaxis] + log_probs
+            scores, flat_ids = tf.nn.top_k(tf.reshape(total, [batch, beam_width * n_vocab]), k=beam_width)
+            beam_ids = flat_ids // n_vocab
+            word_ids = flat_ids % n_vocab
+
+            # 从各自来源的beam中取出缓存和序列
+            source = tf.reshape(beam_ids + tf.range(batch)[:, tf.newaxis] * beam_width, [-1])
+            past = tf.gather(tf.concat([past, presents], axis=-2), source)
+            tokens = tf.concat([tf.gather(tokens, source), tf.reshape(word_ids, [-1, 1])], axis=1)
+            finished = tf.reshape(tf.gather(tf.reshape(finished, [-1]), source), [batch, beam_width])
+            if end_token is not None:
+                finished = tf.logical_or(finished, tf.equal(word_ids, end_token))
+            return past, tokens, scores, finished
+
+        _, tokens, scores, _ = tf.while_loop(
+            cond=cond,
+            body=body,
+            maximum_iterations=length,
+            loop_vars=[tf.gather(context_past, beam_rows), tf.gather(context, beam_rows), scores, finished],
+            shape_invariants=[tf.TensorShape(model_GPT2.past_shape(hparams=hparams)),
+                              tf.TensorShape([None, None]),
+                              tf.TensorShape([None, beam_width]),
+                              tf.TensorShape([None, beam_width])],
+            back_prop=False)
+        return tf.reshape(tokens, [batch, beam_width, -1]), scores
+
+
+if __name__ == '__main__':
+    # 随机初始化的小模型  看每个词的生成耗时是否随prompt变长而保持平稳
+    from tensorflow.contrib.training import HParams
+
+    params = HParams(n_vocab=1000, n_ctx=1024, n_embd=256, n_head=8, n_layer=8)
+    context = tf.placeholder(tf.int32, [None, None])
+    pad_lengths = tf.placeholder(tf.int32, [None])
+    length = 64
+    sampled = sample_sequence(params, length, context, pad_lengths=pad_lengths, top_k=40, top_p=0.9)
+    beams, beam_scores = beam_search(params, length, context, beam_width=4, pad_lengths=pad_lengths)
+
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    for prompt_len in [16, 64, 256, 512]:
+        prompts = [list(np.random.randint(1, params.n_vocab, np.random.randint(prompt_len // 2, prompt_len + 1)))
+                   for _ in range(8)]
+        batch_context, batch_pad = left_pad(prompts)
+        feed = {context: batch_context, pad_lengths: batch_pad}
+        for name, fetch in [('sample', sampled), ('beam', beams)]:
+            sess.run(fetch, feed_dict=feed)   # 预热
+            start = time.time()
+            sess.run(fetch, feed_dict=feed)
+            print('prompt_len: %d, %s: %.2f ms/token' % (prompt_len, name, (time.time() - start) * 1000 / length))
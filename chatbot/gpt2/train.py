@@ -10,13 +10,15 @@
 import numpy as np
 import tensorflow as tf
 from sklearn.utils import shuffle
-import re
 import time
 import collections
 import os
 import json
+import sys
 from tensorflow.contrib.training import HParams
 import model_GPT2
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common.cleaning import clean_text, clean_corpus
 
 
 class Chatbot:
@@ -132,37 +134,6 @@ def build_dataset(words, n_words, atleast=1):
     return data, count, dictionary, reversed_dictionary
 
 
-def clean_text(text):
-    '''
-    清洗语料
-    :param text: 语料
-    :return:
-    '''
-    text = text.lower()
-    text = re.sub(r"i'm", "i am", text)
-    text = re.sub(r"he's", "he is", text)
-    text = re.sub(r"she's", "she is", text)
-    text = re.sub(r"it's", "it is", text)
-    text = re.sub(r"that's", "that is", text)
-    text = re.sub(r"what's", "that is", text)
-    text = re.sub(r"where's", "where is", text)
-    text = re.sub(r"how's", "how is", text)
-    text = re.sub(r"\'ll", " will", text)
-    text = re.sub(r"\'ve", " have", text)
-    text = re.sub(r"\'re", " are", text)
-    text = re.sub(r"\'d", " would", text)
-    text = re.sub(r"\'re", " are", text)
-    text = re.sub(r"won't", "will not", text)
-    text = re.sub(r"can't", "cannot", text)
-    text = re.sub(r"n't", " not", text)
-    text = re.sub(r"n'", "ng", text)
-    text = re.sub(r"'bout", "about", text)
-    text = re.sub(r"'til", "until", text)
-    text = re.sub(r"[-()\"#/@;:<>{}`+=~|.!?,]", "", text)
-    return ' '.join([i.strip() for i in filter(None, text.split())])
-
-
-
 def str_idx(corpus, dic):
     '''
     将句子转为对应的id序列
@@ -232,13 +203,8 @@ if __name__ == '__main__':
             answers.append(id2line[conv[i + 1]])
 
     # 3. 对语料进行简单清洗
-    clean_questions = []
-    for question in questions:
-        clean_questions.append(clean_text(question))
-
-    clean_answers = []
-    for answer in answers:
-        clean_answers.append(clean_text(answer))
+    clean_questions = clean_corpus(questions, clean_text, processes=os.cpu_count())
+    clean_answers = clean_corpus(answers, clean_text, processes=os.cpu_count())
 
     # 4. 只是为了看实验结果　　我们这里只选取超级短的句子
     min_line_length = 2
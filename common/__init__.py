@@ -0,0 +1,11 @@
+"""
+
+@file   : __init__.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+多个目录的脚本共用的小工具  脚本中先把项目根目录加入sys.path再导入
+
+"""
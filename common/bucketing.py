@@ -0,0 +1,82 @@
+"""
+
+@file   : bucketing.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+"""
+import numpy as np
+
+
+def gather(corpus, batch_ids):
+    # 按采样器给出的下标取出一批样本 (str_idx的输出是list of list)
+    return [corpus[i] for i in batch_ids]
+
+
+def padding_waste(lengths, batches):
+    """
+    补齐带来的浪费: 补齐的位置数 / 批次中所有位置数
+    :param lengths: [n_samples, n_corpora]  每个语料(如问题、回答)各自补齐到本批最长
+    :param batches: list of index arrays
+    """
+    total, padded = 0, 0
+    for batch_ids in batches:
+        batch_lengths = lengths[batch_ids]
+        cells = len(batch_ids) * batch_lengths.max(axis=0)
+        total += cells.sum()
+        padded += (cells - batch_lengths.sum(axis=0)).sum()
+    return float(padded / total) if total else 0.0
+
+
+class BucketSampler(object):
+    def __init__(self, *corpora, batch_size=32, bucket_size=100, shuffle=True, seed=None):
+        """
+        按长度分桶的批次采样器  长度相近的样本放到同一批次, 减少pad_sentence_batch补齐的位置
+        先整体打乱, 每 batch_size * bucket_size 个样本为一个桶, 桶内按长度排序后切成批次, 最后再打乱所有批次
+        :param corpora: 一个或多个str_idx的输出 (如 X, Y), 先按第一个的长度排序, 长度相同再看下一个
+        :param batch_size: 每批的样本数
+        :param bucket_size: 每个桶包含多少个批次  越大补齐越少, 但批次之间越不随机
+        :param shuffle: 每个epoch是否打乱 (桶内和桶间)
+        :param seed: 随机种子
+        """
+        if len(set(len(corpus) for corpus in corpora)) != 1:
+            raise ValueError('All corpora must have the same number of samples')
+        self.lengths = np.stack([np.fromiter(map(len, corpus), dtype=np.int64, count=len(corpus))
+                                 for corpus in corpora], axis=1)
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.random = np.random.RandomState(seed)
+
+    def __len__(self):
+        return int(np.ceil(len(self.lengths) / self.batch_size))
+
+    def batches(self):
+        # 生成一个epoch的所有批次
+        indices = np.arange(len(self.lengths))
+        if self.shuffle:
+            self.random.shuffle(indices)
+
+        batches = []
+        step = self.batch_size * self.bucket_size
+        for start in range(0, len(indices), step):
+            bucket = indices[start: start + step]
+            # lexsort以最后一个key为主  所以把第一个语料的长度放在最后
+            order = bucket[np.lexsort(self.lengths[bucket].T[::-1])]
+            batches.extend(order[i: i + self.batch_size] for i in range(0, len(order), self.batch_size))
+
+        if self.shuffle:
+            self.random.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        return iter(self.batches())
+
+    def report(self, batches=None):
+        # 分桶前(按文件顺序)和分桶后的补齐浪费比例
+        sequential = [np.arange(i, min(i + self.batch_size, len(self.lengths)))
+                      for i in range(0, len(self.lengths), self.batch_size)]
+        return {'sequential': padding_waste(self.lengths, sequential),
+                'bucketed': padding_waste(self.lengths, batches if batches is not None else self.batches())}
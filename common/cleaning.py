@@ -0,0 +1,148 @@
+"""
+
+@file   : cleaning.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+各脚本里的清洗函数  原来每句话要依次跑十几个re.sub, 这里改成:
+    逐字符的替换/删除合并成一张str.translate的转换表, 一次扫描完成
+    缩写的拆分合并成一个预编译的正则, 一次扫描完成
+    停用词用frozenset, 查找是O(1)
+输出和原来的写法逐字一致 (python common/cleaning.py 会在rt-polarity上核对并计时)
+
+"""
+import re
+from multiprocessing import Pool
+
+
+class CharTable(dict):
+    """
+    str.translate用的转换表  不在keep里的字符统一替换成default (None表示删除)
+    表里查不到的字符 (如中文) 第一次遇到时算一次, 之后直接命中缓存
+    """
+    def __init__(self, keep, mapping=None, default=' '):
+        super(CharTable, self).__init__()
+        self.keep = frozenset(keep)
+        self.default = default
+        for char, value in (mapping or {}).items():
+            self[ord(char)] = value
+
+    def __missing__(self, code):
+        char = chr(code)
+        value = char if char in self.keep else self.default
+        self[code] = value
+        return value
+
+
+ASCII_ALNUM = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+
+# ---- TextCNN data_helpers.clean_str ----
+# [^A-Za-z0-9(),!?\'\`] 变空格, 标点前后加空格 (原写法的替换串是 " \( ", 所以括号前带反斜杠)
+_clean_str_table = CharTable(ASCII_ALNUM + "(),!?'`", {
+    ',': ' , ', '!': ' ! ', '(': r' \( ', ')': r' \) ', '?': r' \? ',
+})
+_clean_str_contractions = re.compile(r"(n't|'(?:s|ve|re|d|ll))")
+
+
+def clean_str(string):
+    string = _clean_str_contractions.sub(r' \1', string.translate(_clean_str_table))
+    return ' '.join(string.split()).lower()
+
+
+# ---- gpt2 train.clean_text ----
+# 都是字面替换, 用str.replace代替re.sub; 规则有先后 (后面的规则会作用在前面替换的结果上, 如 n'what's -> n'that is -> nothat is),
+# 合并成一个正则会改变结果, 所以保持顺序, 只在句子里有撇号时才逐条替换
+_clean_text_replacements = [
+    ("i'm", "i am"), ("he's", "he is"), ("she's", "she is"), ("it's", "it is"), ("that's", "that is"),
+    ("what's", "that is"), ("where's", "where is"), ("how's", "how is"),
+    ("'ll", " will"), ("'ve", " have"), ("'re", " are"), ("'d", " would"),
+    ("won't", "will not"), ("can't", "cannot"), ("n't", " not"), ("n'", "ng"), ("'bout", "about"), ("'til", "until"),
+]
+_clean_text_table = str.maketrans('', '', '-()"#/@;:<>{}`+=~|.!?,')
+
+
+def clean_text(text):
+    text = text.lower()
+    if "'" in text:
+        for old, new in _clean_text_replacements:
+            text = text.replace(old, new)
+    return ' '.join(text.translate(_clean_text_table).split())
+
+
+# ---- utils.clearstring ----
+_clearstring_table = CharTable(ASCII_ALNUM + ' ', default=None)
+
+
+def clearstring(string, stopwords=frozenset()):
+    # 只保留字母数字和空格, 去停用词 (大小写敏感, 和原写法一样在lower之前判断)
+    return ' '.join([word for word in string.translate(_clearstring_table).split()
+                     if word not in stopwords]).lower()
+
+
+def clean_corpus(texts, fn, processes=None, chunksize=20000):
+    """
+    清洗整份语料
+    :param texts: list of str
+    :param fn: 清洗函数, 要能被pickle (模块级函数或functools.partial)
+    :param processes: 进程数  None/1表示在当前进程里做
+    :param chunksize: 每个进程一次拿多少句
+    """
+    if not processes or processes <= 1 or len(texts) <= chunksize:
+        return list(map(fn, texts))
+    with Pool(processes) as pool:
+        return pool.map(fn, texts, chunksize=chunksize)
+
+
+def legacy_clean_str(string):
+    # TextCNN原来的写法  只用于下面的对比
+    for pattern, repl in [(r"[^A-Za-z0-9(),!?\'\`]", " "), (r"\'s", " \'s"), (r"\'ve", " \'ve"), (r"n\'t", " n\'t"),
+                          (r"\'re", " \'re"), (r"\'d", " \'d"), (r"\'ll", " \'ll"), (r",", " , "), (r"!", " ! "),
+                          (r"\(", " \( "), (r"\)", " \) "), (r"\?", " \? "), (r"\s{2,}", " ")]:
+        string = re.sub(pattern, repl, string)
+    return string.strip().lower()
+
+
+def legacy_clean_text(text):
+    # gpt2原来的写法  只用于下面的对比
+    text = text.lower()
+    for old, new in _clean_text_replacements:
+        text = re.sub(old, new, text)
+    text = re.sub(r"[-()\"#/@;:<>{}`+=~|.!?,]", "", text)
+    return ' '.join([i.strip() for i in filter(None, text.split())])
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare the single-pass cleaners with the chained re.sub versions')
+    parser.add_argument('--rt_polarity', default='Text classification/ResNet/data/rt-polarity',
+                        help='prefix of rt-polarity.pos / rt-polarity.neg')
+    parser.add_argument('--repeat', type=int, default=26, help='repeat the corpus to about the size of LN_LSTM data')
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    corpus = []
+    for suffix in ['.pos', '.neg']:
+        with open(args.rt_polarity + suffix, encoding='utf8', errors='ignore') as f:
+            corpus.extend(line.strip() for line in f)
+
+    for name, legacy, fast in [('clean_str', legacy_clean_str, clean_str), ('clean_text', legacy_clean_text, clean_text)]:
+        start = time.time()
+        expected = [legacy(line) for line in corpus]
+        legacy_time = time.time() - start
+        start = time.time()
+        result = [fast(line) for line in corpus]
+        fast_time = time.time() - start
+        assert result == expected, name
+        print('{}: {} lines, chained re.sub {:.0f}ms, single pass {:.0f}ms, speedup {:.1f}x'.format(
+            name, len(corpus), legacy_time * 1000, fast_time * 1000, legacy_time / fast_time))
+
+    big = corpus * args.repeat
+    for processes in [1, args.processes]:
+        start = time.time()
+        clean_corpus(big, clean_str, processes=processes)
+        print('clean_corpus: {} lines, {} process(es), {:.0f}ms'.format(len(big), processes,
+                                                                        (time.time() - start) * 1000))
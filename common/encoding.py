@@ -0,0 +1,174 @@
+"""
+
+@file   : encoding.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+把整份语料一次性转成id  代替各个脚本里逐词dic.get、逐个元素写numpy数组的str_idx
+    offsets, ids = encode(corpus, dic)          # CSR格式: 第i句是 ids[offsets[i]: offsets[i + 1]]
+    X = pad(offsets, ids, maxlen)               # 和原来的str_idx一样: 取前maxlen个词, 左边补0
+    X = str_idx(corpus, dic, maxlen)            # 上面两步合在一起
+    X = pad(*take(offsets, ids, index))         # 只取一个batch, 补齐到这个batch里最长的句子
+
+"""
+import collections
+from itertools import chain, repeat
+
+import numpy as np
+
+# 和各处build_dataset一致的保留词
+RESERVED = ('GO', 'PAD', 'EOS', 'UNK')
+
+
+def build_vocab(words, n_words=None, reserved=RESERVED):
+    """
+    按词频建词表  id从0开始连续编号, 保留词排在最前面
+    :param words: 所有词 (如 ' '.join(corpus).split())
+    :param n_words: 除保留词外最多保留多少个词, None表示全部保留
+    :param reserved: 保留词
+    :return: dictionary {词: id}, id2word 长度为词表大小的list
+    """
+    id2word = list(reserved)
+    dictionary = {word: i for i, word in enumerate(id2word)}
+    for word, _ in collections.Counter(words).most_common(n_words):
+        if word not in dictionary:
+            dictionary[word] = len(id2word)
+            id2word.append(word)
+    return dictionary, id2word
+
+
+def encode(corpus, dic, UNK=3, tokenize=str.split):
+    """
+    整份语料转为CSR格式的id
+    :param corpus: list of str  (tokenize=None时为已经分好词的list of list)
+    :param dic: 词典 {词: id}
+    :param UNK: 不在词典里的词的id
+    :param tokenize: 分词函数, 默认按空白切分
+    :return: offsets [n + 1] int64, ids [总词数] int32
+    """
+    sentences = list(map(tokenize, corpus)) if tokenize is not None else corpus
+    lengths = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+    offsets = np.zeros(len(sentences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # 所有词拉平后只查一次字典  map在C层循环, 没有Python层的逐词赋值
+    tokens = list(chain.from_iterable(sentences))
+    ids = np.fromiter(map(dic.get, tokens, repeat(UNK)), dtype=np.int32, count=len(tokens))
+    return offsets, ids
+
+
+def pad(offsets, ids, maxlen=None, padding='pre', truncating='post', value=0):
+    """
+    CSR格式的id补齐成矩阵  一次散射完成, 没有逐句循环
+    :param offsets: encode的输出
+    :param ids: encode的输出
+    :param maxlen: 补齐到的长度, None表示补齐到最长的句子
+    :param padding: 'pre' 左边补齐 (原str_idx的做法), 'post' 右边补齐
+    :param truncating: 'post' 超长时保留前maxlen个词 (原str_idx的做法), 'pre' 保留后maxlen个词
+    :param value: 补齐的id
+    :return: [n, maxlen] int32
+    """
+    lengths = np.diff(offsets)
+    if maxlen is None:
+        maxlen = int(lengths.max()) if len(lengths) else 0
+    kept = np.minimum(lengths, maxlen)
+    X = np.full((len(lengths), maxlen), value, dtype=np.int32)
+
+    rows = np.repeat(np.arange(len(lengths)), kept)
+    # 每个词在本句保留部分中的位置
+    starts = np.cumsum(kept) - kept
+    cols = np.arange(len(rows)) - np.repeat(starts, kept)
+
+    src = offsets[:-1] if truncating == 'post' else offsets[1:] - kept
+    src = np.repeat(src, kept) + cols
+    if padding == 'pre':
+        cols = cols + np.repeat(maxlen - kept, kept)
+    X[rows, cols] = ids[src]
+    return X
+
+
+def take(offsets, ids, index):
+    """
+    取出CSR格式中的若干句, 结果仍是CSR格式
+    :param index: 句子的下标
+    :return: offsets [len(index) + 1], ids
+    """
+    index = np.asarray(index, dtype=np.int64)
+    starts = offsets[index]
+    lengths = offsets[index + 1] - starts
+    sub_offsets = np.zeros(len(index) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=sub_offsets[1:])
+    src = np.repeat(starts - sub_offsets[:-1], lengths) + np.arange(sub_offsets[-1])
+    return sub_offsets, ids[src]
+
+
+def to_lists(offsets, ids):
+    # 转回list of list  给pad_sentence_batch这类按句补齐的代码用
+    if len(offsets) == 1:
+        # 空语料  np.split会返回一个空块
+        return []
+    return [chunk.tolist() for chunk in np.split(ids, offsets[1:-1])]
+
+
+def str_idx(corpus, dic, maxlen, UNK=3):
+    """
+    将语料转为对应的id序列  取每句前maxlen个词, 左边补0
+    :param corpus: 语料
+    :param dic: 词典
+    :param maxlen: 最大长度
+    :param UNK: 未知字符的标记
+    :return: [len(corpus), maxlen] int32
+    """
+    return pad(*encode(corpus, dic, UNK), maxlen=maxlen)
+
+
+def legacy_str_idx(corpus, dic, maxlen, UNK=3):
+    # 各个utils.py里原来的写法 (float64, 逐词dic.get)  只用于下面的对比
+    X = np.zeros((len(corpus), maxlen))
+    for i in range(len(corpus)):
+        for no, k in enumerate(corpus[i].split()[:maxlen][::-1]):
+            X[i, -1 - no] = dic.get(k, UNK)
+    return X
+
+
+def benchmark(corpus, maxlen=50, repeat_times=3):
+    # 在同一份语料上比较原来的str_idx和向量化的str_idx, 结果必须一致
+    import time
+    dic, _ = build_vocab(' '.join(corpus).split())
+    timings = {}
+    for name, fn in [('legacy', legacy_str_idx), ('vectorized', str_idx)]:
+        start = time.time()
+        for _ in range(repeat_times):
+            X = fn(corpus, dic, maxlen)
+        timings[name] = ((time.time() - start) / repeat_times, X)
+    assert np.array_equal(timings['legacy'][1], timings['vectorized'][1])
+    return timings['legacy'][0], timings['vectorized'][0]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare the vectorized str_idx with the per-token loop')
+    parser.add_argument('--rt_polarity', default='Text classification/ResNet/data/rt-polarity',
+                        help='prefix of rt-polarity.pos / rt-polarity.neg')
+    parser.add_argument('--quora', default='Text similarity/data/quora_duplicate_questions.tsv')
+    parser.add_argument('--maxlen', type=int, default=50)
+    args = parser.parse_args()
+
+    corpora = {}
+    with open(args.rt_polarity + '.pos', encoding='utf8', errors='ignore') as fpos, \
+            open(args.rt_polarity + '.neg', encoding='utf8', errors='ignore') as fneg:
+        corpora['rt-polarity'] = [line.strip().lower() for line in fpos] + [line.strip().lower() for line in fneg]
+    try:
+        import pandas as pd
+        df = pd.read_csv(args.quora, delimiter='\t').dropna()
+        corpora['quora'] = [str(text).lower() for text in df['question1'].tolist() + df['question2'].tolist()]
+    except (IOError, ImportError) as e:
+        print('skip quora: {}'.format(e))
+
+    for name, corpus in corpora.items():
+        legacy, vectorized = benchmark(corpus, args.maxlen)
+        print('{}: {} sentences, legacy {:.1f}ms, vectorized {:.1f}ms, speedup {:.1f}x'.format(
+            name, len(corpus), legacy * 1000, vectorized * 1000, legacy / vectorized))
@@ -0,0 +1,104 @@
+"""
+
+@file   : export.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+"""
+import os
+
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+SERVING = tf.saved_model.tag_constants.SERVING
+
+
+def bind_placeholders(graph_def, fixed):
+    """
+    把推理时取值固定的placeholder (如dropout_keep_prob=1.0) 换成常量, 后面常量折叠时能把dropout整个去掉
+    :param graph_def:
+    :param fixed: {placeholder tensor: value}
+    """
+    values = {tensor.op.name: (tensor.dtype, value) for tensor, value in fixed.items()}
+    for node in graph_def.node:
+        if node.name in values and node.op in ('Placeholder', 'PlaceholderWithDefault'):
+            dtype, value = values[node.name]
+            node.op = 'Const'
+            node.ClearField('input')
+            node.attr.clear()
+            node.attr['dtype'].type = dtype.as_datatype_enum
+            node.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(value, dtype=dtype))
+    return graph_def
+
+
+def freeze_graph(sess, inputs, outputs, fixed=None):
+    """
+    从训练的会话中抽出推理需要的子图: 只保留从inputs到outputs的节点 (优化器、TrainingHelper等训练分支都会被去掉),
+    变量转为常量, 再做常量折叠
+    :param sess: 训练脚本里的会话
+    :param inputs: list of input tensors
+    :param outputs: list of output tensors
+    :param fixed: {placeholder tensor: value}  推理时固定取值的placeholder
+    :return: GraphDef
+    """
+    input_names = [tensor.op.name for tensor in inputs]
+    output_names = [tensor.op.name for tensor in outputs]
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), output_names)
+    if fixed:
+        graph_def = bind_placeholders(graph_def, fixed)
+    return TransformGraph(graph_def, input_names, output_names,
+                          ['strip_unused_nodes', 'fold_constants(ignore_errors=true)'])
+
+
+def export_saved_model(sess, export_dir, signatures, fixed=None):
+    """
+    导出只包含推理图的SavedModel, 线上加载时不需要重建训练图, 也不需要导入训练脚本的依赖
+    :param sess: 训练脚本里的会话
+    :param export_dir: 导出目录 (不能已经存在)
+    :param signatures: {签名名: ({输入名: tensor}, {输出名: tensor})}
+        如 {'predicting_ids': ({'X': model.X}, {'predicting_ids': model.predicting_ids})}
+    :param fixed: {placeholder tensor: value}  推理时固定取值的placeholder
+    :return: export_dir
+    """
+    inputs = [tensor for ins, _ in signatures.values() for tensor in ins.values()]
+    outputs = [tensor for _, outs in signatures.values() for tensor in outs.values()]
+    graph_def = freeze_graph(sess, inputs, outputs, fixed=fixed)
+
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        signature_def_map = {
+            name: tf.saved_model.signature_def_utils.predict_signature_def(
+                inputs={key: graph.get_tensor_by_name(tensor.name) for key, tensor in ins.items()},
+                outputs={key: graph.get_tensor_by_name(tensor.name) for key, tensor in outs.items()})
+            for name, (ins, outs) in signatures.items()
+        }
+        with tf.Session(graph=graph) as export_sess:
+            builder = tf.saved_model.builder.SavedModelBuilder(export_dir)
+            builder.add_meta_graph_and_variables(export_sess, [SERVING], signature_def_map=signature_def_map,
+                                                 strip_default_attrs=True)
+            builder.save()
+
+    # 另存一份冻结的GraphDef  方便不用SavedModel的场景
+    tf.train.write_graph(graph_def, export_dir, 'frozen_graph.pb', as_text=False)
+    print('导出推理图到: {}, 共{}个节点'.format(os.path.abspath(export_dir), len(graph_def.node)))
+    return export_dir
+
+
+class ExportedModel:
+    # 加载export_saved_model导出的模型  只依赖tensorflow
+    def __init__(self, export_dir):
+        self.graph = tf.Graph()
+        self.sess = tf.Session(graph=self.graph)
+        meta_graph = tf.saved_model.loader.load(self.sess, [SERVING], export_dir)
+        self.signatures = {}
+        for name, signature in meta_graph.signature_def.items():
+            ins = {key: self.graph.get_tensor_by_name(info.name) for key, info in signature.inputs.items()}
+            outs = {key: self.graph.get_tensor_by_name(info.name) for key, info in signature.outputs.items()}
+            self.signatures[name] = (ins, outs)
+
+    def predict(self, signature, **feeds):
+        # 如 model.predict('tags_seq', word_ids=..., char_ids=...)  返回 {输出名: array}
+        ins, outs = self.signatures[signature]
+        return self.sess.run(outs, feed_dict={ins[key]: value for key, value in feeds.items()})
@@ -0,0 +1,55 @@
+"""
+
+@file   : prefetch.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+后台线程预取  训练循环每次从队列里直接取, 不用等读盘、解码、补齐
+    for batch in prefetch(data.iter_batches(batch_size), n_prefetch=8):
+        ...
+    iterable在后台线程里跑, 里面抛的异常在取的时候重新抛出; 提前break时后台线程也会结束
+
+"""
+import queue
+import threading
+
+
+def prefetch(iterable, n_prefetch=8):
+    '''
+    :param iterable: 任意可迭代对象 (如生成batch的生成器)
+    :param n_prefetch: 队列里最多放几个元素
+    '''
+    items = queue.Queue(maxsize=n_prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put(item)
+            items.put(done)
+        except Exception as e:
+            items.put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # 提前退出时让后台线程结束
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                thread.join(0.01)
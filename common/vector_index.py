@@ -0,0 +1,230 @@
+"""
+
+@file   : vector_index.py
+
+@author : xiaolu
+
+@time1  : 2026-10-17
+
+句向量的批量编码和近邻查询
+    encode_corpus: 按大batch调用编码器, 结果直接写进float32的memmap (.npy), 语料再大也不用全部放进内存
+    VectorIndex: 可以随时add新向量的倒排索引 (IVF)
+        向量数少于train_size时是分块的精确计算; 够了以后用k-means分桶, 查询只看最近的nprobe个桶, 桶内精确计算
+        之后add的向量直接分到最近的桶, 不需要重建
+    距离 metric:
+        'contrastive': 相似度模型里的 |a - b| / (|a| + |b|)
+        'cosine': 1 - cos(a, b)
+
+"""
+import json
+
+import numpy as np
+
+
+def encode_corpus(encode_fn, inputs, path, batch_size=4096):
+    """
+    :param encode_fn: [batch, maxlen] -> [batch, dim]  如 lambda x: sess.run(model.output_right, {model.X_right: x})
+    :param inputs: 编码器的输入 (如str_idx的输出)
+    :param path: 输出的 .npy
+    :param batch_size: 推理的batch大小  训练时的batch一般太小
+    :return: memmap [n, dim]
+    """
+    vectors = None
+    for i in range(0, len(inputs), batch_size):
+        batch = np.asarray(encode_fn(np.asarray(inputs[i: i + batch_size])), dtype=np.float32)
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(inputs), batch.shape[1]))
+        vectors[i: i + len(batch)] = batch
+    vectors.flush()
+    return np.load(path, mmap_mode='r')
+
+
+def distances(queries, vectors, metric='contrastive'):
+    """
+    :param queries: [q, dim]
+    :param vectors: [n, dim]
+    :return: [q, n]
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    q_norms = np.linalg.norm(queries, axis=1)[:, None]
+    v_norms = np.linalg.norm(vectors, axis=1)[None, :]
+    dots = queries @ vectors.T
+    if metric == 'cosine':
+        return 1 - dots / np.maximum(q_norms * v_norms, 1e-8)
+    if metric == 'contrastive':
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+        squared = np.maximum(q_norms ** 2 + v_norms ** 2 - 2 * dots, 0)
+        return np.sqrt(squared) / np.maximum(q_norms + v_norms, 1e-8)
+    raise ValueError('unknown metric: %s' % metric)
+
+
+def kmeans(x, k, iterations=20, rng=None):
+    # Lloyd k-means
+    rng = rng or np.random.RandomState(0)
+    centroids = x[rng.choice(len(x), min(k, len(x)), replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest(x, centroids)
+        counts = np.bincount(assignment, minlength=len(centroids))
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, x)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+    return centroids
+
+
+def nearest(x, centroids, batch_size=65536):
+    # 每个点最近的中心 (欧氏距离)
+    sq_norms = (centroids ** 2).sum(1)
+    return np.concatenate([np.argmin(sq_norms - 2 * x[i: i + batch_size] @ centroids.T, axis=1)
+                           for i in range(0, len(x), batch_size)]) if len(x) else np.zeros(0, dtype=np.int64)
+
+
+def _topk(d, k):
+    # 每行最小的k个 (按距离排好序)
+    k = min(k, d.shape[1])
+    part = np.argpartition(d, k - 1, axis=1)[:, :k] if k < d.shape[1] else np.tile(np.arange(d.shape[1]), (len(d), 1))
+    order = np.argsort(np.take_along_axis(d, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex(object):
+    def __init__(self, dim, metric='contrastive', n_lists=None, train_size=20000, nprobe=8, seed=0):
+        """
+        :param dim: 向量维度
+        :param metric: 'contrastive' 或 'cosine'
+        :param n_lists: 桶的个数  默认 4 * sqrt(train_size)
+        :param train_size: 向量数达到这么多时训练k-means分桶
+        :param nprobe: 查询时看最近的几个桶
+        """
+        self.dim = dim
+        self.metric = metric
+        self.n_lists = n_lists or max(1, int(4 * np.sqrt(train_size)))
+        self.train_size = train_size
+        self.nprobe = nprobe
+        self.rng = np.random.RandomState(seed)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.centroids = None
+        self.lists = None
+
+    def __len__(self):
+        return self.size
+
+    def _append(self, vectors):
+        # 容量不够时翻倍, add的均摊开销是O(1)
+        if self.size + len(vectors) > len(self.vectors):
+            capacity = max(2 * len(self.vectors), self.size + len(vectors), 1024)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size: self.size + len(vectors)] = vectors
+        self.size += len(vectors)
+
+    def _key(self, vectors):
+        # 分桶用的向量  余弦距离下先归一化
+        if self.metric == 'cosine':
+            return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-8)
+        return vectors
+
+    def _assign(self, ids):
+        lists = nearest(self._key(self.vectors[ids]), self.centroids)
+        for l in np.unique(lists):
+            self.lists[l].append(ids[lists == l])
+
+    def train(self):
+        sample = self.rng.choice(self.size, min(self.size, self.train_size), replace=False)
+        self.centroids = kmeans(self._key(self.vectors[sample]), self.n_lists, rng=self.rng)
+        self.lists = [[] for _ in range(len(self.centroids))]
+        self._assign(np.arange(self.size))
+
+    def add(self, vectors):
+        """
+        :param vectors: [n, dim]
+        :return: 新向量的id (从0开始按插入顺序编号)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.arange(self.size, self.size + len(vectors))
+        self._append(vectors)
+        if self.centroids is not None:
+            self._assign(ids)
+        elif self.size >= self.train_size:
+            self.train()
+        return ids
+
+    def _list_ids(self, l):
+        # 桶里的id是一段段add进来的, 查询时才合并
+        if len(self.lists[l]) > 1:
+            self.lists[l] = [np.concatenate(self.lists[l])]
+        return self.lists[l][0] if self.lists[l] else np.zeros(0, dtype=np.int64)
+
+    def search(self, queries, k=10, nprobe=None, batch_size=1024):
+        """
+        :param queries: [q, dim]
+        :return: ids [q, k], distances [q, k]  不足k个时 id为-1, 距离为inf
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        dists = np.full((len(queries), k), np.inf, dtype=np.float32)
+        if self.centroids is None:
+            # 精确计算  对库按块算, 每块的前k个和当前结果合并
+            for i in range(0, self.size, 65536):
+                block = self.vectors[i: min(i + 65536, self.size)]
+                for j in range(0, len(queries), batch_size):
+                    d = distances(queries[j: j + batch_size], block, self.metric)
+                    top = _topk(d, k)
+                    merged_ids = np.concatenate([ids[j: j + batch_size], top + i], axis=1)
+                    merged = np.concatenate([dists[j: j + batch_size], np.take_along_axis(d, top, axis=1)], axis=1)
+                    best = _topk(merged, k)
+                    ids[j: j + batch_size] = np.take_along_axis(merged_ids, best, axis=1)
+                    dists[j: j + batch_size] = np.take_along_axis(merged, best, axis=1)
+            return ids, dists
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probe = _topk(-(self._key(queries) @ self.centroids.T) * 2 + (self.centroids ** 2).sum(1), nprobe)
+        for n, query in enumerate(queries):
+            candidates = np.concatenate([self._list_ids(l) for l in probe[n]])
+            if not len(candidates):
+                continue
+            d = distances(query[None], self.vectors[candidates], self.metric)
+            top = _topk(d, k)[0]
+            ids[n, :len(top)] = candidates[top]
+            dists[n, :len(top)] = d[0, top]
+        return ids, dists
+
+    def save(self, path):
+        # path.npy 向量, path.json 配置和分桶
+        np.save(path + '.npy', self.vectors[:self.size])
+        state = {'dim': self.dim, 'metric': self.metric, 'n_lists': self.n_lists, 'train_size': self.train_size,
+                 'nprobe': self.nprobe}
+        if self.centroids is not None:
+            np.savez(path + '.ivf.npz', centroids=self.centroids,
+                     assignment=self._assignment())
+        with open(path + '.json', 'w') as f:
+            json.dump(state, f)
+        return path
+
+    def _assignment(self):
+        assignment = np.zeros(self.size, dtype=np.int64)
+        for l in range(len(self.lists)):
+            assignment[self._list_ids(l)] = l
+        return assignment
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path + '.json') as f:
+            state = json.load(f)
+        index = cls(state['dim'], state['metric'], state['n_lists'], state['train_size'], state['nprobe'])
+        # memmap是只读的, 之后add时_append会拷贝到新的数组
+        index.vectors = np.load(path + '.npy', mmap_mode='r' if mmap else None)
+        index.size = len(index.vectors)
+        try:
+            arrays = np.load(path + '.ivf.npz')
+        except IOError:
+            return index
+        index.centroids = arrays['centroids']
+        assignment = arrays['assignment']
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(len(index.centroids) + 1))
+        index.lists = [[order[bounds[l]: bounds[l + 1]]] for l in range(len(index.centroids))]
+        return index